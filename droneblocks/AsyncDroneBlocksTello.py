@@ -0,0 +1,275 @@
+import asyncio
+import collections
+from djitellopy import Tello
+from droneblocks.DroneBlocksTello import TELLO_IGNORE_RESPONSES
+from droneblocks.tello_response_demux import STALE_REPLY_GRACE, expected_reply_shape, reply_matches
+
+LOGGER = Tello.LOGGER
+
+
+class _Waiter:
+    __slots__ = ('future', 'command', 'shape', 'stale_until')
+
+    def __init__(self, future: asyncio.Future, command: str):
+        self.future = future
+        self.command = command
+        self.shape = expected_reply_shape(command)
+        # set when the command timed out or was cancelled, see STALE_REPLY_GRACE
+        self.stale_until = None
+
+
+class _TelloCommandProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol that hands every Tello response to the oldest
+    command still waiting for one.  The Tello answers commands in the
+    order they were received, so a FIFO of waiters is enough to keep many
+    commands in flight on one socket.
+
+    Like TelloResponseDemux, a command that timed out stays in line for
+    STALE_REPLY_GRACE seconds so its late reply is discarded instead of
+    answering the next command, and a response that clearly has the shape
+    of the answer to a different kind of command is not handed to a waiter.
+    """
+
+    def __init__(self, host: str, stale_reply_grace: float = STALE_REPLY_GRACE):
+        self.host = host
+        self.transport = None
+        self.ignore_responses = tuple(r.encode('utf-8') for r in TELLO_IGNORE_RESPONSES)
+        self.stale_reply_grace = stale_reply_grace
+        self.waiters = collections.deque()
+
+        self.filtered_count = 0
+        self.stale_count = 0
+        self.mismatched_count = 0
+        self.unsolicited_count = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def abandon(self, waiter: _Waiter):
+        """
+        Keep a command that is no longer waited for in line, so its late reply is discarded.
+        """
+        waiter.stale_until = asyncio.get_running_loop().time() + self.stale_reply_grace
+
+    def datagram_received(self, data, addr):
+        if addr[0] != self.host:
+            return
+
+        # same filtering as TelloResponseDemux.append, on the stripped bytes
+        raw = data.rstrip(b'\r\n')
+        if raw in self.ignore_responses:
+            self.filtered_count += 1
+            return
+
+        try:
+            response = raw.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            LOGGER.error(exc)
+            response = "response decode error"
+
+        now = asyncio.get_running_loop().time()
+        while self.waiters:
+            head = self.waiters[0]
+            if head.stale_until is not None:
+                self.waiters.popleft()
+                if now >= head.stale_until:
+                    # gave up waiting for the late reply
+                    continue
+                retried = self.waiters and self.waiters[0].command == head.command
+                # a retry of the same command is happy with either reply
+                if not retried and reply_matches(head.shape, raw):
+                    self.stale_count += 1
+                    LOGGER.debug(f"Dropping late response to '{head.command}': {response}")
+                    return
+                # otherwise assume the late reply was lost and
+                # offer the response to the next command
+                continue
+
+            if not reply_matches(head.shape, raw):
+                self.mismatched_count += 1
+                LOGGER.warning(f"Dropping response '{response}' that does not answer '{head.command}'")
+                return
+
+            self.waiters.popleft()
+            head.future.set_result(response)
+            return
+
+        self.unsolicited_count += 1
+        LOGGER.debug(f"Dropping unsolicited response: {response}")
+
+    def get_stats(self) -> dict:
+        return {
+            'filtered': self.filtered_count,
+            'stale': self.stale_count,
+            'mismatched': self.mismatched_count,
+            'unsolicited': self.unsolicited_count,
+            'outstanding': len(self.waiters)
+        }
+
+    def error_received(self, exc):
+        LOGGER.error(f"Tello command socket error: {exc}")
+
+    def connection_lost(self, exc):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.future.done():
+                waiter.future.set_exception(ConnectionError(f"Tello command socket closed: {exc}"))
+
+
+class AsyncDroneBlocksTello:
+    """
+    asyncio version of the DroneBlocksTello command channel.
+
+    Commands are sent from a single asyncio datagram endpoint and every
+    caller awaits its own response, so one event loop can keep many commands
+    and queries in flight without a thread per caller and without holding
+    a lock for the full round trip.
+
+    Example:
+        async with AsyncDroneBlocksTello() as tello:
+            sdk, tof = await asyncio.gather(tello.send_read_command('sdk?'),
+                                            tello.send_expansion_command('tof?'))
+    """
+    RESPONSE_TIMEOUT = Tello.RESPONSE_TIMEOUT
+    TAKEOFF_TIMEOUT = Tello.TAKEOFF_TIMEOUT
+    TIME_BTW_COMMANDS = Tello.TIME_BTW_COMMANDS
+    RETRY_COUNT = Tello.RETRY_COUNT
+
+    def __init__(self, host: str = Tello.TELLO_IP, port: int = Tello.CONTROL_UDP_PORT, local_port: int = 0,
+                 retry_count: int = RETRY_COUNT, ignore_tello_talent_methods: bool = False):
+        """
+
+        :param host: IP address of the Tello
+        :param port: Tello command port
+        :param local_port: Local UDP port to send from.  The Tello answers to the port the command came from,
+                           so the default of 0 (any free port) does not collide with a DroneBlocksTello
+                           in the same process, which binds the Tello command port.
+        :param retry_count: Number of attempts for control commands
+        :param ignore_tello_talent_methods: When True, expansion commands are not sent
+        """
+        self.address = (host, port)
+        self.local_port = local_port
+        self.retry_count = retry_count
+        self.ignore_tello_talent_methods = ignore_tello_talent_methods
+        self.transport = None
+        self.protocol = None
+        self._send_lock = None
+        self._last_send_time = 0
+
+    async def open(self):
+        """Create the datagram endpoint.  Called by connect() if needed."""
+        if self.transport is not None:
+            return
+
+        loop = asyncio.get_running_loop()
+        self.transport, self.protocol = await loop.create_datagram_endpoint(
+            lambda: _TelloCommandProtocol(self.address[0]),
+            local_addr=('0.0.0.0', self.local_port))
+        self._send_lock = asyncio.Lock()
+
+    def get_response_stats(self) -> dict:
+        """
+        :return: counts of responses that were not handed to a command, see _TelloCommandProtocol
+        """
+        return self.protocol.get_stats() if self.protocol is not None else {}
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+            self.protocol = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def connect(self):
+        """Enter SDK mode. Call this before any of the control functions.
+        """
+        await self.open()
+        await self.send_command("command")
+
+    async def send_command_with_return(self, command: str, timeout: float = RESPONSE_TIMEOUT) -> str:
+        """Send command to Tello and wait for its response.
+        Return:
+            str: str with response text, or an 'Aborting command' message when no response arrived in time.
+        """
+        if self.transport is None:
+            await self.open()
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop.create_future(), command)
+        # close() can drop self.protocol while the command is in flight
+        protocol = self.protocol
+
+        # only the send is serialized, the wait for the response is not.
+        # Commands very close together make the drone not respond to them,
+        # so keep TIME_BTW_COMMANDS between sends.
+        async with self._send_lock:
+            wait_time = self.TIME_BTW_COMMANDS - (loop.time() - self._last_send_time)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+
+            LOGGER.info(f"Send command: '{command}'")
+            # register the waiter and send without yielding in between so the
+            # order of the waiters matches the order the Tello sees
+            protocol.waiters.append(waiter)
+            self.transport.sendto(command.encode('utf-8'), self.address)
+            self._last_send_time = loop.time()
+
+        try:
+            response = await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            protocol.abandon(waiter)
+            message = f"Aborting command '{command}'. Did not receive a response after {timeout} seconds"
+            LOGGER.warning(message)
+            return message
+        except asyncio.CancelledError:
+            protocol.abandon(waiter)
+            raise
+
+        LOGGER.info(f"Response {command}: '{response}'")
+        return response
+
+    async def send_command(self, command: str, timeout: float = RESPONSE_TIMEOUT) -> bool:
+        """Send control command to Tello and wait for an 'ok' response,
+        retrying up to retry_count times.
+        """
+        response = "max retries exceeded"
+        for i in range(0, self.retry_count):
+            response = await self.send_command_with_return(command, timeout=timeout)
+
+            if 'ok' in response.lower():
+                return True
+
+            LOGGER.debug(f"Command attempt #{i} failed for command: '{command}'")
+
+        self.raise_result_error(command, response)
+        return False  # never reached
+
+    async def send_read_command(self, command: str, timeout: float = RESPONSE_TIMEOUT) -> str:
+        """Send given command to Tello and wait for its response.
+        """
+        response = await self.send_command_with_return(command, timeout=timeout)
+
+        if any(word in response for word in ('error', 'ERROR', 'False')):
+            self.raise_result_error(command, response)
+
+        return response
+
+    async def send_expansion_command(self, expansion_cmd: str, timeout: float = RESPONSE_TIMEOUT):
+        """Sends a command to the ESP32 expansion board connected to a Tello Talent
+        and returns the response, e.g. 'tof 345' for 'tof?'.
+        """
+        if self.ignore_tello_talent_methods:
+            return None
+
+        return await self.send_command_with_return(f"EXT {expansion_cmd}", timeout=timeout)
+
+    def raise_result_error(self, command: str, response: str):
+        tries = 1 + self.retry_count
+        raise Exception(f"Command '{command}' was unsuccessful for {tries} tries. Latest response:\t'{response}'")
@@ -1,4 +1,5 @@
 import time
+from djitellopy import Tello
 from droneblocks.DroneBlocksTello import DroneBlocksTello
 import logging
 from droneblocks.tello_web import web_main
@@ -7,15 +8,19 @@ import threading
 
 class DroneBlocksContextManager():
 
-    def __init__(self, motor_on=False, start_tello_web=False, log_level=logging.ERROR, ignore_tello_talent_methods=False):
+    def __init__(self, motor_on=False, start_tello_web=False, log_level=logging.ERROR, ignore_tello_talent_methods=False,
+                 host=Tello.TELLO_IP, port=Tello.CONTROL_UDP_PORT):
         self.motor_on = motor_on
+        self.host = host
+        self.port = port
         self.db_tello = None
         self.log_level = log_level
         self.start_tello_web = start_tello_web
         self.ignore_tello_talent_methods = ignore_tello_talent_methods
 
     def __enter__(self):
-        self.db_tello = DroneBlocksTello(ignore_tello_talent_methods=self.ignore_tello_talent_methods)
+        self.db_tello = DroneBlocksTello(ignore_tello_talent_methods=self.ignore_tello_talent_methods,
+                                         host=self.host, port=self.port)
         self.db_tello.LOGGER.setLevel(self.log_level)
 
         self.db_tello.connect()
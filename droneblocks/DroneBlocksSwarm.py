@@ -0,0 +1,187 @@
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict
+from djitellopy import Tello
+from droneblocks.DroneBlocksTello import DroneBlocksTello
+from droneblocksutils.exceptions import SwarmCommandError
+
+
+class DroneBlocksSwarm:
+    """
+    Fly several Tello / RMTT drones at once.
+
+    All DroneBlocksTello instances in a process share one command socket and one
+    state socket.  Responses and state are separated by the source address of the
+    drone ( see TelloResponseDemux ), so every drone only needs its own dispatch
+    thread.  Commands for one drone run in the order they were submitted,
+    commands for different drones run at the same time.
+
+    Example:
+        with DroneBlocksSwarm(['192.168.1.101', '192.168.1.102']) as swarm:
+            swarm.sequence([
+                ('takeoff',),
+                ('display_smile',),
+                ('move_up', 50),
+                ('land',)
+            ])
+    """
+
+    def __init__(self, hosts, port: int = Tello.CONTROL_UDP_PORT, **tello_kwargs):
+        """
+
+        :param hosts: list of drone IP addresses, or of (IP address, command port) tuples
+        :param port: command port used for hosts given without a port
+        :param tello_kwargs: passed to every DroneBlocksTello
+        :raises ValueError: if two drones have the same IP address
+        """
+        addresses = [host if isinstance(host, tuple) else (host, port) for host in hosts]
+        ips = [host for host, _ in addresses]
+        duplicates = sorted({host for host in ips if ips.count(host) > 1})
+        if duplicates:
+            # responses and state are told apart by the IP address they come from,
+            # so two drones, or simulators, on one IP address can not be flown together
+            raise ValueError(f"{', '.join(duplicates)} is in the swarm twice, every drone needs its own IP address")
+
+        self.drones = OrderedDict()
+        self._executors = {}
+        for host, drone_port in addresses:
+            self.drones[host] = DroneBlocksTello(host=host, port=drone_port, **tello_kwargs)
+            self._executors[host] = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                          thread_name_prefix=f"swarm-{host}")
+        # future -> host of every command that was submitted and not waited for yet
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    @property
+    def hosts(self) -> list:
+        return list(self.drones.keys())
+
+    def __getitem__(self, host) -> DroneBlocksTello:
+        return self.drones[host]
+
+    def __iter__(self):
+        return iter(self.drones.values())
+
+    def __len__(self):
+        return len(self.drones)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end()
+
+    @staticmethod
+    def _call(drone, command, args, kwargs):
+        if callable(command):
+            return command(drone, *args, **kwargs)
+        return getattr(drone, command)(*args, **kwargs)
+
+    def submit(self, host, command, *args, **kwargs) -> concurrent.futures.Future:
+        """
+        Queue a command for one drone without waiting for it.
+
+        :param command: name of a DroneBlocksTello method, e.g. 'move_up', or a callable that is called
+                        with the drone as its first argument
+        :return: Future with the result of the command
+        """
+        future = self._executors[host].submit(self._call, self.drones[host], command, args, kwargs)
+        with self._pending_lock:
+            self._pending[future] = host
+        return future
+
+    def broadcast(self, command, *args, **kwargs) -> dict:
+        """
+        Queue the same command for every drone without waiting for it.
+
+        :return: dict of host to Future
+        """
+        return {host: self.submit(host, command, *args, **kwargs) for host in self.drones}
+
+    def all(self, command, *args, timeout: float = None, **kwargs) -> dict:
+        """
+        Run the same command on every drone at the same time and wait until all of them finished.
+
+        :return: dict of host to the result of the command
+        :raises SwarmCommandError: if the command failed on any drone
+        """
+        return self._wait(self.broadcast(command, *args, **kwargs), timeout, command)
+
+    def each(self, commands: dict, timeout: float = None) -> dict:
+        """
+        Run a different command on each drone at the same time and wait until all of them finished.
+
+        :param commands: dict of host to a tuple of (command, arg1, arg2, ...)
+        :return: dict of host to the result of the command
+        """
+        futures = {host: self.submit(host, step[0], *step[1:]) for host, step in commands.items()}
+        return self._wait(futures, timeout, 'each')
+
+    def barrier(self, timeout: float = None):
+        """
+        Wait until every command submitted so far finished on every drone.
+        Commands that did not finish in time are waited for again by the next barrier.
+
+        :raises SwarmCommandError: if any of those commands failed
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        done, not_done = concurrent.futures.wait(pending.keys(), timeout=timeout)
+        if not_done:
+            with self._pending_lock:
+                self._pending.update((future, pending[future]) for future in not_done)
+        errors = {}
+        for future in done:
+            if future.exception() is not None:
+                errors[pending[future]] = future.exception()
+        if not_done:
+            raise SwarmCommandError(f"{len(not_done)} commands did not finish in {timeout} seconds", errors=errors)
+        if errors:
+            raise SwarmCommandError(f"Commands failed on {list(errors.keys())}", errors=errors)
+
+    def sequence(self, steps, timeout: float = None) -> list:
+        """
+        Run steps one after the other.  Every step runs on all drones at the same time and
+        the next step starts when every drone finished the previous one.
+
+        :param steps: list of (command, arg1, arg2, ...) tuples
+        :return: list with the result dict of every step
+        """
+        return [self.all(step[0], *step[1:], timeout=timeout) for step in steps]
+
+    def connect(self):
+        self.all('connect')
+
+    def end(self):
+        """
+        Land, stop and release all drones.
+        """
+        try:
+            self.all('end', timeout=Tello.RESPONSE_TIMEOUT * 2)
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+
+    def _wait(self, futures: dict, timeout, command) -> dict:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = {}
+        errors = {}
+        for host, future in futures.items():
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                results[host] = future.result(timeout=remaining)
+            except Exception as exc:
+                errors[host] = exc
+            finally:
+                # a command that is still running is left for barrier to wait for
+                if future.done():
+                    with self._pending_lock:
+                        self._pending.pop(future, None)
+
+        if errors:
+            command_name = command if isinstance(command, str) else getattr(command, '__name__', repr(command))
+            raise SwarmCommandError(f"'{command_name}' failed on {list(errors.keys())}", errors=errors,
+                                    results=results)
+        return results
@@ -1,19 +1,41 @@
 from djitellopy import Tello
+import djitellopy.tello
 import threading
+import time
 from collections import UserList
-from typing import  Dict, Tuple
+from contextlib import contextmanager
+from typing import  Callable, Dict, Tuple
+from droneblocks.tello_metrics import CommandMetrics
+from droneblocks.tello_cache import TelloQueryCache, CONTROLLER_TOF_KEY
+from droneblocks.tello_response_demux import response_demux_for
+from droneblocks.expansion_command_queue import ExpansionCommandQueue
+from droneblocks.tello_state import TelloStateRecord, update_record_from_state_dict
+from droneblocks.tello_state_receiver import install_state_receiver, state_buffer_for
+from droneblocks.tello_telemetry import TelemetryRecorder, DEFAULT_CAPACITY
+from droneblocks.move_plan import MovePlan, DEFAULT_GO_SPEED
+from droneblocks.tof_sampler import TofSampler
+from droneblocksutils.exceptions import MovePlanError, ExpansionCommandQueueStopped
+
+# responses the Tello sends that are not an answer to the command
+# that was just sent and should not be handed back to the caller
+TELLO_IGNORE_RESPONSES = ['unknown command: keepalive']
+
 
 class TelloResponseList(UserList):
-    def __init__(self, *args: Tuple, **kwargs: Dict
+    def __init__(self, *args: Tuple, on_ignored: Callable = None, **kwargs: Dict
                  ) -> None:
         super().__init__(*args, **kwargs)
-        self.ignore_responses = ['unknown command: keepalive']
+        self.ignore_responses = TELLO_IGNORE_RESPONSES
+        # called with the raw response when a response is ignored
+        self.on_ignored = on_ignored
 
     def append(self, item) -> None:
         # print(f"TRL: {item.decode('utf-8')}")
         if item.decode("utf-8") not in self.ignore_responses:
             # print(".... append")
             super().append(item)
+        elif self.on_ignored is not None:
+            self.on_ignored(item)
 
 
 class DroneBlocksTello(Tello):
@@ -26,6 +48,11 @@ class DroneBlocksTello(Tello):
     BLUE = 'b'
     RED = 'r'
 
+    # expansion board outputs tracked by the display state cache
+    MATRIX_TARGET = 'matrix'
+    TOP_LED_TARGET = 'top_led'
+    BRIGHTNESS_TARGET = 'brightness'
+
     sad_image = "0000000000b00b0000000000000bb000000bb000000000000bbbbbb0b000000b"
     smile_image = "0000000000b00b0000000000000bb000b00bb00bb000000b0b0000b000bbbb00"
     up_arrow_image = "000bb00000bbbb000bbbbbb0000bb000000bb000000bb000000bb00000000000"
@@ -34,11 +61,53 @@ class DroneBlocksTello(Tello):
     right_arrow_image = "0000000000000b0000000bb00bbbbbbb0bbbbbbb00000bb000000b0000000000"
     question_mark = "000bb00000b00b0000b00b0000000b000000b0000000b000000000000000b000"
 
-    def __init__(self, ignore_tello_talent_methods=False):
-        super().__init__()
+    def __init__(self, ignore_tello_talent_methods=False, query_cache=None, suppress_redundant_display_commands=True,
+                 host=Tello.TELLO_IP, port=Tello.CONTROL_UDP_PORT):
+        """
+
+        :param ignore_tello_talent_methods: When True, expansion (EXT) commands are not sent
+        :param query_cache: Cache for read commands like 'sdk?' and 'speed?'.  Defaults to a
+                            TelloQueryCache with DEFAULT_QUERY_TTLS.
+        :type query_cache: TelloQueryCache
+        :param suppress_redundant_display_commands: When True, matrix, top LED and brightness commands
+                            that would not change what the expansion board already shows are not sent.
+        :param host: IP address of the Tello, or of a tello_simulator
+        :param port: Command port of the Tello.  Use a different port to talk to a tello_simulator
+                     running on the same computer, because this computer binds the Tello command port
+                     to receive responses.
+        """
+        # before super().__init__, which starts the djitellopy receiver threads for the first Tello
+        self._decodes_state = install_state_receiver()
+        super().__init__(host=host)
+        self.address = (host, port)
         self.last_speed_value = 0
         self.ignore_tello_talent_methods = ignore_tello_talent_methods
         self.send_command_with_return_lock = threading.Lock()
+        # per command verb round trip latency histograms and counters
+        self.command_metrics = CommandMetrics()
+        self.query_cache = query_cache if query_cache is not None else TelloQueryCache()
+        # one response demultiplexer per drone address replaces the responses
+        # list the djitellopy receiver thread appends to
+        self.response_demux = response_demux_for(self.address[0], ignore_responses=TELLO_IGNORE_RESPONSES)
+        self.response_demux.on_filtered = self.command_metrics.record_filtered_response
+        self.get_own_udp_object()['responses'] = self.response_demux
+        self.suppress_redundant_display_commands = suppress_redundant_display_commands
+        # target -> (last successfully sent expansion command, its response)
+        self.display_state = {}
+        # set by enable_non_blocking_display_commands
+        self.expansion_command_queue = None
+        # state packets are decoded into this buffer by the state receiver thread
+        self.state_buffer = state_buffer_for(host)
+        # only used when a plain djitellopy Tello started the receiver threads first, see get_state_record
+        self.state_record = None
+        self._state_record_source = None
+        self._state_record_lock = threading.Lock()
+        # set by start_telemetry_recording
+        self.telemetry_recorder = None
+        # set by begin_move_plan
+        self._move_plan = None
+        # set by start_tof_sampler
+        self.tof_sampler = None
 
     def send_expansion_command(self, expansion_cmd: str):
         if self.ignore_tello_talent_methods:
@@ -52,12 +121,172 @@ class DroneBlocksTello(Tello):
         Return:
             bool/str: str with response text on success, False when unsuccessfull.
         """
+        response, _ = self._send_command_with_return(command, timeout)
+        return response
+
+    def _send_command_with_return(self, command: str, timeout: int = Tello.RESPONSE_TIMEOUT):
+        """
+        :return: (response text, True if the drone answered).  On a timeout or an undecodable
+                 response the text is the same message djitellopy returns, and the flag is False.
+        """
 
         with self.send_command_with_return_lock:
-            self.get_own_udp_object()['responses'] = TelloResponseList()
-            response = super().send_command_with_return(command=command, timeout=timeout)
+            # Commands very consecutive makes the drone not respond to them.
+            # So wait at least self.TIME_BTW_COMMANDS seconds
+            diff = time.time() - self.last_received_command_timestamp
+            if diff < self.TIME_BTW_COMMANDS:
+                self.LOGGER.debug('Waiting {} seconds to execute command: {}...'.format(diff, command))
+                time.sleep(self.TIME_BTW_COMMANDS - diff)
+
+            self.LOGGER.info("Send command: '{}'".format(command))
+            pending = self.response_demux.register(command)
+            sent_at = self.command_metrics.record_send(command)
+            djitellopy.tello.client_socket.sendto(command.encode('utf-8'), self.address)
+
+            raw_response = self.response_demux.wait(pending, timeout)
+            if raw_response is None:
+                self.command_metrics.record_timeout(command, sent_at)
+                message = "Aborting command '{}'. Did not receive a response after {} seconds".format(command, timeout)
+                self.LOGGER.warning(message)
+                return message, False
+
+            self.command_metrics.record_response(command, sent_at)
+            self.last_received_command_timestamp = time.time()
+
+        try:
+            response = raw_response.decode("utf-8")
+        except UnicodeDecodeError as e:
+            self.LOGGER.error(e)
+            return "response decode error", False
+
+        self.LOGGER.info("Response {}: '{}'".format(command, response))
+        return response, True
+
+    def send_control_command(self, command: str, timeout: int = Tello.RESPONSE_TIMEOUT) -> bool:
+        """Send control command to Tello and wait for its response.
+        Same as the Tello implementation, but counts the retries in the command metrics.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        response = "max retries exceeded"
+        for i in range(0, self.retry_count):
+            if i > 0:
+                self.command_metrics.record_retry(command)
+            response = self.send_command_with_return(command, timeout=timeout)
+
+            if 'ok' in response.lower():
+                return True
+
+            self.LOGGER.debug("Command attempt #{} failed for command: '{}'".format(i, command))
+
+        self.raise_result_error(command, response)
+        return False  # never reached
+
+    def send_read_command(self, command: str) -> str:
+        """Send given command to Tello and wait for its response.
+        Responses of cacheable commands are served from the query cache
+        while they are fresh.
+        Internal method, you normally wouldn't call this yourself.
+        """
+        response = self.query_cache.get(command)
+        if response is not None:
+            return response
+
+        response, answered = self._send_command_with_return(command)
+        if any(word in response for word in ('error', 'ERROR', 'False')):
+            self.raise_result_error(command, response)
+
+        # a timeout message must not be served as the serial number for the rest of the session
+        if answered:
+            self.query_cache.put(command, response)
         return response
 
+    def invalidate_query_cache(self, command: str = None):
+        """
+        Forget the cached response for command, or for all commands when command is None.
+        """
+        self.query_cache.invalidate(command)
+
+    def connect(self, wait_for_state=True):
+        # a new session, or a rebooted drone, may report different values
+        # and will not show what we last displayed
+        self.invalidate_query_cache()
+        self.invalidate_display_state()
+        super().connect(wait_for_state=wait_for_state)
+
+    def set_speed(self, x: int):
+        super().set_speed(x)
+        self.invalidate_query_cache('speed?')
+
+    def get_state_record(self) -> TelloStateRecord:
+        """
+        Latest Tello state as a TelloStateRecord with the same fields as get_current_state()
+        ( bat, templ, temph, h, tof, agx, ... ) as attributes.
+
+        The state receiver thread decodes every packet into one of a few preallocated
+        records and timestamps it when it arrives.  The returned record does not change
+        until STATE_RING_SIZE - 1 more packets arrived, so read it right away, or use
+        record.copy() to keep a sample.
+
+        :return: the state record, or None if no state packet was received yet
+        """
+        if self._decodes_state:
+            return self.state_buffer.record
+
+        # djitellopy's own state receiver was started before the first DroneBlocksTello,
+        # so only its parsed dict is available
+        state = super().get_current_state()
+        if not state:
+            return None
+        with self._state_record_lock:
+            # the djitellopy receiver replaces the state dict for every packet
+            if state is not self._state_record_source:
+                self.state_record = update_record_from_state_dict(state, TelloStateRecord())
+                self._state_record_source = state
+            return self.state_record
+
+    def get_current_state(self) -> dict:
+        """
+        Same as Tello.get_current_state, made from the latest state record.
+
+        :return: dict of the latest state, empty if no state packet was received yet
+        """
+        if not self._decodes_state:
+            return super().get_current_state()
+        record = self.state_buffer.record
+        return record.as_dict() if record is not None else {}
+
+    def start_telemetry_recording(self, path: str, capacity: int = DEFAULT_CAPACITY) -> TelemetryRecorder:
+        """
+        Record every state packet to a memory-mapped telemetry file until stop_telemetry_recording
+        or end is called.  Use tello_telemetry.TelemetryReplay to read or replay the file.
+
+        :param path: telemetry file to create
+        :param capacity: maximum number of samples, the Tello sends about 10 per second
+        """
+        self.stop_telemetry_recording()
+        self.telemetry_recorder = TelemetryRecorder(self, path, capacity=capacity).start()
+        return self.telemetry_recorder
+
+    def stop_telemetry_recording(self):
+        telemetry_recorder = self.telemetry_recorder
+        self.telemetry_recorder = None
+        if telemetry_recorder is not None:
+            telemetry_recorder.stop()
+
+    def get_command_metrics(self) -> dict:
+        """
+        Snapshot of the round trip metrics recorded for every command verb sent to the Tello.
+
+        :return: dict keyed by command verb ( 'takeoff', 'speed?', 'EXT tof?', 'EXT mled g', ... ) with
+                 sent/responses/timeouts/retries/filtered_responses counters, last send and response
+                 times and a fixed bucket latency histogram.
+        :rtype: dict
+        """
+        return self.command_metrics.snapshot()
+
+    def reset_command_metrics(self):
+        self.command_metrics.reset()
+
     def query_hardware(self):
         """
 
@@ -77,8 +306,86 @@ class DroneBlocksTello(Tello):
     def get_blank_display_matrix(cls):
         return "0000000000000000000000000000000000000000000000000000000000000000"
 
+    def _send_display_command(self, target: str, expansion_cmd: str, static: bool = True) -> str:
+        """
+        Send an expansion command that changes what target shows, unless target
+        already shows exactly that.  In non blocking mode the command is queued
+        instead and 'queued' is returned.
+
+        :param target: MATRIX_TARGET, TOP_LED_TARGET or BRIGHTNESS_TARGET
+        :param static: False for commands like scrolling text that do not leave the target
+                       in a known state.  These are always sent.
+        """
+        expansion_command_queue = self.expansion_command_queue
+        if expansion_command_queue is not None:
+            try:
+                expansion_command_queue.submit(target, expansion_cmd, static)
+                return 'queued'
+            except ExpansionCommandQueueStopped:
+                # non blocking mode was disabled by another thread meanwhile
+                pass
+
+        return self._send_display_command_now(target, expansion_cmd, static)
+
+    def _send_display_command_now(self, target: str, expansion_cmd: str, static: bool = True) -> str:
+        if static and self.suppress_redundant_display_commands:
+            last_state = self.display_state.get(target)
+            if last_state is not None and last_state[0] == expansion_cmd:
+                return last_state[1]
+
+        rtn = self.send_expansion_command(expansion_cmd)
+
+        if self.ignore_tello_talent_methods or not static:
+            self.display_state.pop(target, None)
+        else:
+            self.display_state[target] = (expansion_cmd, rtn)
+        return rtn
+
+    def enable_non_blocking_display_commands(self, max_rate: float = 10.0):
+        """
+        Queue matrix, top LED and brightness commands instead of waiting for the Tello to answer.
+        Only the newest command for each of them is kept, and one background sender
+        sends them at no more than max_rate commands per second.
+
+        :param max_rate: maximum number of display commands per second, above 0
+        """
+        if self.expansion_command_queue is None:
+            self.expansion_command_queue = ExpansionCommandQueue(self._send_display_command_now, max_rate=max_rate)
+            self.expansion_command_queue.start()
+        else:
+            self.expansion_command_queue.max_rate = max_rate
+
+    def disable_non_blocking_display_commands(self, drain: bool = True):
+        """
+        Go back to sending display commands from the calling thread.
+
+        :param drain: True - send the commands that are still queued first
+        """
+        expansion_command_queue = self.expansion_command_queue
+        self.expansion_command_queue = None
+        if expansion_command_queue is not None:
+            expansion_command_queue.stop(drain=drain)
+
+    def end(self):
+        self.stop_tof_sampler()
+        self.disable_non_blocking_display_commands()
+        self.stop_telemetry_recording()
+        super().end()
+
+    def invalidate_display_state(self, target: str = None):
+        """
+        Forget what the matrix, top LED and brightness were last set to, e.g. after the drone rebooted,
+        so the next display command is always sent.
+
+        :param target: MATRIX_TARGET, TOP_LED_TARGET, BRIGHTNESS_TARGET or None for all of them
+        """
+        if target is None:
+            self.display_state = {}
+        else:
+            self.display_state.pop(target, None)
+
     def _display_pattern(self, flattened_matrix: str) -> str:
-        return self.send_expansion_command(f"mled g {flattened_matrix}")
+        return self._send_display_command(DroneBlocksTello.MATRIX_TARGET, f"mled g {flattened_matrix}")
 
     def get_speed(self) -> int:
         """Query speed setting (cm/s)
@@ -107,13 +414,13 @@ class DroneBlocksTello(Tello):
         freq = max(min(freq, 2.5), 0.1)
 
         if 0.1 <= freq <= 2.5 and 0 <= r <= 255 and 0 <= g <= 255 and 0 <= b <= 255:
-            return self.send_expansion_command(f"led br {freq} {r} {g} {b}")
+            return self._send_display_command(DroneBlocksTello.TOP_LED_TARGET, f"led br {freq} {r} {g} {b}")
         else:
             return f"ERROR: Invalid input parameters"
 
     def set_top_led(self, r: int, g: int, b: int) -> str:
         if 0 <= r <= 255 and 0 <= g <= 255 and 0 <= b <= 255:
-            rtn = self.send_expansion_command(f"led {r} {g} {b}")
+            rtn = self._send_display_command(DroneBlocksTello.TOP_LED_TARGET, f"led {r} {g} {b}")
             return rtn
         else:
             return "error"
@@ -122,13 +429,17 @@ class DroneBlocksTello(Tello):
                           freq: float = 2.5) -> str:
         freq = max(min(freq, 10), 0.1)
 
-        return self.send_expansion_command(f"led bl {freq} {r1} {g1} {b1} {r2} {g2} {b2}")
+        return self._send_display_command(DroneBlocksTello.TOP_LED_TARGET,
+                                          f"led bl {freq} {r1} {g1} {b1} {r2} {g2} {b2}")
 
     def change_image_color(self, image_string: str, from_color: str, to_color: str) -> str:
         new_str = image_string.replace(from_color, to_color)
         return new_str
 
     def display_image(self, display_string: str) -> str:
+        """
+        :param display_string: 64 character pattern string or a tt_matrix_pattern.MatrixPattern
+        """
         return self._display_pattern(display_string)
 
     def clear_display(self) -> str:
@@ -137,7 +448,7 @@ class DroneBlocksTello(Tello):
 
     def set_display_brightness(self, level: int) -> str:
         if 0 <= level <= 255:
-            return self.send_expansion_command(f"mled sl {level}")
+            return self._send_display_command(DroneBlocksTello.BRIGHTNESS_TARGET, f"mled sl {level}")
         return 'Invalid level value'
 
     def clear_everything(self):
@@ -145,7 +456,7 @@ class DroneBlocksTello(Tello):
         self.set_top_led(r=0, g=0, b=0)
 
     def display_heart(self, display_color: str = PURPLE) -> str:
-        return self.send_expansion_command(f"mled s {display_color} heart")
+        return self._send_display_command(DroneBlocksTello.MATRIX_TARGET, f"mled s {display_color} heart")
 
     def display_character(self, single_character: str, display_color: str = PURPLE) -> str:
         # make sure single_character is a string, not a number
@@ -153,7 +464,7 @@ class DroneBlocksTello(Tello):
         if len(single_character) > 0:
             # then just take the first character
             single_character = single_character[0]
-        return self.send_expansion_command(f"mled s {display_color} {single_character}")
+        return self._send_display_command(DroneBlocksTello.MATRIX_TARGET, f"mled s {display_color} {single_character}")
 
     def display_smile(self, display_color: str = PURPLE) -> str:
         smile = self.change_image_color(DroneBlocksTello.smile_image, DroneBlocksTello.BLUE, display_color)
@@ -184,7 +495,8 @@ class DroneBlocksTello(Tello):
         return self._display_pattern(question)
 
     def scroll_image(self, image_string: str, scroll_dir: str, rate: float = 2.5) -> str:
-        return self.send_expansion_command(f"mled {scroll_dir} g {rate} {image_string}")
+        return self._send_display_command(DroneBlocksTello.MATRIX_TARGET, f"mled {scroll_dir} g {rate} {image_string}",
+                                          static=False)
 
     def scroll_string(self, message: str, scroll_dir: str = LEFT, display_color: str = PURPLE,
                       rate: float = 2.5) -> str:
@@ -192,7 +504,8 @@ class DroneBlocksTello(Tello):
         if len(message) > 70:
             message = message[0:70]
 
-        return self.send_expansion_command(f"mled {scroll_dir} {display_color} {rate} {message}")
+        return self._send_display_command(DroneBlocksTello.MATRIX_TARGET,
+                                          f"mled {scroll_dir} {display_color} {rate} {message}", static=False)
 
     # it appears that the EXT tof? command returns: unknown command: keepalive
     # along with the value.  Seems like a tello bug.
@@ -200,8 +513,20 @@ class DroneBlocksTello(Tello):
     # value that was read from the tello.
     def get_controller_tof(self) -> str:
         global last_known_good_tof
+        tof_sampler = self.tof_sampler
+        if tof_sampler is not None:
+            # a sampler reading from the last two poll intervals is as good as a new round trip
+            cm_value = tof_sampler.latest_tof(max_age=2.0 / tof_sampler.rate_hz)
+            if cm_value is not None:
+                return cm_value
+
+        cm_value = self.query_cache.get(CONTROLLER_TOF_KEY)
+        if cm_value is not None:
+            return cm_value
+
         mm_value = self.send_expansion_command("tof?")
         if mm_value is not None and mm_value == "unknown command: keepalive":
+            self.command_metrics.record_retry("EXT tof?")
             mm_value = self.send_expansion_command("tof?")
         # 10 mm = 1 cm
         # print(f"send_expansion_command Rtn Value: {mm_value}")
@@ -212,8 +537,57 @@ class DroneBlocksTello(Tello):
         except:
             cm_value = -1
 
+        if cm_value >= 0:
+            self.query_cache.put(CONTROLLER_TOF_KEY, cm_value)
         return cm_value
 
+    def start_tof_sampler(self, rate_hz: float = 10, buffer_size: int = 32) -> TofSampler:
+        """
+        Poll the controller ToF sensor in the background.  latest_tof, median_tof and
+        get_controller_tof then return without waiting for the drone.
+
+        :param rate_hz: polls per second.  At most about 10, see TofSampler.
+        :param buffer_size: number of readings to keep
+        :return: the TofSampler, or None when ignore_tello_talent_methods is set
+        """
+        if self.ignore_tello_talent_methods:
+            return None
+        self.stop_tof_sampler()
+        self.tof_sampler = TofSampler(self, rate_hz=rate_hz, buffer_size=buffer_size).start()
+        return self.tof_sampler
+
+    def stop_tof_sampler(self):
+        tof_sampler = self.tof_sampler
+        self.tof_sampler = None
+        if tof_sampler is not None:
+            tof_sampler.stop()
+
+    def latest_tof(self, max_age: float = None) -> int:
+        """
+        Latest ToF sampler reading, never blocks.
+
+        :param max_age: seconds.  Readings older than this are not returned.
+        :return: distance in cm, or None if the sampler is not running or has no recent reading
+        """
+        tof_sampler = self.tof_sampler
+        return tof_sampler.latest_tof(max_age=max_age) if tof_sampler is not None else None
+
+    def median_tof(self, count: int = 5, max_age: float = None) -> int:
+        """
+        Median of the last count ToF sampler readings, never blocks.
+
+        :return: distance in cm, or None if the sampler is not running or has no readings
+        """
+        tof_sampler = self.tof_sampler
+        return tof_sampler.median_tof(count=count, max_age=max_age) if tof_sampler is not None else None
+
+    def tof_staleness(self) -> float:
+        """
+        :return: seconds since the latest ToF sampler reading, or None if there is none
+        """
+        tof_sampler = self.tof_sampler
+        return tof_sampler.staleness() if tof_sampler is not None else None
+
     # ----------------  fly_xyz api to match the droneblocks simulator tello
     def _inches_to_cm(self, inch_value):
         return int(inch_value * 2.54)
@@ -221,32 +595,50 @@ class DroneBlocksTello(Tello):
     def fly_up(self, x, units):
         if units == 'in':
             x = self._inches_to_cm(x)
-        self.move_up(x)
+        if self._move_plan is not None:
+            self._move_plan.add_move(0, 0, x)
+        else:
+            self.move_up(x)
 
     def fly_down(self, x, units):
         if units == 'in':
             x = self._inches_to_cm(x)
-        self.move_down(x)
+        if self._move_plan is not None:
+            self._move_plan.add_move(0, 0, -x)
+        else:
+            self.move_down(x)
 
     def fly_left(self, x, units):
         if units == 'in':
             x = self._inches_to_cm(x)
-        self.move_left(x)
+        if self._move_plan is not None:
+            self._move_plan.add_move(0, x, 0)
+        else:
+            self.move_left(x)
 
     def fly_right(self, x, units):
         if units == 'in':
             x = self._inches_to_cm(x)
-        self.move_right(x)
+        if self._move_plan is not None:
+            self._move_plan.add_move(0, -x, 0)
+        else:
+            self.move_right(x)
 
     def fly_forward(self, x, units):
         if units == 'in':
             x = self._inches_to_cm(x)
-        self.move_forward(x)
+        if self._move_plan is not None:
+            self._move_plan.add_move(x, 0, 0)
+        else:
+            self.move_forward(x)
 
     def fly_backward(self, x, units):
         if units == 'in':
             x = self._inches_to_cm(x)
-        self.move_back(x)
+        if self._move_plan is not None:
+            self._move_plan.add_move(-x, 0, 0)
+        else:
+            self.move_back(x)
 
     def fly_to_xyz(self, x, y,z, units):
         if units == 'in':
@@ -254,7 +646,10 @@ class DroneBlocksTello(Tello):
             y = self._inches_to_cm(y)
             z = self._inches_to_cm(z)
 
-        self.go_xyz_speed(x, y, z, 50)
+        if self._move_plan is not None:
+            self._move_plan.add_move(x, y, z, speed=DEFAULT_GO_SPEED)
+        else:
+            self.go_xyz_speed(x, y, z, DEFAULT_GO_SPEED)
 
     def fly_curve(self, x1, y1, z1, x2, y2, z2, units):
         if units == 'in':
@@ -266,30 +661,87 @@ class DroneBlocksTello(Tello):
             y2 = self._inches_to_cm(y2)
             z2 = self._inches_to_cm(z2)
 
-        self.curve_xyz_speed(x1, y1, z1, x2, y2, z2, 50)
+        if self._move_plan is not None:
+            self._move_plan.add_curve(x1, y1, z1, x2, y2, z2, speed=DEFAULT_GO_SPEED)
+        else:
+            self.curve_xyz_speed(x1, y1, z1, x2, y2, z2, DEFAULT_GO_SPEED)
+
+    # ----------------  move plan mode, see move_plan.py
+    def begin_move_plan(self, allow_diagonal: bool = False):
+        """
+        Record the following fly_* calls instead of flying them.  execute_move_plan
+        merges them into fewer SDK commands and flies the result.
+
+        Only fly_* calls are recorded, every other command is still sent right away,
+        so call execute_move_plan before e.g. changing the display or landing.
+
+        :param allow_diagonal: True - merge any consecutive moves into one straight 'go' command.
+                               False - only merge moves in the same direction.
+        """
+        self._move_plan = MovePlan(allow_diagonal=allow_diagonal,
+                                   move_speed=self.last_speed_value or DEFAULT_GO_SPEED)
+
+    def cancel_move_plan(self):
+        self._move_plan = None
+
+    def execute_move_plan(self) -> dict:
+        """
+        Leave move plan mode, compile the recorded moves and fly them.
+
+        :return: report dict with original_commands, compiled_commands, commands_saved,
+                 estimated_original_time, estimated_time, estimated_time_saved and the compiled commands
+        :raises MovePlanError: if a move is outside the SDK limits.  Nothing is flown in that case.
+        """
+        move_plan = self._move_plan
+        self._move_plan = None
+        if move_plan is None:
+            raise MovePlanError("execute_move_plan called without begin_move_plan")
+
+        commands = move_plan.compile()
+        report = move_plan.report(commands)
+        Tello.LOGGER.info(f"Move plan: {report['original_commands']} commands compiled to "
+                          f"{report['compiled_commands']}, estimated {report['estimated_time']}s "
+                          f"instead of {report['estimated_original_time']}s")
+        for method, args in commands:
+            getattr(self, method)(*args)
+        return report
+
+    @contextmanager
+    def move_plan(self, allow_diagonal: bool = False):
+        """
+        with tello.move_plan():
+            tello.fly_forward(20, 'cm')
+            tello.fly_forward(30, 'cm')
+
+        The moves are flown when the with block ends without an exception.
+        """
+        self.begin_move_plan(allow_diagonal=allow_diagonal)
+        try:
+            yield self._move_plan
+        except BaseException:
+            self.cancel_move_plan()
+            raise
+        self.execute_move_plan()
 
 if __name__ == '__main__':
-    import time
+    from droneblocks.tt_matrix_pattern import MatrixPattern
 
     test_drone = DroneBlocksTello()
     test_drone.connect()
 
     test_matrix = test_drone.get_blank_display_matrix()
 
-    smile = test_drone.get_smile()
-    test_drone.display_image(smile)
+    test_drone.display_smile()
 
     time.sleep(2)
 
     test_drone.display_image("b000000r0b0000r000b00r00b00br00pb00rp00p00r00p000r0000p0r000000p")
-    # up = test_drone.up_arrow_matrix()
-    # print(up)
-    #
-    # down = np.flipud(up)
-    # print(down)
-    #
-    # left = np.rot90(up)
-    # print(left)
-    #
-    # right = np.fliplr(left)
-    # print(right)
+    time.sleep(2)
+
+    up = MatrixPattern(DroneBlocksTello.up_arrow_image)
+    down = up.flip_vertical()
+    left = up.rotate()
+    right = left.flip_horizontal()
+    for arrow in (up, right, down, left):
+        test_drone.display_image(arrow)
+        time.sleep(1)
@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+from droneblocksutils.exceptions import ExpansionCommandQueueStopped
+
+LOGGER = logging.getLogger('djitellopy')
+
+
+class ExpansionCommandQueue:
+    """
+    Latest-wins queue of expansion (EXT) commands.
+
+    There is one slot per target ( top LED, matrix, brightness ).  Submitting
+    a command replaces whatever is still waiting in that target's slot and
+    returns immediately.  A single background sender drains the slots at no
+    more than max_rate commands per second, so at most one command is in
+    flight and only the newest command for each target is ever sent.
+    """
+
+    def __init__(self, send_function, max_rate: float = 10.0):
+        """
+
+        :param send_function: called from the sender thread as send_function(target, expansion_cmd, static)
+                              and blocks until the Tello answered
+        :param max_rate: maximum number of commands per second to send, above 0
+        :raises ValueError: if max_rate is not above 0
+        """
+        self.send_function = send_function
+        self.max_rate = max_rate
+        self._condition = threading.Condition()
+        # target -> (expansion_cmd, static), oldest target first
+        self._slots = {}
+        self._stopped = True
+        self._busy = False
+        self._thread = None
+
+        self.submitted_count = 0
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self.error_count = 0
+
+    @property
+    def max_rate(self) -> float:
+        return self._max_rate
+
+    @max_rate.setter
+    def max_rate(self, max_rate: float):
+        if not max_rate > 0:
+            raise ValueError(f"max_rate must be above 0 commands per second, got {max_rate}")
+        self._max_rate = max_rate
+
+    def start(self):
+        with self._condition:
+            if not self._stopped:
+                return
+            self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="ExpansionCommandQueue")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, drain: bool = True, timeout: float = 5):
+        """
+        Stop the sender thread.
+
+        :param drain: True - send the commands that are still waiting first.  False - drop them.
+        """
+        if drain:
+            self.wait_until_idle(timeout=timeout)
+
+        with self._condition:
+            self._stopped = True
+            self._slots = {}
+            self._condition.notify_all()
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, target: str, expansion_cmd: str, static: bool = True):
+        """
+        Queue expansion_cmd for target, replacing the command still waiting for target.
+
+        :raises ExpansionCommandQueueStopped: if the queue was not started or was stopped
+        """
+        with self._condition:
+            if self._stopped:
+                raise ExpansionCommandQueueStopped(f"Expansion command '{expansion_cmd}' was submitted to a "
+                                                   f"stopped queue")
+            if target in self._slots:
+                self.coalesced_count += 1
+            # replacing a waiting command keeps the target's place in line,
+            # so a busy target can not starve the others
+            self._slots[target] = (expansion_cmd, static)
+            self.submitted_count += 1
+            self._condition.notify_all()
+
+    def wait_until_idle(self, timeout: float = None) -> bool:
+        """
+        Block until every submitted command was sent.
+
+        :return: False if timeout seconds passed first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while (self._slots or self._busy) and not self._stopped:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {
+                'submitted': self.submitted_count,
+                'sent': self.sent_count,
+                'coalesced': self.coalesced_count,
+                'errors': self.error_count,
+                'pending': len(self._slots)
+            }
+
+    def _run(self):
+        next_send_time = 0
+        while True:
+            with self._condition:
+                while not self._slots and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+            # pace the sends, new submissions keep replacing the slots meanwhile
+            wait_time = next_send_time - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+            with self._condition:
+                if self._stopped:
+                    return
+                if not self._slots:
+                    continue
+                target = next(iter(self._slots))
+                expansion_cmd, static = self._slots.pop(target)
+                self._busy = True
+
+            next_send_time = time.monotonic() + 1.0 / self._max_rate
+            try:
+                self.send_function(target, expansion_cmd, static)
+                self.sent_count += 1
+            except Exception as exc:
+                self.error_count += 1
+                LOGGER.error(f"Expansion command '{expansion_cmd}' failed: {exc}")
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
@@ -0,0 +1,96 @@
+import threading
+
+
+class FrameMailbox:
+    """
+    Single slot, latest-wins hand off of video frames from the handler thread
+    to the display loop.
+
+    put() replaces whatever frame is still waiting, so the consumer always gets
+    the newest frame and at most one unread frame is held no matter how slow
+    the consumer is.  Every frame gets a sequence number; frames that were
+    replaced before anybody read them are counted as dropped.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._seq = 0
+        self._frame = None
+        self._original_frame = None
+        self._read_seq = 0
+        self._closed = False
+
+        self.published_count = 0
+        self.consumed_count = 0
+        self.dropped_count = 0
+
+    def put(self, frame, original_frame=None) -> int:
+        """
+        Publish a frame, replacing the previous one.
+
+        :param frame: frame returned by the handler
+        :param original_frame: frame read from the Tello or webcam before the handler changed it
+        :return: sequence number of the frame
+        """
+        with self._condition:
+            if self._seq > self._read_seq:
+                # the previous frame was never read
+                self.dropped_count += 1
+            self._seq += 1
+            self._frame = frame
+            self._original_frame = original_frame
+            self.published_count += 1
+            self._condition.notify_all()
+            return self._seq
+
+    def get_latest(self, after_seq: int = 0):
+        """
+        Non blocking read of the newest frame.
+
+        :param after_seq: only return a frame newer than this sequence number
+        :return: (seq, frame, original_frame) or None if there is no newer frame
+        """
+        with self._condition:
+            return self._take(after_seq)
+
+    def wait(self, after_seq: int = 0, timeout: float = None, consume: bool = True):
+        """
+        Block until a frame newer than after_seq is published, the mailbox is closed or timeout expires.
+
+        :param consume: False - do not mark the frame as read, e.g. when the caller waits some more
+                        and then takes the newest frame with get_latest.  If it was replaced in the
+                        meantime, it is counted as dropped.
+        :return: (seq, frame, original_frame) or None
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after_seq or self._closed, timeout)
+            return self._take(after_seq, consume)
+
+    def _take(self, after_seq, consume=True):
+        if self._seq <= after_seq:
+            return None
+        if consume and self._seq > self._read_seq:
+            self._read_seq = self._seq
+            self.consumed_count += 1
+        return self._seq, self._frame, self._original_frame
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def close(self):
+        """
+        Wake up every waiting consumer, e.g. when the runner stops.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {
+                'seq': self._seq,
+                'published': self.published_count,
+                'consumed': self.consumed_count,
+                'dropped': self.dropped_count
+            }
@@ -0,0 +1,188 @@
+"""
+Which video frames the handler gets, and how old they are.
+
+The Tello frame reader decodes frames on its own thread and replaces frame_read.frame with
+every new frame, without a timestamp.  FrameStamper polls the reader on another thread and tags
+every frame with the time it first appeared, no matter how long the handler takes, so a frame
+the handler gets late, or that the reader keeps returning while the video stream stalls, is
+older, and the handler can tell from params['frame_lag_ms'] how stale the frame it acts on is.
+
+Policies:
+
+    newest      every call gets the newest frame, also when it was handled before.  The default.
+    max-lag     frames that are more than max_lag_ms old are not handed to the handler.
+    every-kth   only every kth new frame is handed to the handler.
+"""
+import threading
+import time
+
+NEWEST = 'newest'
+MAX_LAG = 'max-lag'
+EVERY_KTH = 'every-kth'
+
+POLICIES = [NEWEST, MAX_LAG, EVERY_KTH]
+
+# seconds between checks of the frame reader for a new frame, the
+# capture time of a frame is at most this late
+DEFAULT_STAMP_INTERVAL = 0.005
+
+
+def frame_lag_ms(capture_time: float, now: float = None) -> float:
+    """
+    :param capture_time: time.monotonic() the frame was captured
+    :return: milliseconds since capture_time
+    """
+    return ((time.monotonic() if now is None else now) - capture_time) * 1000
+
+
+def update_frame_lag(params: dict):
+    """
+    Set params['frame_lag_ms'] to the current age of the frame tagged in params['frame_capture_time'].
+    Called right before the handler, so the time the frame spent in queues is included.
+    """
+    capture_time = params.get('frame_capture_time')
+    params['frame_lag_ms'] = frame_lag_ms(capture_time) if capture_time is not None else None
+
+
+class FrameStamper:
+    """
+    Tags every new frame of a frame reader with the time it appeared.
+
+    read_frame is called every poll_interval seconds on a background thread.  The
+    frame readers replace their frame with a new array for every decoded frame, so a
+    frame that is not the same object as the previous one is new.
+    """
+
+    def __init__(self, read_frame, poll_interval: float = DEFAULT_STAMP_INTERVAL):
+        """
+
+        :param read_frame: returns the latest frame of the reader, or None
+        :param poll_interval: seconds between calls of read_frame
+        """
+        self.read_frame = read_frame
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._frame = None
+        self._capture_time = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.stamped_count = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="FrameStamper")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 1):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def read(self):
+        """
+        :return: (latest frame, time.monotonic() it appeared), or (None, None) before the first frame
+        """
+        with self._lock:
+            return self._frame, self._capture_time
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            frame = self.read_frame()
+            if frame is not None and frame is not self._frame:
+                now = time.monotonic()
+                with self._lock:
+                    self._frame = frame
+                    self._capture_time = now
+                self.stamped_count += 1
+            self._stop_event.wait(self.poll_interval)
+
+
+class FramePolicy:
+    """
+    Used by the thread that reads the frames:
+
+        raw_frame, stamp = frame_stamper.read()
+        capture_time, is_new = frame_policy.acquire(raw_frame, stamp)
+        if frame_policy.admit(capture_time, is_new):
+            params['frame_capture_time'] = capture_time
+            ... hand the frame to the handler
+    """
+
+    def __init__(self, policy: str = NEWEST, max_lag_ms: float = 0, every_kth: int = 1):
+        """
+
+        :param policy: one of POLICIES
+        :param max_lag_ms: oldest frame handed to the handler with the max-lag policy
+        :param every_kth: hand every kth new frame to the handler with the every-kth policy
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown frame policy {policy}, expected one of {', '.join(POLICIES)}")
+        if policy == MAX_LAG and max_lag_ms <= 0:
+            raise ValueError("The max-lag frame policy needs a maximum lag above 0 ms")
+        if policy == EVERY_KTH and every_kth < 1:
+            raise ValueError("The every-kth frame policy needs k of 1 or more")
+
+        self.policy = policy
+        self.max_lag_ms = max_lag_ms
+        self.every_kth = every_kth
+        self._last_frame = None
+        self._capture_time = None
+        self._last_skipped_capture_time = None
+
+        self.new_frame_count = 0
+        self.admitted_count = 0
+        self.skipped_lag_count = 0
+        self.skipped_kth_count = 0
+        self.max_seen_lag_ms = 0.0
+
+    def acquire(self, frame, now: float = None):
+        """
+        Tag frame with the time it was first seen.
+
+        :param now: time.monotonic() the frame was captured, e.g. from FrameStamper.read.  Defaults to now.
+        :return: (capture time as time.monotonic(), True if this frame was not seen before)
+        """
+        if frame is self._last_frame:
+            return self._capture_time, False
+
+        self._last_frame = frame
+        self._capture_time = time.monotonic() if now is None else now
+        self.new_frame_count += 1
+        return self._capture_time, True
+
+    def admit(self, capture_time: float, is_new: bool, now: float = None) -> bool:
+        """
+        :return: True if the frame should be handed to the handler
+        """
+        lag = frame_lag_ms(capture_time, now)
+        self.max_seen_lag_ms = max(self.max_seen_lag_ms, lag)
+
+        if self.policy == MAX_LAG and lag > self.max_lag_ms:
+            # a stale frame is checked again on every loop, count it once
+            if capture_time != self._last_skipped_capture_time:
+                self._last_skipped_capture_time = capture_time
+                self.skipped_lag_count += 1
+            return False
+
+        if self.policy == EVERY_KTH:
+            if not is_new:
+                return False
+            if (self.new_frame_count - 1) % self.every_kth:
+                self.skipped_kth_count += 1
+                return False
+
+        self.admitted_count += 1
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            'policy': self.policy,
+            'new_frames': self.new_frame_count,
+            'admitted': self.admitted_count,
+            'skipped_lag': self.skipped_lag_count,
+            'skipped_kth': self.skipped_kth_count,
+            'max_lag_ms': round(self.max_seen_lag_ms, 1)
+        }
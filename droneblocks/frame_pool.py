@@ -0,0 +1,124 @@
+import sys
+import cv2
+import numpy as np
+
+
+def _unused_refcount() -> int:
+    # sys.getrefcount of a buffer only the pool refers to, measured with the same
+    # loop FramePool.acquire uses, so it holds for every python version
+    buffers = [np.empty(0)]
+    for buffer in buffers:
+        return sys.getrefcount(buffer)
+
+
+UNUSED_REFCOUNT = _unused_refcount()
+
+
+class FramePool:
+    """
+    Preallocated frame buffers, so resizing and copying video frames does not
+    allocate a new array for every frame.
+
+    A buffer is only handed out again once nothing outside the pool refers to it
+    any more.  The frame mailbox, the display loop, a handler pipeline queue or a
+    handler that keeps the previous frame, e.g. to diff it with the next one, all
+    hold on to their buffer simply by keeping a reference to the frame or a view of
+    it, and the buffer is free again when the last of them lets go.  Nobody has to
+    release a buffer explicitly.
+
+    Buffers are allocated when they are first needed, up to count.  When all count
+    buffers are in use, acquire returns a new array that is not kept by the pool.
+    """
+
+    def __init__(self, count: int = 3):
+        """
+
+        :param count: maximum number of buffers kept in the pool
+        """
+        self.count = count
+        self._buffers = []
+        self._shape = None
+        self._dtype = None
+
+        self.allocation_count = 0
+        # arrays allocated because every pooled buffer was in use
+        self.overflow_count = 0
+
+    def acquire(self, shape, dtype=np.uint8) -> np.ndarray:
+        """
+        :return: a buffer of the given shape nobody else refers to.  Its content is undefined.
+        """
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        if shape != self._shape or dtype != self._dtype:
+            # first frame, or the video size changed.  Buffers still in use
+            # keep their old frames, the pool just forgets them.
+            self._buffers = []
+            self._shape = shape
+            self._dtype = dtype
+
+        for buffer in self._buffers:
+            if sys.getrefcount(buffer) <= UNUSED_REFCOUNT:
+                return buffer
+
+        self.allocation_count += 1
+        buffer = np.empty(shape, dtype=dtype)
+        if len(self._buffers) < self.count:
+            self._buffers.append(buffer)
+        else:
+            self.overflow_count += 1
+        return buffer
+
+    def in_use_count(self) -> int:
+        """
+        :return: number of pooled buffers something outside the pool still refers to
+        """
+        return sum(1 for buffer in self._buffers if sys.getrefcount(buffer) > UNUSED_REFCOUNT)
+
+    def resize(self, src: np.ndarray, width: int, interpolation=cv2.INTER_AREA) -> np.ndarray:
+        """
+        Same result as imutils.resize(src, width=width), written into a pooled buffer.
+        """
+        dst = self.acquire(resized_shape(src, width), src.dtype)
+        return resize_into(src, dst, interpolation)
+
+    def copy(self, src: np.ndarray) -> np.ndarray:
+        """
+        Same result as src.copy(), written into a pooled buffer.
+        """
+        dst = self.acquire(src.shape, src.dtype)
+        np.copyto(dst, src)
+        return dst
+
+    def get_stats(self) -> dict:
+        return {
+            'buffers': len(self._buffers),
+            'in_use': self.in_use_count(),
+            'allocations': self.allocation_count,
+            'overflow': self.overflow_count
+        }
+
+
+def resized_shape(src: np.ndarray, width: int) -> tuple:
+    """
+    :return: shape of src resized to width, keeping the aspect ratio like imutils.resize
+    """
+    h, w = src.shape[:2]
+    return (int(h * (width / float(w))), width) + src.shape[2:]
+
+
+def resize_into(src: np.ndarray, dst: np.ndarray, interpolation=cv2.INTER_AREA) -> np.ndarray:
+    """
+    Resize src to the size of dst, writing into dst.
+    """
+    cv2.resize(src, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=interpolation)
+    return dst
+
+
+def read_only_view(frame: np.ndarray) -> np.ndarray:
+    """
+    :return: a view of frame that can not be written to.  frame itself stays writeable.
+    """
+    view = frame.view()
+    view.flags.writeable = False
+    return view
@@ -0,0 +1,376 @@
+"""
+Measure a tello_script_runner handler offline, without a Tello.
+
+Frames come from a video file, e.g. one written with telloscriptrunner --record, or from a
+directory of images.  The handler gets a StubTello, which answers the getters with fixed values
+and records every command instead of sending it.
+
+    tello-handler-benchmark --handler my_handler --source flight.mp4
+    tello-handler-benchmark --handler my_handler --source frames/ --realtime --repeat 3
+
+Without --realtime every frame is handed to the handler as fast as it can take them, which gives
+the handler throughput.  With --realtime frames become available at their recorded times and the
+handler always gets the newest one, like in the runner, so a slow handler drops frames.
+"""
+import argparse
+import csv
+import importlib
+import logging
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from droneblocks.frame_pool import FramePool
+from droneblocks.frame_policy import update_frame_lag
+from droneblocksutils.exceptions import LandException
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+LOGGER = logging.getLogger()
+
+# same width the runner resizes frames to, see tello_script_runner.IMAGE_WIDTH
+BENCHMARK_IMAGE_WIDTH = 600
+
+# resize buffers, same as tello_script_runner.FRAME_POOL_SIZE
+BENCHMARK_FRAME_POOL_SIZE = 4
+
+# frame rate of an image directory without a timestamps.csv
+DEFAULT_REPLAY_FPS = 30
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class ReplayFrameSource:
+    """
+    Frames of a video file or an image directory, with the time each frame was captured.
+
+    Frame times are read from the timestamps file telloscriptrunner --record writes next to the
+    video ( <video>.timestamps.csv ), or from timestamps.csv inside an image directory.  Without
+    one, frames are spaced by the frame rate of the video or DEFAULT_REPLAY_FPS.
+    """
+
+    def __init__(self, path: str, fps: float = None):
+        """
+
+        :param path: video file or directory of images, read in file name order
+        :param fps: frame rate to use when there is no timestamps file
+        """
+        self.path = path
+        self.is_directory = os.path.isdir(path)
+        self._capture = None
+        self._images = []
+        self._index = 0
+
+        if self.is_directory:
+            self._images = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.lower().endswith(IMAGE_EXTENSIONS))
+            if not self._images:
+                raise ValueError(f"No images found in {path}")
+            timestamps_path = os.path.join(path, "timestamps.csv")
+            self.fps = fps or DEFAULT_REPLAY_FPS
+        else:
+            if not os.path.isfile(path):
+                raise ValueError(f"Replay source {path} does not exist")
+            self._capture = cv2.VideoCapture(path)
+            if not self._capture.isOpened():
+                raise ValueError(f"Could not open video {path}")
+            timestamps_path = f"{path}.timestamps.csv"
+            self.fps = fps or self._capture.get(cv2.CAP_PROP_FPS) or DEFAULT_REPLAY_FPS
+
+        self.timestamps = _read_timestamps(timestamps_path) if os.path.isfile(timestamps_path) else None
+
+    def frame_time(self, index: int) -> float:
+        """
+        :return: seconds from the first frame to frame index
+        """
+        if self.timestamps is not None and index < len(self.timestamps):
+            return self.timestamps[index] - self.timestamps[0]
+        return index / self.fps
+
+    def rewind(self):
+        self._index = 0
+        if self._capture is not None:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def read(self):
+        """
+        :return: (index, frame) of the next frame, or None after the last frame
+        """
+        if self.is_directory:
+            while True:
+                if self._index >= len(self._images):
+                    return None
+                frame = cv2.imread(self._images[self._index])
+                if frame is not None:
+                    break
+                LOGGER.warning(f"Skipping {self._images[self._index]}, OpenCV can not read it")
+                self._index += 1
+        else:
+            ok, frame = self._capture.read()
+            if not ok:
+                return None
+
+        index = self._index
+        self._index += 1
+        return index, frame
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+
+def _read_timestamps(path: str) -> np.ndarray:
+    with open(path, newline='') as f:
+        return np.array([float(row['timestamp']) for row in csv.DictReader(f)], dtype=np.float64)
+
+
+class StubTello:
+    """
+    Stands in for DroneBlocksTello when a handler runs without a drone.
+
+    The state getters return fixed values, every other method call is recorded in calls
+    and returns None, so handlers can send rc and move commands without a Tello.
+    """
+
+    def __init__(self, state: dict = None):
+        """
+
+        :param state: values returned by the get_<name> methods, e.g. {'battery': 50}
+        """
+        self.state = {
+            'battery': 100, 'height': 0, 'distance_tof': 100, 'speed_x': 0, 'speed_y': 0, 'speed_z': 0,
+            'pitch': 0, 'roll': 0, 'yaw': 0, 'temperature': 60, 'flight_time': 0, 'barometer': 0
+        }
+        if state:
+            self.state.update(state)
+        self.is_flying = False
+        self.calls = []
+
+    def get_current_state(self) -> dict:
+        return dict(self.state)
+
+    def get_state_field(self, key: str):
+        return self.state.get(key)
+
+    def takeoff(self):
+        self.calls.append(('takeoff', ()))
+        self.is_flying = True
+
+    def land(self):
+        self.calls.append(('land', ()))
+        self.is_flying = False
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'state':
+            raise AttributeError(name)
+        if name.startswith('get_') and name[4:] in self.state:
+            return lambda: self.state[name[4:]]
+
+        def _record_call(*args, **kwargs):
+            self.calls.append((name, args))
+            return None
+
+        return _record_call
+
+    def get_call_counts(self) -> dict:
+        counts = {}
+        for name, _ in self.calls:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+def peak_memory_mb() -> float:
+    """
+    :return: high-water mark of the resident memory of this process in MB, 0 if it is not available
+    """
+    if resource is None:
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def load_handler(handler_file: str):
+    """
+    :return: (init, list of functions called for every frame, stop) of a handler module.
+             A module with STAGES, see handler_pipeline.py, has its stages called one after another.
+    """
+    handler_file = handler_file.replace(".py", "")
+    handler_module = importlib.import_module(handler_file)
+    stages = getattr(handler_module, 'STAGES', None)
+    functions = list(stages) if stages else [getattr(handler_module, 'handler')]
+    return getattr(handler_module, 'init', None), functions, getattr(handler_module, 'stop', None)
+
+
+def run_benchmark(handler_file: str, source: ReplayFrameSource, tello=None, realtime: bool = False,
+                  repeat: int = 1, max_frames: int = 0, warmup: int = 0, image_width: int = BENCHMARK_IMAGE_WIDTH) -> dict:
+    """
+    Call the handler for the frames of source.
+
+    :param tello: passed to the handler, a StubTello by default
+    :param realtime: True - frames become available at their recorded times and the newest one is
+                     handled.  False - every frame is handled, as fast as possible.
+    :param repeat: number of passes through the source
+    :param max_frames: stop after this many handled frames, 0 for no limit
+    :param warmup: handled frames left out of the latency percentiles, e.g. while a model loads
+    :return: report dict, see format_report
+    """
+    if tello is None:
+        tello = StubTello()
+    init_method, functions, stop_method = load_handler(handler_file)
+
+    params = {'fly_flag': False, 'last_key_pressed': None}
+    if init_method is not None:
+        init_method(tello, params)
+
+    # like the runner, a buffer the handler still refers to is never reused,
+    # so a handler that keeps frames gets the same input it gets in the runner
+    frame_pool = FramePool(BENCHMARK_FRAME_POOL_SIZE)
+    latencies = []
+    lags = []
+    handled_count = 0
+    skipped_count = 0
+    land_requested = False
+
+    # the runner tags frames with time.monotonic(), the replay is timed with time.perf_counter()
+    monotonic_offset = time.monotonic() - time.perf_counter()
+    started = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            source.rewind()
+            pass_started = time.perf_counter()
+            next_frame = source.read()
+            while next_frame is not None:
+                index, raw_frame = next_frame
+                next_frame = source.read()
+
+                if realtime:
+                    due = pass_started + source.frame_time(index)
+                    now = time.perf_counter()
+                    if now < due:
+                        time.sleep(due - now)
+                    elif next_frame is not None and pass_started + source.frame_time(next_frame[0]) <= now:
+                        # a newer frame was already captured, the runner would never see this one
+                        skipped_count += 1
+                        continue
+
+                if realtime:
+                    params['frame_capture_time'] = pass_started + source.frame_time(index) + monotonic_offset
+                else:
+                    # read from the source right now
+                    params['frame_capture_time'] = time.monotonic()
+                frame = frame_pool.resize(raw_frame, image_width)
+                call_started = time.perf_counter()
+                for function in functions:
+                    # like the runner, every stage gets the age of the frame when it starts
+                    update_frame_lag(params)
+                    rtn_frame = function(tello, frame, params)
+                    if rtn_frame is not None:
+                        frame = rtn_frame
+                finished = time.perf_counter()
+
+                handled_count += 1
+                if handled_count > warmup:
+                    latencies.append(finished - call_started)
+                    if realtime:
+                        # frame capture to handler result
+                        lags.append(finished - (pass_started + source.frame_time(index)))
+
+                if max_frames and handled_count >= max_frames:
+                    break
+            if max_frames and handled_count >= max_frames:
+                break
+    except LandException:
+        land_requested = True
+    finally:
+        elapsed = time.perf_counter() - started
+        if stop_method is not None:
+            stop_method(tello, params)
+
+    report = {
+        'handler': handler_file,
+        'source': source.path,
+        'realtime': realtime,
+        'frames': handled_count,
+        'skipped': skipped_count,
+        'elapsed': round(elapsed, 3),
+        'fps': round(handled_count / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': _percentiles(latencies),
+        'peak_memory_mb': round(peak_memory_mb(), 1),
+        # frames resized into a new array because the handler kept every pooled buffer
+        'frame_allocations': frame_pool.overflow_count,
+        'land_requested': land_requested
+    }
+    if realtime:
+        report['lag_ms'] = _percentiles(lags)
+    if isinstance(tello, StubTello):
+        report['tello_calls'] = tello.get_call_counts()
+    return report
+
+
+def _percentiles(durations) -> dict:
+    if not durations:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    values = np.array(durations) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2), 'p99': round(float(p99), 2),
+            'max': round(float(values.max()), 2)}
+
+
+def format_report(report: dict) -> str:
+    latency = report['latency_ms']
+    lines = [
+        f"handler:      {report['handler']}",
+        f"source:       {report['source']} ({'recorded timing' if report['realtime'] else 'as fast as possible'})",
+        f"frames:       {report['frames']} in {report['elapsed']}s, skipped {report['skipped']}",
+        f"throughput:   {report['fps']} fps",
+        f"latency:      p50 {latency['p50']}ms p95 {latency['p95']}ms p99 {latency['p99']}ms max {latency['max']}ms",
+    ]
+    if 'lag_ms' in report:
+        lag = report['lag_ms']
+        lines.append(f"frame lag:    p50 {lag['p50']}ms p95 {lag['p95']}ms p99 {lag['p99']}ms max {lag['max']}ms")
+    lines.append(f"peak memory:  {report['peak_memory_mb']} MB")
+    if report.get('frame_allocations'):
+        lines.append(f"frames kept:  {report['frame_allocations']} frames needed a new array, the handler keeps frames")
+    if report.get('tello_calls'):
+        lines.append(f"tello calls:  {report['tello_calls']}")
+    if report['land_requested']:
+        lines.append("handler requested landing")
+    return "\n".join(lines)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure a tello_script_runner handler on recorded frames")
+    ap.add_argument("--handler", type=str, required=True,
+                    help="Name of the python file with an init and handler method, like telloscriptrunner --handler")
+    ap.add_argument("--source", type=str, required=True,
+                    help="Video file, e.g. recorded with telloscriptrunner --record, or a directory of images")
+    ap.add_argument("--realtime", action='store_true',
+                    help="Replay at the recorded timing and always hand the newest frame to the handler.  Default: as fast as possible")
+    ap.add_argument("--fps", type=float, default=None,
+                    help="Frame rate of the source when there is no timestamps file")
+    ap.add_argument("--repeat", type=int, default=1, help="Number of passes through the source.  Default: 1")
+    ap.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames.  Default: 0, no limit")
+    ap.add_argument("--warmup", type=int, default=0,
+                    help="Number of frames left out of the latency percentiles.  Default: 0")
+    args = ap.parse_args()
+
+    # handlers are looked up like telloscriptrunner does, from the current directory
+    sys.path.insert(0, os.getcwd())
+    source = ReplayFrameSource(args.source, fps=args.fps)
+    try:
+        report = run_benchmark(args.handler, source, realtime=args.realtime, repeat=args.repeat,
+                               max_frames=args.max_frames, warmup=args.warmup)
+    finally:
+        source.release()
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Run a user script as a pipeline of stages, each on its own thread.
+
+Instead of one handler, a user script can declare an ordered list of stage functions:
+
+    def detect(tello, frame, params):
+        params['markers'] = find_markers(frame)
+
+    def annotate(tello, frame, params):
+        draw_markers(frame, params['markers'])
+        return frame
+
+    def control(tello, frame, params):
+        follow(tello, params['markers'])
+
+    STAGES = [detect, annotate, control]
+
+Stages have the same signature as handler.  The runner reads and resizes the frames and
+passes them to the first stage.  Every frame travels with its own copy of params, so
+a stage can leave results for the stages after it.  A stage returns the frame to pass on,
+or None to pass on the frame it got.
+
+Stages are connected by small queues that drop the oldest frame when they are full,
+so detection of the next frame overlaps with drawing and control of the previous one
+and the slowest stage sets the frame rate, instead of the sum of all stages.
+"""
+import collections
+import logging
+import threading
+import time
+from droneblocks.frame_policy import update_frame_lag
+from droneblocksutils.exceptions import LandException
+
+LOGGER = logging.getLogger()
+
+# frames waiting in front of each stage
+DEFAULT_STAGE_QUEUE_SIZE = 2
+
+# seconds of history used for the stage FPS
+FPS_WINDOW = 2.0
+
+
+class DropOldestQueue:
+    """
+    Bounded queue that never blocks the producer: putting into a full queue drops the oldest item.
+
+    A dropped item is not referred to any more, so a pooled frame in it becomes free
+    for the FramePool again, see frame_pool.py.
+    """
+
+    def __init__(self, maxsize: int):
+        self._items = collections.deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.dropped_count = 0
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) == self._items.maxlen:
+                self.dropped_count += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout: float = None):
+        """
+        :return: the oldest item, or None on timeout or when the queue was closed
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class _Stage:
+    def __init__(self, function, queue_size):
+        self.function = function
+        self.name = getattr(function, '__name__', repr(function))
+        self.input_queue = DropOldestQueue(queue_size)
+        self.thread = None
+        self.processed_count = 0
+        self.busy_time = 0.0
+        # completion times in the last FPS_WINDOW seconds
+        self.completion_times = collections.deque()
+
+    def record(self, started, finished):
+        self.processed_count += 1
+        self.busy_time += finished - started
+        self.completion_times.append(finished)
+        while self.completion_times and finished - self.completion_times[0] > FPS_WINDOW:
+            self.completion_times.popleft()
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        recent = [t for t in list(self.completion_times) if now - t <= FPS_WINDOW]
+        return {
+            'stage': self.name,
+            'fps': round(len(recent) / FPS_WINDOW, 1),
+            'processed': self.processed_count,
+            'dropped': self.input_queue.dropped_count,
+            'queued': len(self.input_queue),
+            'avg_ms': round(self.busy_time / self.processed_count * 1000, 2) if self.processed_count else 0.0
+        }
+
+
+class HandlerPipeline:
+    """
+    Runs the stage functions of a user script on one thread each.
+    """
+
+    def __init__(self, stages, tello, on_output=None, queue_size: int = DEFAULT_STAGE_QUEUE_SIZE, stats=None):
+        """
+
+        :param stages: list of stage functions, called as stage(tello, frame, params)
+        :param tello: passed to every stage
+        :param on_output: called with (frame, params) for every frame that passed the last stage
+        :param queue_size: frames waiting in front of each stage before the oldest is dropped
+        :param stats: RunnerStats to record the time of every stage in, as 'stage:<name>'
+        """
+        if not stages:
+            raise ValueError("A handler pipeline needs at least one stage")
+        self.tello = tello
+        self.on_output = on_output
+        self.queue_size = queue_size
+        self.stats = stats
+        self._stages = [_Stage(function, queue_size) for function in stages]
+        self._stop_event = threading.Event()
+        # first exception raised by a stage, re-raised by check_error
+        self._error = None
+
+    @property
+    def max_frames_in_flight(self) -> int:
+        # queued frames plus one frame inside every stage
+        return len(self._stages) * (self.queue_size + 1)
+
+    def start(self):
+        self._stop_event.clear()
+        for index, stage in enumerate(self._stages):
+            next_stage = self._stages[index + 1] if index + 1 < len(self._stages) else None
+            stage.thread = threading.Thread(target=self._run_stage, args=(stage, next_stage),
+                                            name=f"stage-{stage.name}")
+            stage.thread.daemon = True
+            stage.thread.start()
+        return self
+
+    def stop(self, timeout: float = 2):
+        self._stop_event.set()
+        for stage in self._stages:
+            stage.input_queue.close()
+        for stage in self._stages:
+            if stage.thread is not None:
+                stage.thread.join(timeout)
+                stage.thread = None
+
+    def submit(self, frame, params: dict):
+        """
+        Hand a frame to the first stage.  Never blocks, if the first stage is behind its oldest frame is dropped.
+
+        :param params: per frame params, stages may add to it
+        """
+        self._stages[0].input_queue.put((frame, params))
+
+    def check_error(self):
+        """
+        Raise the exception a stage raised, e.g. LandException, in the calling thread.
+        """
+        if self._error is not None:
+            raise self._error
+
+    def get_stats(self) -> list:
+        """
+        :return: list with a dict per stage: stage name, fps, processed frames, dropped frames,
+                 frames queued and average milliseconds per frame
+        """
+        return [stage.get_stats() for stage in self._stages]
+
+    def summary(self) -> str:
+        return ", ".join(f"{s['stage']}: {s['fps']} fps {s['avg_ms']} ms dropped {s['dropped']}"
+                         for s in self.get_stats())
+
+    def _run_stage(self, stage, next_stage):
+        while not self._stop_event.is_set():
+            item = stage.input_queue.get()
+            if item is None:
+                continue
+            frame, params = item
+
+            # age of the frame when this stage gets it, including the time it waited in the queues
+            update_frame_lag(params)
+            started = time.monotonic()
+            try:
+                rtn_frame = stage.function(self.tello, frame, params)
+            except LandException as exc:
+                self._fail(exc)
+                break
+            except Exception as exc:
+                LOGGER.error(f"Handler stage {stage.name} failed: {exc}")
+                self._fail(exc)
+                break
+            finished = time.monotonic()
+            stage.record(started, finished)
+            if self.stats is not None:
+                self.stats.record(f"stage:{stage.name}", finished - started)
+
+            if rtn_frame is not None:
+                frame = rtn_frame
+
+            if next_stage is not None:
+                next_stage.input_queue.put((frame, params))
+            elif self.on_output is not None:
+                self.on_output(frame, params)
+
+    def _fail(self, exc):
+        if self._error is None:
+            self._error = exc
+        self._stop_event.set()
+        for stage in self._stages:
+            stage.input_queue.close()
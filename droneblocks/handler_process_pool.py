@@ -0,0 +1,455 @@
+"""
+Run the handler of a user script in several worker processes.
+
+Heavy handlers ( style transfer, oil painting, ... ) use one core when they run in the
+handler thread of tello_script_runner.  HandlerProcessPool runs the handler in N worker
+processes instead:
+
+    - frames are passed through multiprocessing.shared_memory slots, not pickled.
+      The runner resizes the Tello frame straight into a slot and the worker hands the
+      result back in the same slot, or in the output slot next to it.
+    - results are put back in frame order before they are displayed
+    - the Tello connection stays in the runner process.  Workers get a TelloProxy, and
+      every Tello call ( tello.move_up(20), tello.is_flying ) is sent to the runner and
+      answered from there.
+
+Every worker imports the user script and calls its init and stop methods with the
+proxy, so module globals set in init exist in every worker.  params['worker_index']
+( 0 .. N-1 ) lets init send commands to the drone only once:
+
+    def init(tello, params):
+        if params.get('worker_index', 0) == 0:
+            tello.display_smile()
+
+Frames are handled independently in whichever worker is free, so this is for handlers
+that do not keep state from one frame to the next.
+"""
+import importlib
+import itertools
+import logging
+import multiprocessing
+import pickle
+import queue
+import sys
+import threading
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from droneblocks.frame_pool import FramePool
+from droneblocks.frame_policy import update_frame_lag
+from droneblocksutils.exceptions import LandException
+
+LOGGER = logging.getLogger()
+
+# in flight frames per worker process, so a worker can start the next frame while
+# the runner collects the previous one
+SLOTS_PER_PROCESS = 2
+
+# seconds between checks that every worker process is still running
+WORKER_CHECK_INTERVAL = 0.5
+
+
+class TelloProxy:
+    """
+    Stand in for the DroneBlocksTello in a worker process.  Attribute reads and method
+    calls are forwarded to the runner process, which owns the Tello connection.
+    """
+
+    def __init__(self, worker_index, command_queue, reply_queue):
+        self._worker_index = worker_index
+        self._command_queue = command_queue
+        self._reply_queue = reply_queue
+        self._call_ids = itertools.count()
+        # attribute name -> True if it is a method
+        self._callables = {}
+
+    def _request(self, op, name, args=(), kwargs=None):
+        call_id = next(self._call_ids)
+        self._command_queue.put((self._worker_index, call_id, op, name, args, kwargs or {}))
+        while True:
+            reply_id, kind, value = self._reply_queue.get()
+            if reply_id == call_id:
+                break
+        if kind == 'error':
+            raise Exception(value)
+        if kind == 'missing':
+            raise AttributeError(value)
+        return kind, value
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        if not self._callables.get(name, False):
+            kind, value = self._request('get', name)
+            if kind != 'callable':
+                return value
+            self._callables[name] = True
+
+        def call(*args, **kwargs):
+            return self._request('call', name, args, kwargs)[1]
+        call.__name__ = name
+        return call
+
+
+def _close_shm(shm, unlink=False):
+    try:
+        shm.close()
+    except BufferError:
+        # an array still points into the segment, it is released when the process exits
+        pass
+    if unlink:
+        shm.unlink()
+
+
+def _attach(shm_cache, slot, name):
+    # the runner creates a new segment for a slot when the frame size grows
+    shm = shm_cache.get(slot)
+    if shm is None or shm.name != name:
+        if shm is not None:
+            _close_shm(shm)
+        shm = shared_memory.SharedMemory(name=name)
+        shm_cache[slot] = shm
+    return shm
+
+
+def _handler_worker_main(handler_file, worker_index, process_count, base_params, sys_path,
+                         task_queue, result_queue, command_queue, reply_queue):
+    """
+    Worker process entry point.
+    """
+    sys.path[:] = sys_path
+    tello = TelloProxy(worker_index, command_queue, reply_queue)
+    input_shms = {}
+    output_shms = {}
+
+    params = dict(base_params)
+    params['worker_index'] = worker_index
+    params['handler_processes'] = process_count
+
+    handler_module = importlib.import_module(handler_file)
+    init_method = getattr(handler_module, 'init')
+    handler_method = getattr(handler_module, 'handler')
+    stop_method = getattr(handler_module, 'stop', None)
+
+    try:
+        init_method(tello, params)
+    except Exception:
+        result_queue.put((None, None, None, None, None, None, 'error', traceback.format_exc()))
+        return
+
+    frame = rtn_frame = output = None
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+
+            seq, slot, input_name, output_name, shape, dtype, task_params = task
+            params.update(task_params)
+            frame = None
+            if input_name is not None:
+                frame = np.ndarray(shape, dtype=dtype, buffer=_attach(input_shms, slot, input_name).buf)
+
+            try:
+                # time.monotonic() is the same clock in every process
+                update_frame_lag(params)
+                rtn_frame = handler_method(tello, frame, params)
+            except LandException:
+                result_queue.put((seq, slot, None, None, None, None, 'land', None))
+                continue
+            except Exception:
+                result_queue.put((seq, slot, None, None, None, None, 'error', traceback.format_exc()))
+                continue
+
+            if rtn_frame is None:
+                rtn_frame = frame
+
+            if rtn_frame is None:
+                result_queue.put((seq, slot, None, None, None, None, None, None))
+            elif frame is not None and rtn_frame is frame:
+                # drawn in place, the result is already in the input slot
+                result_queue.put((seq, slot, 'input', shape, dtype, None, None, None))
+            else:
+                rtn_frame = np.asarray(rtn_frame)
+                output_shm = _attach(output_shms, slot, output_name) if output_name is not None else None
+                if output_shm is not None and rtn_frame.nbytes <= output_shm.size:
+                    output = np.ndarray(rtn_frame.shape, dtype=rtn_frame.dtype, buffer=output_shm.buf)
+                    np.copyto(output, rtn_frame)
+                    result_queue.put((seq, slot, 'output', rtn_frame.shape, rtn_frame.dtype.str, None, None, None))
+                else:
+                    # does not fit in the slot, e.g. the handler made the frame bigger
+                    result_queue.put((seq, slot, 'pickle', None, None, rtn_frame, None, None))
+    finally:
+        if stop_method is not None:
+            try:
+                stop_method(tello, params)
+            except Exception:
+                pass
+        frame = rtn_frame = output = None
+        for shm in itertools.chain(input_shms.values(), output_shms.values()):
+            _close_shm(shm)
+
+
+class HandlerProcessPool:
+    """
+    Runner side of the worker processes.  Used from the handler thread of tello_script_runner:
+
+        for frame in pool.completed():            # results in frame order
+            ...
+        slot = pool.acquire_slot(timeout)          # waits while every slot is in flight
+        if slot is not None:
+            buffer = pool.input_buffer(slot, shape)    # resize the frame into this shared memory array
+            pool.submit(slot, params, has_frame=True)
+    """
+
+    def __init__(self, handler_file: str, tello, processes: int, base_params: dict = None):
+        """
+
+        :param handler_file: module name of the user script
+        :param tello: the DroneBlocksTello that TelloProxy calls are forwarded to
+        :param processes: number of worker processes
+        :param base_params: params every worker starts with, e.g. fly_flag
+        """
+        self.handler_file = handler_file
+        self.tello = tello
+        self.processes = processes
+        self.base_params = dict(base_params or {})
+        self.slot_count = processes * SLOTS_PER_PROCESS
+
+        # spawn instead of fork, forking a process with running threads and OpenCV is not safe
+        self._context = multiprocessing.get_context('spawn')
+        self._task_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        self._command_queue = self._context.Queue()
+        self._reply_queues = [self._context.Queue() for _ in range(processes)]
+        self._workers = []
+
+        self._input_shms = [None] * self.slot_count
+        self._output_shms = [None] * self.slot_count
+        self._slot_shapes = [None] * self.slot_count
+
+        self._condition = threading.Condition()
+        self._free_slots = list(range(self.slot_count))
+        self._next_seq = 0
+        self._next_emit_seq = 0
+        # seq -> result tuple from the worker
+        self._results = {}
+        self._threads = []
+        self._stopped = False
+        # why the pool can not go on, e.g. the traceback of a worker whose init failed
+        self._worker_error = None
+        # the results are copied out of the slots into these buffers, so a slot
+        # can be reused while its frame is still being displayed.  A buffer is not
+        # reused while the display, the mailbox or a completed() list refers to it,
+        # so a burst of results gets one buffer each.  Room for every slot plus
+        # the frame in the mailbox and the frame on screen.
+        self._output_pool = FramePool(self.slot_count + 2)
+
+        self.submitted_count = 0
+        self.completed_count = 0
+        self.pickled_count = 0
+
+    def start(self):
+        for worker_index in range(self.processes):
+            worker = self._context.Process(target=_handler_worker_main,
+                                           args=(self.handler_file, worker_index, self.processes, self.base_params,
+                                                 list(sys.path), self._task_queue, self._result_queue,
+                                                 self._command_queue, self._reply_queues[worker_index]),
+                                           name=f"handler-{worker_index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        for target, name in ((self._serve_tello_commands, "HandlerTelloProxy"),
+                             (self._collect_results, "HandlerResults")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = 5):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+        self._command_queue.put(None)
+        self._result_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+        for shm in self._input_shms + self._output_shms:
+            if shm is not None:
+                _close_shm(shm, unlink=True)
+        self._input_shms = [None] * self.slot_count
+        self._output_shms = [None] * self.slot_count
+
+    # ------------------------------------------------------------- runner side
+    def acquire_slot(self, timeout: float = None):
+        """
+        Wait for a free slot.  Slots are freed by completed(), so this also returns
+        when a result is ready to be collected.
+
+        :return: index of a free slot, or None if there is none yet
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._free_slots or self._next_emit_seq in self._results or
+                                            self._stopped or self._worker_error, timeout):
+                return None
+            if self._worker_error is not None:
+                raise RuntimeError(self._worker_error)
+            if self._stopped or not self._free_slots:
+                return None
+            return self._free_slots.pop()
+
+    def release_slot(self, slot: int):
+        """
+        Give back a slot from acquire_slot without submitting anything to it.
+        """
+        with self._condition:
+            self._free_slots.append(slot)
+            self._condition.notify_all()
+
+    def input_buffer(self, slot: int, shape, dtype=np.uint8) -> np.ndarray:
+        """
+        :return: array in shared memory to write the frame for slot into
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if self._input_shms[slot] is None or self._input_shms[slot].size < nbytes:
+            for shms in (self._input_shms, self._output_shms):
+                if shms[slot] is not None:
+                    _close_shm(shms[slot], unlink=True)
+                shms[slot] = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._slot_shapes[slot] = (tuple(shape), dtype.str)
+        return np.ndarray(shape, dtype=dtype, buffer=self._input_shms[slot].buf)
+
+    def submit(self, slot: int, params: dict, has_frame: bool = True):
+        """
+        Hand the frame in slot, or no frame, to the next free worker.
+        """
+        if has_frame:
+            shape, dtype = self._slot_shapes[slot]
+            input_name, output_name = self._input_shms[slot].name, self._output_shms[slot].name
+        else:
+            shape = dtype = input_name = output_name = None
+
+        with self._condition:
+            seq = self._next_seq
+            self._next_seq += 1
+        self.submitted_count += 1
+        self._task_queue.put((seq, slot, input_name, output_name, shape, dtype, params))
+
+    def completed(self) -> list:
+        """
+        Results that are ready, in the order the frames were submitted.
+
+        :return: list of frames ( None for a call without a result frame )
+        :raises LandException: the handler raised LandException
+        :raises RuntimeError: the handler raised any other exception, or a worker process died
+        """
+        frames = []
+        with self._condition:
+            if self._worker_error is not None:
+                raise RuntimeError(self._worker_error)
+            while self._next_emit_seq in self._results:
+                result = self._results.pop(self._next_emit_seq)
+                self._next_emit_seq += 1
+                seq, slot, location, shape, dtype, payload, error_kind, error_text = result
+                try:
+                    if error_kind == 'land':
+                        raise LandException()
+                    if error_kind == 'error':
+                        raise RuntimeError(f"Handler process failed:\n{error_text}")
+                    frames.append(self._result_frame(slot, location, shape, dtype, payload))
+                finally:
+                    self._free_slots.append(slot)
+                    self.completed_count += 1
+                    self._condition.notify_all()
+        return frames
+
+    def _result_frame(self, slot, location, shape, dtype, payload):
+        if location is None:
+            return None
+        if location == 'pickle':
+            self.pickled_count += 1
+            return payload
+        shm = self._input_shms[slot] if location == 'input' else self._output_shms[slot]
+        return self._output_pool.copy(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            in_flight = self.slot_count - len(self._free_slots)
+        return {
+            'processes': self.processes,
+            'submitted': self.submitted_count,
+            'completed': self.completed_count,
+            'in_flight': in_flight,
+            'pickled_results': self.pickled_count
+        }
+
+    # ------------------------------------------------------------- background threads
+    def _check_workers(self):
+        # a worker that died, e.g. a crash in OpenCV or killed for lack of memory, never
+        # finishes its frames, so the frames after them would wait forever
+        for worker in self._workers:
+            if worker.exitcode is not None:
+                with self._condition:
+                    if not self._stopped and self._worker_error is None:
+                        self._worker_error = f"Handler process {worker.name} exited with code {worker.exitcode}"
+                        self._condition.notify_all()
+                return
+
+    def _collect_results(self):
+        while True:
+            # also checked while the other workers keep sending results
+            self._check_workers()
+            try:
+                result = self._result_queue.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            if result is None:
+                break
+            with self._condition:
+                if result[0] is None:
+                    # init failed in a worker
+                    self._worker_error = f"Handler process init failed:\n{result[7]}"
+                    self._condition.notify_all()
+                    continue
+                self._results[result[0]] = result
+                self._condition.notify_all()
+
+    def _serve_tello_commands(self):
+        while True:
+            command = self._command_queue.get()
+            if command is None:
+                break
+            worker_index, call_id, op, name, args, kwargs = command
+            try:
+                value = getattr(self.tello, name)
+                if op == 'call':
+                    reply = ('value', value(*args, **kwargs))
+                elif callable(value):
+                    reply = ('callable', None)
+                else:
+                    reply = ('value', value)
+            except AttributeError as exc:
+                reply = ('missing', str(exc))
+            except Exception as exc:
+                reply = ('error', f"{type(exc).__name__}: {exc}")
+            try:
+                # the queue pickles on its feeder thread, where an error would leave the worker waiting forever
+                pickle.dumps(reply)
+            except Exception as exc:
+                reply = ('error', f"The result of tello.{name} can not be sent to a handler process: "
+                                  f"{type(exc).__name__}: {exc}")
+            self._reply_queues[worker_index].put((call_id,) + reply)
@@ -0,0 +1,94 @@
+import importlib.util
+import logging
+import os
+import sys
+import time
+
+LOGGER = logging.getLogger()
+
+# seconds between checks of the handler file
+DEFAULT_CHECK_INTERVAL = 0.5
+
+
+class HandlerReloader:
+    """
+    Watches the file of a handler module and loads the new version when the file changes.
+
+    The new version is executed in a fresh module object, instead of importlib.reload, so a
+    version that fails to import leaves the running module and its globals untouched.  It only
+    replaces the running version in sys.modules when install() is called.
+    """
+
+    def __init__(self, module, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        """
+
+        :param module: the imported handler module
+        :param check_interval: seconds between checks of the file modification time
+        """
+        self.module = module
+        self.name = module.__name__
+        self.path = module.__file__
+        self.check_interval = check_interval
+        self._last_check = time.monotonic()
+        self._signature = self._file_signature()
+
+        self.reload_count = 0
+        self.failed_count = 0
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # e.g. the editor is replacing the file right now
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        """
+        :return: True if the file changed since the last load.  Looks at the file at most once per check_interval.
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        signature = self._file_signature()
+        return signature is not None and signature != self._signature
+
+    def load(self):
+        """
+        Execute the current version of the file in a new module object.
+
+        :return: the new module, not installed yet
+        :raises Exception: whatever importing the file raised
+        """
+        # a failed version is not tried again until the file changes again
+        self._signature = self._file_signature()
+        try:
+            spec = importlib.util.spec_from_file_location(self.name, self.path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except BaseException:
+            self.failed_count += 1
+            raise
+        return module
+
+    def install(self, module):
+        """
+        Make module the running version.
+        """
+        sys.modules[self.name] = module
+        self.module = module
+        self.reload_count += 1
+
+    def reject(self):
+        """
+        Count a loaded version that was not installed, e.g. because its init method failed.
+        """
+        self.failed_count += 1
+
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'reloads': self.reload_count,
+            'failed': self.failed_count
+        }
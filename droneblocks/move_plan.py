@@ -0,0 +1,268 @@
+"""
+Deferred execution of fly_* calls.
+
+Every blocking move command costs a round trip plus the time the drone needs to
+speed up, slow down and settle, so a block program with many small moves spends
+most of its time between moves.  A MovePlan records the moves first and compiles
+them into fewer SDK commands:
+
+    - consecutive moves in the same direction are added up:  up 20, up 30  ->  up 50
+    - with allow_diagonal, any consecutive translations are added up into one
+      'go x y z speed':  forward 50, left 30, up 20  ->  go 50 30 20 speed.
+      This changes the flight path from an L shape to a straight line, so it has to be asked for.
+    - moves outside the SDK limits of 500cm are split into equal parts
+    - curves are never merged, they end a group of moves
+
+Axes follow the Tello 'go' command: x forward, y left, z up.
+"""
+import math
+from droneblocksutils.exceptions import MovePlanError
+
+MIN_MOVE_DISTANCE = 20
+MAX_MOVE_DISTANCE = 500
+MIN_GO_SPEED = 10
+MAX_GO_SPEED = 100
+
+# speed of fly_to_xyz and fly_curve, and of go commands built from merged moves
+DEFAULT_GO_SPEED = 50
+
+# rough time a blocking move spends on the round trip, speeding up, slowing down and settling
+ESTIMATED_COMMAND_OVERHEAD = 1.0
+
+# (axis index, sign) -> Tello move method
+_MOVE_METHODS = {
+    (0, 1): 'move_forward',
+    (0, -1): 'move_back',
+    (1, 1): 'move_left',
+    (1, -1): 'move_right',
+    (2, 1): 'move_up',
+    (2, -1): 'move_down',
+}
+
+_MOVE_SDK_COMMANDS = {
+    'move_forward': 'forward',
+    'move_back': 'back',
+    'move_left': 'left',
+    'move_right': 'right',
+    'move_up': 'up',
+    'move_down': 'down',
+}
+
+
+class PlannedMove:
+    """
+    One recorded fly_* call.
+
+    kind 'move' is a translation by vector with the move speed ( speed None ) or with go speed.
+    kind 'curve' is a curve through point1 to point2.
+    """
+    __slots__ = ('kind', 'vector', 'point1', 'speed')
+
+    def __init__(self, kind: str, vector, speed: int = None, point1=None):
+        self.kind = kind
+        self.vector = tuple(vector)
+        self.point1 = tuple(point1) if point1 is not None else None
+        self.speed = speed
+
+    def __repr__(self):
+        if self.kind == 'curve':
+            return f"PlannedMove(curve {self.point1} {self.vector} {self.speed})"
+        return f"PlannedMove(move {self.vector} {self.speed})"
+
+
+class MovePlan:
+    """
+    Records moves and compiles them into a list of Tello method calls.
+
+    :param allow_diagonal: True - merge any consecutive translations into one go command.
+                           False - only merge moves in the same direction.
+    :param move_speed: speed ( cm/s ) of move_up, move_forward, ... used for the time estimate
+    """
+
+    def __init__(self, allow_diagonal: bool = False, move_speed: int = DEFAULT_GO_SPEED):
+        self.allow_diagonal = allow_diagonal
+        self.move_speed = move_speed
+        self.steps = []
+
+    def __len__(self):
+        return len(self.steps)
+
+    # -------------------------------------------------------------- recording
+    def add_move(self, dx, dy, dz, speed: int = None):
+        """
+        :param speed: None for a move_* command, the go speed for a go command
+        """
+        self.steps.append(PlannedMove('move', (dx, dy, dz), speed=speed))
+
+    def add_curve(self, x1, y1, z1, x2, y2, z2, speed: int = DEFAULT_GO_SPEED):
+        self.steps.append(PlannedMove('curve', (x2, y2, z2), speed=speed, point1=(x1, y1, z1)))
+
+    # -------------------------------------------------------------- compiling
+    def compile(self) -> list:
+        """
+        :return: list of (method name, args) tuples to call on the Tello
+        :raises MovePlanError: if a move can not be sent within the SDK limits
+        """
+        commands = []
+        errors = []
+        group = []
+        for step in self.steps:
+            if step.kind == 'curve':
+                self._compile_group(group, commands, errors)
+                group = []
+                commands.append(('curve_xyz_speed', tuple(int(v) for v in step.point1 + step.vector) + (step.speed,)))
+            elif not group or self._can_merge(group, step):
+                group.append(step)
+            else:
+                self._compile_group(group, commands, errors)
+                group = [step]
+        self._compile_group(group, commands, errors)
+
+        if errors:
+            raise MovePlanError(f"Move plan has {len(errors)} move(s) outside the SDK limits: {'; '.join(errors)}",
+                                errors=errors)
+        return commands
+
+    def _can_merge(self, group: list, step: PlannedMove) -> bool:
+        if self.allow_diagonal:
+            return True
+        # same direction: the cross product is zero and the dot product is positive
+        net = _vector_sum(group)
+        v = step.vector
+        cross = (net[1] * v[2] - net[2] * v[1], net[2] * v[0] - net[0] * v[2], net[0] * v[1] - net[1] * v[0])
+        dot = net[0] * v[0] + net[1] * v[1] + net[2] * v[2]
+        return cross == (0, 0, 0) and dot > 0
+
+    def _compile_group(self, group: list, commands: list, errors: list):
+        if not group:
+            return
+
+        merged = _translation_commands(_vector_sum(group), _group_speed(group))
+        merged_errors = _validate(merged)
+        if not merged_errors or len(group) == 1:
+            errors.extend(merged_errors)
+            commands.extend(merged)
+            return
+
+        # the merged move is not valid ( e.g. a go with every axis below 20cm ),
+        # send the moves one by one instead
+        for step in group:
+            step_commands = _translation_commands(step.vector, step.speed)
+            invalid = _validate(step_commands)
+            if invalid:
+                errors.extend(invalid)
+            commands.extend(step_commands)
+
+    # -------------------------------------------------------------- reporting
+    def estimate_time(self, commands: list) -> float:
+        """
+        :return: rough number of seconds the commands take to fly
+        """
+        total = 0.0
+        for method, args in commands:
+            total += ESTIMATED_COMMAND_OVERHEAD
+            if method == 'go_xyz_speed':
+                total += math.sqrt(args[0] ** 2 + args[1] ** 2 + args[2] ** 2) / args[3]
+            elif method == 'curve_xyz_speed':
+                x1, y1, z1, x2, y2, z2, speed = args
+                length = math.sqrt(x1 ** 2 + y1 ** 2 + z1 ** 2) + \
+                    math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2 + (z2 - z1) ** 2)
+                total += length / speed
+            else:
+                total += args[0] / max(self.move_speed, 1)
+        return total
+
+    def _original_commands(self) -> list:
+        commands = []
+        for step in self.steps:
+            if step.kind == 'curve':
+                commands.append(('curve_xyz_speed', tuple(step.point1 + step.vector) + (step.speed,)))
+            elif step.speed is None:
+                axis, value = next(((axis, value) for axis, value in enumerate(step.vector) if value), (0, 0))
+                commands.append((_MOVE_METHODS[(axis, 1 if value >= 0 else -1)], (abs(value),)))
+            else:
+                commands.append(('go_xyz_speed', tuple(step.vector) + (step.speed,)))
+        return commands
+
+    def report(self, commands: list) -> dict:
+        """
+        :param commands: result of compile()
+        :return: dict with the number of recorded and compiled commands, commands saved,
+                 estimated flight times and the compiled SDK commands
+        """
+        original_commands = self._original_commands()
+        original_time = self.estimate_time(original_commands)
+        estimated_time = self.estimate_time(commands)
+        return {
+            'original_commands': len(original_commands),
+            'compiled_commands': len(commands),
+            'commands_saved': len(original_commands) - len(commands),
+            'estimated_original_time': round(original_time, 2),
+            'estimated_time': round(estimated_time, 2),
+            'estimated_time_saved': round(original_time - estimated_time, 2),
+            'commands': [sdk_command(method, args) for method, args in commands]
+        }
+
+
+def sdk_command(method: str, args: tuple) -> str:
+    """
+    :return: the SDK command a compiled (method, args) tuple sends, e.g. 'up 50' or 'go 50 30 20 50'
+    """
+    if method in _MOVE_SDK_COMMANDS:
+        return f"{_MOVE_SDK_COMMANDS[method]} {args[0]}"
+    if method == 'go_xyz_speed':
+        return "go {} {} {} {}".format(*args)
+    return "curve {} {} {} {} {} {} {}".format(*args)
+
+
+def _vector_sum(steps: list) -> tuple:
+    return (sum(step.vector[0] for step in steps),
+            sum(step.vector[1] for step in steps),
+            sum(step.vector[2] for step in steps))
+
+
+def _group_speed(steps: list):
+    # a group of plain moves stays a move command, if any step was a go, use the go speed
+    speeds = [step.speed for step in steps if step.speed is not None]
+    return min(speeds) if speeds else None
+
+
+def _split(value: int, parts: int) -> list:
+    # split value into parts integers that add up to value and differ by at most 1
+    sign = 1 if value >= 0 else -1
+    quotient, remainder = divmod(abs(value), parts)
+    return [sign * (quotient + (1 if i < remainder else 0)) for i in range(parts)]
+
+
+def _translation_commands(vector, speed) -> list:
+    vector = tuple(int(round(v)) for v in vector)
+    axes = [axis for axis, value in enumerate(vector) if value != 0]
+    if not axes:
+        return []
+
+    parts = max(1, math.ceil(max(abs(value) for value in vector) / MAX_MOVE_DISTANCE))
+    if len(axes) == 1 and speed is None:
+        axis = axes[0]
+        method = _MOVE_METHODS[(axis, 1 if vector[axis] > 0 else -1)]
+        return [(method, (abs(distance),)) for distance in _split(vector[axis], parts)]
+
+    speed = DEFAULT_GO_SPEED if speed is None else int(speed)
+    pieces = zip(*[_split(value, parts) for value in vector])
+    return [('go_xyz_speed', (x, y, z, speed)) for x, y, z in pieces]
+
+
+def _validate(commands: list) -> list:
+    """
+    :return: list of error messages, empty if every command is within the SDK limits
+    """
+    errors = []
+    for method, args in commands:
+        if method == 'go_xyz_speed':
+            x, y, z, speed = args
+            if max(abs(x), abs(y), abs(z)) < MIN_MOVE_DISTANCE:
+                errors.append(f"{sdk_command(method, args)}: at least one axis must be {MIN_MOVE_DISTANCE}cm or more")
+            if not MIN_GO_SPEED <= speed <= MAX_GO_SPEED:
+                errors.append(f"{sdk_command(method, args)}: speed must be {MIN_GO_SPEED}-{MAX_GO_SPEED}")
+        elif not MIN_MOVE_DISTANCE <= args[0] <= MAX_MOVE_DISTANCE:
+            errors.append(f"{sdk_command(method, args)}: distance must be {MIN_MOVE_DISTANCE}-{MAX_MOVE_DISTANCE}cm")
+    return errors
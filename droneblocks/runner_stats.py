@@ -0,0 +1,128 @@
+import threading
+import time
+import numpy as np
+
+# number of most recent samples the percentiles are computed from
+DEFAULT_WINDOW = 256
+
+# seconds of history used for the FPS
+FPS_WINDOW = 2.0
+
+
+class RollingTimer:
+    """
+    Durations of the most recent calls of one runner stage in a fixed size ring,
+    plus a ring of completion times for the calls per second.
+
+    record() only writes two array slots, the percentiles are computed when
+    somebody asks for them.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._durations = np.zeros(window, dtype=np.float64)
+        self._completions = np.zeros(window, dtype=np.float64)
+        self._index = 0
+        self.count = 0
+
+    def record(self, seconds: float, now: float = None):
+        index = self._index
+        self._durations[index] = seconds
+        self._completions[index] = time.monotonic() if now is None else now
+        self._index = (index + 1) % len(self._durations)
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        filled = min(self.count, len(self._durations))
+        if filled == 0:
+            return {'count': 0, 'fps': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0}
+
+        durations = self._durations[:filled] * 1000
+        p50, p95, p99 = np.percentile(durations, (50, 95, 99))
+        recent = np.count_nonzero(self._completions[:filled] >= time.monotonic() - FPS_WINDOW)
+        return {
+            'count': self.count,
+            'fps': round(recent / FPS_WINDOW, 1),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2)
+        }
+
+
+class RunnerStats:
+    """
+    Timing of every stage of tello_script_runner: acquire ( reading the frame from the
+    Tello ), resize, handler, handoff ( to the display loop ) and display ( cv2.imshow ),
+    plus drop counters.
+
+    Stages record their own durations:
+
+        started = time.perf_counter()
+        frame = frame_read.frame
+        runner_stats.record('acquire', time.perf_counter() - started)
+
+    Drop counters are read from their owners, e.g. the frame mailbox, when a snapshot is taken.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self._timers = {}
+        self._counter_sources = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        timer = self._timers.get(stage)
+        if timer is None:
+            with self._lock:
+                timer = self._timers.setdefault(stage, RollingTimer(self.window))
+        timer.record(seconds)
+
+    def add_counter_source(self, name: str, function):
+        """
+        :param function: called without arguments when a snapshot is taken, returns a number or a dict
+        """
+        self._counter_sources[name] = function
+
+    def remove_counter_source(self, name: str):
+        self._counter_sources.pop(name, None)
+
+    def reset(self):
+        with self._lock:
+            self._timers = {}
+
+    def snapshot(self) -> dict:
+        """
+        :return: {'stages': {stage: {count, fps, p50_ms, p95_ms, p99_ms}}, 'counters': {name: value}}
+        """
+        with self._lock:
+            timers = dict(self._timers)
+        counters = {}
+        for name, function in list(self._counter_sources.items()):
+            try:
+                counters[name] = function()
+            except Exception as exc:
+                counters[name] = f"error: {exc}"
+        return {
+            'stages': {stage: timer.snapshot() for stage, timer in timers.items()},
+            'counters': counters
+        }
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        stages = " | ".join(f"{stage} {s['fps']}fps p50 {s['p50_ms']}ms p95 {s['p95_ms']}ms p99 {s['p99_ms']}ms"
+                            for stage, s in snapshot['stages'].items())
+        counters = " ".join(f"{name}={value}" for name, value in snapshot['counters'].items())
+        return f"{stages} | {counters}" if counters else stages
+
+    def draw_overlay(self, frame, origin=(10, 20), line_height: int = 18):
+        """
+        Write the stage FPS and p95 time on frame, in place.
+        """
+        # cv2 is only needed when an overlay is asked for
+        import cv2
+
+        x, y = origin
+        for stage, s in self.snapshot()['stages'].items():
+            cv2.putText(frame, f"{stage}: {s['fps']} fps  p95 {s['p95_ms']} ms", (x, y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 255), 1, cv2.LINE_AA)
+            y += line_height
+        return frame
@@ -0,0 +1,79 @@
+import threading
+import time
+
+# ttl value meaning the response never changes during a session and is kept
+# until the cache is invalidated, e.g. by connect()
+SESSION_TTL = None
+
+# key of the centimeter value get_controller_tof caches.  Not 'EXT tof?', because
+# send_read_command caches the raw 'tof 345' response under the command itself.
+CONTROLLER_TOF_KEY = 'controller tof cm'
+
+# Time to live, in seconds, for the Tello read commands DroneBlocksTello caches.
+# Commands that are not listed are never cached.
+DEFAULT_QUERY_TTLS = {
+    'hardware?': SESSION_TTL,
+    'sdk?': SESSION_TTL,
+    'sn?': SESSION_TTL,
+    'speed?': 1.0,
+    'EXT tof?': 0.1,
+    CONTROLLER_TOF_KEY: 0.1
+}
+
+
+class TelloQueryCache:
+    """
+    Read-through cache for Tello read command responses with a time to live per key.
+
+    Any object with the same get/put/invalidate methods can be given to
+    DroneBlocksTello(query_cache=...) to replace it.
+    """
+
+    def __init__(self, ttls: dict = None):
+        """
+
+        :param ttls: dict of command to time to live in seconds. SESSION_TTL (None) caches the
+                     value until invalidated.  Defaults to DEFAULT_QUERY_TTLS
+        :type ttls: dict
+        """
+        self.ttls = dict(DEFAULT_QUERY_TTLS if ttls is None else ttls)
+        self._lock = threading.Lock()
+        # key -> (expire time or None, value)
+        self._entries = {}
+
+    def is_cacheable(self, key: str) -> bool:
+        return key in self.ttls
+
+    def get(self, key: str):
+        """
+        :return: the cached value, or None when there is no fresh value for the key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires is not None and time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key: str, value):
+        if key not in self.ttls or value is None:
+            return
+
+        ttl = self.ttls[key]
+        expires = None if ttl is SESSION_TTL else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires, value)
+
+    def invalidate(self, key: str = None):
+        """
+        Remove one key, or every key when key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._entries = {}
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,166 @@
+import bisect
+import threading
+import time
+
+# upper bounds, in milliseconds, of the round trip latency buckets.
+# Anything slower than the last bound lands in the final overflow bucket.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def command_verb(command: str) -> str:
+    """
+    Reduce a Tello SDK command to the verb used to group metrics.
+
+    'go 50 0 0 30'          -> 'go'
+    'speed?'                -> 'speed?'
+    'EXT tof?'              -> 'EXT tof?'
+    'EXT mled g 000b...'    -> 'EXT mled g'
+    'EXT led br 2.5 255 0 0' -> 'EXT led br'
+    'EXT led 255 0 0'       -> 'EXT led'
+    """
+    parts = command.split(' ', 3)
+    if parts[0] != 'EXT' or len(parts) == 1:
+        return parts[0]
+
+    verb = f"EXT {parts[1]}"
+    # mled and led have sub modes ( g, s, sl, br, bl, ... ) that behave very
+    # differently, so keep the sub mode but drop the arguments
+    if parts[1] in ('mled', 'led') and len(parts) > 2 and parts[2].isalpha():
+        verb = f"{verb} {parts[2]}"
+    return verb
+
+
+class CommandLatencyHistogram:
+    """
+    Fixed bucket histogram of round trip latencies for one command verb.
+    """
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = None
+
+    def record(self, latency_ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        if self.min_ms is None or latency_ms < self.min_ms:
+            self.min_ms = latency_ms
+        if self.max_ms is None or latency_ms > self.max_ms:
+            self.max_ms = latency_ms
+
+    def snapshot(self) -> dict:
+        return {
+            'buckets_ms': list(self.buckets_ms),
+            'counts': list(self.counts),
+            'count': self.count,
+            'total_ms': self.total_ms,
+            'mean_ms': self.total_ms / self.count if self.count else None,
+            'min_ms': self.min_ms,
+            'max_ms': self.max_ms
+        }
+
+
+class _VerbMetrics:
+    def __init__(self, buckets_ms):
+        self.sent = 0
+        self.responses = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.filtered_responses = 0
+        self.last_send_time = None
+        self.last_response_time = None
+        self.latency = CommandLatencyHistogram(buckets_ms)
+
+    def snapshot(self) -> dict:
+        return {
+            'sent': self.sent,
+            'responses': self.responses,
+            'timeouts': self.timeouts,
+            'retries': self.retries,
+            'filtered_responses': self.filtered_responses,
+            'last_send_time': self.last_send_time,
+            'last_response_time': self.last_response_time,
+            'latency': self.latency.snapshot()
+        }
+
+
+class CommandMetrics:
+    """
+    Thread safe collection of per command verb round trip metrics.
+
+    Times are recorded with time.time() for the send/response timestamps
+    and time.perf_counter() for the latency measurement.
+    """
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, command: str) -> _VerbMetrics:
+        verb = command_verb(command)
+        metrics = self._metrics.get(verb)
+        if metrics is None:
+            metrics = self._metrics[verb] = _VerbMetrics(self.buckets_ms)
+        return metrics
+
+    def record_send(self, command: str) -> float:
+        """
+        Record that command was sent.
+        :return: perf_counter value to hand back to record_response or record_timeout
+        """
+        with self._lock:
+            metrics = self._get(command)
+            metrics.sent += 1
+            metrics.last_send_time = time.time()
+        return time.perf_counter()
+
+    def record_response(self, command: str, sent_at: float):
+        latency_ms = (time.perf_counter() - sent_at) * 1000
+        with self._lock:
+            metrics = self._get(command)
+            metrics.responses += 1
+            metrics.last_response_time = time.time()
+            metrics.latency.record(latency_ms)
+
+    def record_timeout(self, command: str, sent_at: float = None):
+        with self._lock:
+            self._get(command).timeouts += 1
+
+    def record_retry(self, command: str):
+        with self._lock:
+            self._get(command).retries += 1
+
+    def record_filtered_response(self, command: str):
+        with self._lock:
+            self._get(command).filtered_responses += 1
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict of command verb to a dict of counters and the latency histogram
+        """
+        with self._lock:
+            return {verb: metrics.snapshot() for verb, metrics in self._metrics.items()}
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+
+    def summary(self) -> str:
+        """
+        :return: one line per command verb, sorted by total round trip time, largest first
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for verb, metrics in sorted(snapshot.items(), key=lambda item: item[1]['latency']['total_ms'],
+                                    reverse=True):
+            latency = metrics['latency']
+            mean_ms = f"{latency['mean_ms']:.1f}" if latency['mean_ms'] is not None else '--'
+            lines.append(f"{verb:<14} sent: {metrics['sent']:<5} total: {latency['total_ms']:.0f}ms "
+                         f"mean: {mean_ms}ms timeouts: {metrics['timeouts']} retries: {metrics['retries']} "
+                         f"filtered: {metrics['filtered_responses']}")
+        return "\n".join(lines)
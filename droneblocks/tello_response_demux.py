@@ -0,0 +1,223 @@
+import collections
+import threading
+import time
+
+# Expected shape of the reply to a command, see reply_matches
+ACK_REPLY = 'ack'  # control and expansion commands, 'ok', 'led ok'
+VALUE_REPLY = 'value'  # read commands, 'speed?' -> '100.0'
+TOF_REPLY = 'tof'  # 'EXT tof?' -> 'tof 345'
+
+# how long, in seconds, a command that timed out keeps its place in line so its
+# late reply is discarded instead of being handed to the next command
+STALE_REPLY_GRACE = 1.0
+
+# size of the ring buffer of responses that have not been matched yet
+RESPONSE_RING_SIZE = 16
+
+
+def expected_reply_shape(command: str) -> str:
+    if command == 'EXT tof?':
+        return TOF_REPLY
+    if command.endswith('?'):
+        return VALUE_REPLY
+    return ACK_REPLY
+
+
+def _is_ack(lower: bytes) -> bool:
+    # 'ok', 'led ok', 'matrix ok'
+    return lower == b'ok' or lower.endswith(b' ok')
+
+
+def _is_error(lower: bytes) -> bool:
+    # 'error', 'error Not joystick', 'out of range', 'unknown command: mled'
+    return lower.startswith(b'unknown command') or b'error' in lower or b'out of range' in lower
+
+
+def _is_value(lower: bytes) -> bool:
+    # '100.0', '-2', 'tof 345', '801mm', 'pitch:0;roll:0;yaw:0;', '63~65C'
+    return lower[:1].isdigit() or lower[:1] == b'-' or lower.startswith(b'tof') or b':' in lower \
+        or b'~' in lower
+
+
+def reply_matches(shape: str, response: bytes) -> bool:
+    """
+    False only when the response clearly has the shape of the answer to a different
+    kind of command, e.g. a value for a control command or 'ok' for a read command.
+    Anything else, like 'error', 'out of range' or 'unknown command: ...', can answer
+    any command.
+    """
+    lower = response.lower()
+    # checked first, 'unknown command: mled' would look like a 'key:value' reply
+    if _is_error(lower):
+        return True
+    if shape == ACK_REPLY:
+        return not _is_value(lower)
+    if shape == VALUE_REPLY:
+        return not _is_ack(lower)
+    return lower.startswith(b'tof') or not (_is_ack(lower) or _is_value(lower))
+
+
+class PendingCommand:
+    __slots__ = ('seq', 'command', 'shape', 'response', 'stale_until')
+
+    def __init__(self, seq: int, command: str):
+        self.seq = seq
+        self.command = command
+        self.shape = expected_reply_shape(command)
+        self.response = None
+        # set when the command timed out, see STALE_REPLY_GRACE
+        self.stale_until = None
+
+
+class TelloResponseDemux:
+    """
+    Matches the responses from one Tello address to the commands that are
+    waiting for them.
+
+    The djitellopy receiver thread calls append() with every datagram from
+    the drone.  Keepalive noise is dropped on the raw bytes, everything else
+    goes into a bounded ring buffer and is handed, in order, to the oldest
+    outstanding command whose expected reply shape it matches.
+
+    Every command gets a sequence number and every response is tagged with the
+    newest sequence number at the time it arrived, so a response that arrived
+    before a command was sent can never be its answer.  Commands that time out
+    stay in line for STALE_REPLY_GRACE seconds so their late reply is
+    discarded instead of answering the next command.
+    """
+
+    def __init__(self, ignore_responses=(), ring_size: int = RESPONSE_RING_SIZE,
+                 stale_reply_grace: float = STALE_REPLY_GRACE, on_filtered=None):
+        """
+
+        :param ignore_responses: list of response strings that are never an answer, e.g. TELLO_IGNORE_RESPONSES
+        :param ring_size: maximum number of unmatched responses to hold
+        :param stale_reply_grace: seconds to wait for the late reply of a command that timed out
+        :param on_filtered: called with the command string of the oldest outstanding command when a response is
+                            filtered as keepalive noise
+        """
+        self.ignore_responses = tuple(r.encode('utf-8') for r in ignore_responses)
+        self.stale_reply_grace = stale_reply_grace
+        self.on_filtered = on_filtered
+        self._condition = threading.Condition()
+        self._ring = collections.deque(maxlen=ring_size)
+        self._outstanding = collections.deque()
+        self._seq = 0
+
+        self.filtered_count = 0
+        self.stale_count = 0
+        self.mismatched_count = 0
+
+    def append(self, data: bytes) -> None:
+        """
+        Called by the djitellopy response receiver thread for every datagram.
+        """
+        data = data.rstrip(b'\r\n')
+        if data in self.ignore_responses:
+            with self._condition:
+                self.filtered_count += 1
+                command = self._outstanding[0].command if self._outstanding else None
+            if command is not None and self.on_filtered is not None:
+                self.on_filtered(command)
+            return
+
+        with self._condition:
+            self._ring.append((self._seq, data))
+            self._match()
+            self._condition.notify_all()
+
+    def register(self, command: str) -> PendingCommand:
+        """
+        Register command as outstanding.  Call right before sending it.
+        """
+        with self._condition:
+            self._seq += 1
+            pending = PendingCommand(self._seq, command)
+            self._outstanding.append(pending)
+            return pending
+
+    def wait(self, pending: PendingCommand, timeout: float):
+        """
+        Wait for the response to a registered command.
+
+        :return: raw response bytes, or None on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while pending.response is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    pending.stale_until = time.monotonic() + self.stale_reply_grace
+                    self._match()
+                    return None
+                self._condition.wait(remaining)
+            return pending.response
+
+    def _match(self):
+        # caller holds self._condition
+        now = time.monotonic()
+        while self._outstanding:
+            head = self._outstanding[0]
+            if head.stale_until is not None and now >= head.stale_until:
+                # gave up waiting for the late reply
+                self._outstanding.popleft()
+                continue
+
+            if not self._ring:
+                return
+
+            arrival_seq, response = self._ring[0]
+            if arrival_seq < head.seq:
+                # arrived before this command was sent
+                self._ring.popleft()
+                self.stale_count += 1
+                continue
+
+            if head.stale_until is not None:
+                self._outstanding.popleft()
+                retried = self._outstanding and self._outstanding[0].command == head.command
+                # a retry of the same command is happy with either reply
+                if not retried and reply_matches(head.shape, response):
+                    # late reply to a command that timed out
+                    self._ring.popleft()
+                    self.stale_count += 1
+                # otherwise assume the late reply was lost and
+                # offer the response to the next command
+                continue
+
+            if reply_matches(head.shape, response):
+                self._ring.popleft()
+                self._outstanding.popleft()
+                head.response = response
+            else:
+                self._ring.popleft()
+                self.mismatched_count += 1
+
+        # nothing is waiting, whatever is left can only be a stale reply
+        # and will be discarded by sequence number when the next command
+        # is registered
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {
+                'filtered': self.filtered_count,
+                'stale': self.stale_count,
+                'mismatched': self.mismatched_count,
+                'outstanding': len(self._outstanding),
+                'unmatched': len(self._ring)
+            }
+
+
+_demux_lock = threading.Lock()
+_demuxes = {}
+
+
+def response_demux_for(host: str, **kwargs) -> TelloResponseDemux:
+    """
+    :return: the TelloResponseDemux for the drone address, creating it on first use
+    """
+    with _demux_lock:
+        demux = _demuxes.get(host)
+        if demux is None:
+            demux = _demuxes[host] = TelloResponseDemux(**kwargs)
+        return demux
@@ -1,19 +1,25 @@
-import cv2
-from droneblocks.DroneBlocksTello import DroneBlocksTello
 import signal
 import sys
 import time
 import argparse
 import importlib
+import importlib.util
 import logging
-from imutils.video import VideoStream
-import imutils
 import threading
-import queue
 import traceback
+import os
 from droneblocks import tello_keyboard_mapper as keymapper
 from droneblocksutils.exceptions import LandException
-from droneblocks.tello_web import web_main
+from droneblocks.frame_mailbox import FrameMailbox
+from droneblocks.handler_pipeline import HandlerPipeline
+from droneblocks.frame_policy import FramePolicy, FrameStamper, POLICIES, NEWEST, MAX_LAG, EVERY_KTH, \
+    update_frame_lag
+from droneblocks.tick_scheduler import TickScheduler
+
+# cv2, numpy, imutils, djitellopy and bottle take most of the start up time of the runner.
+# They are imported where they are used, once the arguments tell that this run needs them,
+# e.g. bottle only with --tello-web and the OpenCV windows only with --display-video.
+# utils/import_time_benchmark.py checks that importing this module stays fast.
 
 FORMAT = '%(asctime)-15s %(levelname)-10s %(message)s'
 logging.basicConfig(format=FORMAT)
@@ -28,12 +34,16 @@ local_video_stream = None
 # Global flag used to communiate is the user_script requested to land
 user_script_requested_land = False
 
-# maximum number of
-MAX_VIDEO_Q_DEPTH = 10
+# same defaults as DroneBlocksTello, without importing djitellopy to parse the arguments
+DEFAULT_TELLO_HOST = '192.168.10.1'
+DEFAULT_TELLO_PORT = 8889
+
+# default maximum number of processed frames per second shown by the display loop
+DEFAULT_DISPLAY_FPS = 30
 
-# add a little delay to throttle the number of video frames
-# put into the video queue
-show_video_per_second = 0.3
+# how long the display loop waits for a new frame before it checks
+# the keyboard and the stop event again
+DISPLAY_IDLE_TIMEOUT = 0.05
 
 # This is hard coded because if the image gets too big then
 # the lag in the video stream gets very pronounced.  This is
@@ -42,6 +52,25 @@ show_video_per_second = 0.3
 IMAGE_WIDTH = 600
 IMAGE_HEIGHT = None
 
+# number of resize buffers kept by the handler thread.  One is filled by the handler,
+# one waits in the frame mailbox, one is being displayed and one is left for a handler
+# that keeps the previous frame.  A buffer is not reused while anything refers to it.
+FRAME_POOL_SIZE = 4
+
+# how long the handler thread waits before it checks for a new frame again,
+# when a handler pipeline is busy with the current one
+NEW_FRAME_POLL_INTERVAL = 0.005
+
+# seconds between the handler pipeline stage FPS log lines
+PIPELINE_STATS_INTERVAL = 5
+
+# calls per second of the handler when there is no video frame and --handler-hz is not set
+FRAMELESS_HANDLER_HZ = 20
+
+# --frame-policy defaults, see frame_policy.py
+DEFAULT_MAX_FRAME_LAG_MS = 250
+DEFAULT_EVERY_KTH_FRAME = 2
+
 TELLO_VIDEO_WINDOW_NAME = "User Tello Video"
 ORIGINAL_VIDEO_WINDOW_NAME = "Raw Tello Video"
 # TODO deprecate the keyboard cmd window
@@ -64,6 +93,19 @@ speed_y = 0
 speed_z = 0
 height = 0
 
+# timing of every runner stage ( acquire, resize, handler, handoff, display ), see get_runner_stats.
+# Created by main, because RunnerStats needs numpy.
+runner_stats = None
+
+# default seconds between the runner stats log lines
+DEFAULT_STATS_INTERVAL = 10
+
+# background video file writers by the frames they record, 'processed' and/or 'original', see --record
+video_recorders = {}
+
+# last frame handed to each video recorder, so a frame the reader returns twice is recorded once
+_last_recorded_frames = {}
+
 # global reference to the stop event.  Used in
 # signal handler for keyboard interrupts to
 # alert script management to stop
@@ -77,6 +119,18 @@ def signal_handler(sig, frame):
     sys.exit(-1)
 
 
+def get_runner_stats() -> dict:
+    """
+    Rolling p50/p95/p99 milliseconds and FPS of every runner stage and the drop counters.
+    Can be called from a handler, e.g. to show it in tello-web.
+
+    :return: {'stages': {stage: {count, fps, p50_ms, p95_ms, p99_ms}}, 'counters': {name: value}}
+    """
+    if runner_stats is None:
+        return {'stages': {}, 'counters': {}}
+    return runner_stats.snapshot()
+
+
 def shutdown_gracefully():
     print("Tello Script Runner Shutdown.......")
 
@@ -117,38 +171,212 @@ def shutdown_gracefully():
 tello_image = None
 
 
-def _get_video_frame(frame_read, vid_sim):
-    global IMAGE_HEIGHT
+def _read_video_frame(frame_read, vid_sim):
+    """
+    :return: the latest frame decoded from the Tello or webcam, not resized.  The frame
+             reader replaces this frame instead of writing into it, so it can be kept as a reference.
+    """
     f = None
     try:
         if frame_read:
             f = frame_read.frame
         elif vid_sim and local_video_stream:
             f = local_video_stream.read()
+    except Exception as exc:
+        LOGGER.error("Exception getting video frame")
+        LOGGER.error(f"{exc}")
+
+    return f
+
 
+def _resize_video_frame(f, frame_pool=None):
+    """
+    Resize to IMAGE_WIDTH, into a buffer of frame_pool if there is one.
+    """
+    global IMAGE_HEIGHT
+    try:
         if f is not None:
-            f = imutils.resize(f, width=IMAGE_WIDTH)
+            if frame_pool is not None:
+                f = frame_pool.resize(f, IMAGE_WIDTH)
+            else:
+                import imutils
+                f = imutils.resize(f, width=IMAGE_WIDTH)
             IMAGE_HEIGHT = f.shape[0]
 
     except Exception as exc:
-        LOGGER.error("Exception getting video frame")
+        LOGGER.error("Exception resizing video frame")
         LOGGER.error(f"{exc}")
+        f = None
 
     return f
 
 
-def process_tello_video_feed(handler_file, video_queue, stop_event, video_event, fly=False, tello_video_sim=False,
-                             display_tello_video=False):
+def _get_video_frame(frame_read, vid_sim, frame_pool=None):
+    return _resize_video_frame(_read_video_frame(frame_read, vid_sim), frame_pool)
+
+
+def _record_video_frame(kind, frame):
+    """
+    Hand a frame to the --record video recorder of kind, 'processed' or 'original'.
+    Never blocks, the recorder drops the frame when its encoder is behind.
+    """
+    recorder = video_recorders.get(kind)
+    if recorder is None or frame is None or _last_recorded_frames.get(kind) is frame:
+        return
+    _last_recorded_frames[kind] = frame
+    started = time.perf_counter()
+    recorder.submit(frame)
+    runner_stats.record(f"record_{kind}", time.perf_counter() - started)
+
+
+def _start_video_recorders(path, record_frames, fps):
+    """
+    :param path: video file, e.g. flight.mp4.  When both kinds of frames are recorded
+                 they go to flight_processed.mp4 and flight_original.mp4
+    :param record_frames: 'processed', 'original' or 'both'
+    :param fps: frame rate written in the files, 0 for the recorder default
+    """
+    from droneblocks.video_recorder import VideoRecorder, DEFAULT_RECORD_FPS, fourcc_for_path
+
+    fps = fps or DEFAULT_RECORD_FPS
+    kinds = ['processed', 'original'] if record_frames == 'both' else [record_frames]
+    for kind in kinds:
+        kind_path = path
+        if len(kinds) > 1:
+            root, ext = os.path.splitext(path)
+            kind_path = f"{root}_{kind}{ext}"
+        video_recorders[kind] = VideoRecorder(kind_path, fps=fps, fourcc=fourcc_for_path(kind_path)).start()
+        LOGGER.info(f"Recording {kind} video frames to {kind_path}")
+
+    runner_stats.add_counter_source('record_dropped', lambda: {kind: recorder.dropped_count
+                                                               for kind, recorder in video_recorders.items()})
+
+
+def _stop_video_recorders():
+    for kind, recorder in list(video_recorders.items()):
+        recorder.stop()
+        print(f"Recorded {recorder.recorded_count} {kind} video frames to {recorder.path}, "
+              f"dropped {recorder.dropped_count}")
+    video_recorders.clear()
+    _last_recorded_frames.clear()
+    runner_stats.remove_counter_source('record_dropped')
+
+
+def _run_handler_pool_step(handler_pool, frame_stamper, params, video_mailbox, video_event, frame_policy):
+    """
+    One iteration of the handler thread loop when the handler runs in worker processes:
+    publish the results that are ready, in frame order, then hand the next frame to a worker.
+
+    :param frame_stamper: FrameStamper of the video frames, None when the handler gets no frames
+
+    :return: True if a frame was handed to a worker, False if a call without a frame, None if no slot was free
+    """
+    global IMAGE_HEIGHT
+    from droneblocks.frame_pool import resized_shape, resize_into
+
+    for frame in handler_pool.completed():
+        _record_video_frame('processed', frame)
+        if frame is not None and video_mailbox and video_event.is_set():
+            started = time.perf_counter()
+            video_mailbox.put(frame)
+            runner_stats.record('handoff', time.perf_counter() - started)
+
+    # wait while every slot is in flight
+    slot = handler_pool.acquire_slot(timeout=DISPLAY_IDLE_TIMEOUT)
+    if slot is None:
+        return None
+
+    started = time.perf_counter()
+    raw_frame, stamp = frame_stamper.read() if frame_stamper is not None else (None, None)
+    if raw_frame is None:
+        params['frame_capture_time'] = None
+        # params are pickled later, by the queue feeder thread
+        handler_pool.submit(slot, dict(params), has_frame=False)
+        return False
+    resize_started = time.perf_counter()
+    runner_stats.record('acquire', resize_started - started)
+    _record_video_frame('original', raw_frame)
+
+    capture_time, is_new = frame_policy.acquire(raw_frame, stamp)
+    if not frame_policy.admit(capture_time, is_new):
+        # skipped by --frame-policy
+        handler_pool.release_slot(slot)
+        time.sleep(NEW_FRAME_POLL_INTERVAL)
+        return None
+    params['frame_capture_time'] = capture_time
+
+    # resize straight into the shared memory slot the worker reads
+    shape = resized_shape(raw_frame, IMAGE_WIDTH)
+    resize_into(raw_frame, handler_pool.input_buffer(slot, shape, raw_frame.dtype))
+    IMAGE_HEIGHT = shape[0]
+    runner_stats.record('resize', time.perf_counter() - resize_started)
+    handler_pool.submit(slot, dict(params), has_frame=True)
+    return True
+
+
+def _reload_handler_module(handler_reloader, use_stages, params):
+    """
+    Import the changed handler file and call the init method of the new version.
+
+    :param use_stages: True if the running version has STAGES.  Switching between a handler
+                       method and STAGES needs a restart of the runner.
+    :return: (handler, STAGES, stop) of the new version, or None when it failed to import,
+             or its init method raised, and the running version stays in place
+    """
+    try:
+        module = handler_reloader.load()
+    except Exception as exc:
+        traceback.print_exc()
+        print(f"Reloading {handler_reloader.path} failed, the running handler was kept: {exc}")
+        return None
+
+    try:
+        stages = getattr(module, 'STAGES', None)
+        if bool(stages) != use_stages:
+            raise ValueError("switching between a handler method and STAGES needs a restart of the runner")
+        handler_method = None if stages else getattr(module, 'handler')
+        stop_method = getattr(module, 'stop', None)
+        getattr(module, 'init')(tello, params)
+    except LandException:
+        raise
+    except Exception as exc:
+        handler_reloader.reject()
+        traceback.print_exc()
+        print(f"Reloading {handler_reloader.path} failed, the running handler was kept: {exc}")
+        return None
+
+    handler_reloader.install(module)
+    print(f"Reloaded handler {handler_reloader.path}")
+    return handler_method, stages, stop_method
+
+
+def process_tello_video_feed(handler_file, video_mailbox, stop_event, video_event, fly=False, tello_video_sim=False,
+                             display_tello_video=False, handler_processes=0, handler_hz=0, handler_module=None,
+                             watch_handler=False, frame_policy=None):
     """
 
     :param exit_event: Multiprocessing Event.  When set, this event indicates that the process should stop.
     :type exit_event:
-    :param video_queue: Thread Queue to send the video frame to
-    :type video_queue: threading.Queue
+    :param video_mailbox: Latest-wins mailbox to send the video frame to
+    :type video_mailbox: FrameMailbox
     :param stop_event: Thread Event to indicate if this thread function should stop
     :type stop_event: threading.Event
     :param video_event: threading.Event to indicate when the main loop is ready for video
     :type video_event: threading.Event
+    :param handler_processes: Number of worker processes to run the handler in.  0 runs it in this thread.
+    :type handler_processes: int
+    :param handler_hz: Maximum number of handler calls per second.  0 - call the handler for every frame,
+                       and FRAMELESS_HANDLER_HZ times per second when there is no frame.
+    :type handler_hz: float
+    :param handler_module: The handler module imported by main, so it is not imported again.
+    :type handler_module: module
+    :param watch_handler: Load a new version of the handler between frames when its file changes.
+    :type watch_handler: bool
+    :param frame_policy: Tags frames with their capture time and selects the frames the handler gets.
+                         Default: the newest frame for every call.
+    :type frame_policy: FramePolicy
+    :param display_tello_video: Read video frames and pass them to the handler, for the display or --record
+    :type display_tello_video: bool
     :param fly: Flag used to indicate whether the drone should fly.  False is useful when you just want see the video stream.
     :type fly: bool
     :param max_speed_limit: Maximum speed_param that the drone will send as a command.
@@ -157,19 +385,40 @@ def process_tello_video_feed(handler_file, video_queue, stop_event, video_event,
     :rtype:
     """
     global tello, local_video_stream, speed, user_script_requested_land
-    last_show_video_queue_put_time = 0
     handler_method = None
     stop_method = None
+    handler_pool = None
+    handler_pipeline = None
+    handler_reloader = None
+    frame_stamper = None
+    stages = None
+    if frame_policy is None:
+        frame_policy = FramePolicy()
+    runner_stats.add_counter_source('policy_skipped', lambda: frame_policy.skipped_lag_count +
+                                    frame_policy.skipped_kth_count)
+    # paces the handler at --handler-hz, with or without frames
+    handler_scheduler = TickScheduler(handler_hz, stop_event)
+    # paces handler calls without a frame when --handler-hz is not set
+    frameless_scheduler = TickScheduler(FRAMELESS_HANDLER_HZ, stop_event)
 
     try:
-        if handler_file:
+        if handler_file and handler_processes > 0:
+            from droneblocks.handler_process_pool import HandlerProcessPool
+
+            # every worker imports the handler and calls its init method
             handler_file = handler_file.replace(".py", "")
-            handler_module = importlib.import_module(handler_file)
+            handler_pool = HandlerProcessPool(handler_file, tello, handler_processes,
+                                              base_params={'fly_flag': fly}).start()
+
+        elif handler_file:
             if handler_module is None:
-                raise f"Could not locate handler file: {handler_file}"
+                handler_module = importlib.import_module(handler_file.replace(".py", ""))
 
             init_method = getattr(handler_module, 'init')
-            handler_method = getattr(handler_module, 'handler')
+            # a handler module either has a handler method, or a list of STAGES, see handler_pipeline.py
+            stages = getattr(handler_module, 'STAGES', None)
+            if not stages:
+                handler_method = getattr(handler_module, 'handler')
             stop_method = getattr(handler_module, 'stop', None)
 
             params = {}
@@ -178,8 +427,13 @@ def process_tello_video_feed(handler_file, video_queue, stop_event, video_event,
 
             init_method(tello, params)
 
+            if watch_handler:
+                from droneblocks.handler_reloader import HandlerReloader
+                handler_reloader = HandlerReloader(handler_module)
+                print(f"Watching {handler_reloader.path} for changes")
+
         frame_read = None
-        if tello and video_queue:
+        if tello and (video_mailbox or display_tello_video):
             # tello.streamon()
             frame_read = tello.get_frame_read()
 
@@ -189,43 +443,147 @@ def process_tello_video_feed(handler_file, video_queue, stop_event, video_event,
             tello.send_rc_control(0, 0, 0, 0)
 
         if tello_video_sim and local_video_stream is None:
+            from imutils.video import VideoStream
             local_video_stream = VideoStream(src=0).start()
             time.sleep(2)
 
+        # resize buffers, so reading a frame does not allocate a new array
+        frame_pool = None
+        if display_tello_video:
+            from droneblocks.frame_pool import FramePool, read_only_view
+            frame_pool = FramePool(FRAME_POOL_SIZE)
+            # frames are tagged with the time they were decoded, not the time the
+            # handler gets to them, so params['frame_lag_ms'] includes a slow handler
+            frame_stamper = FrameStamper(lambda: _read_video_frame(frame_read, tello_video_sim)).start()
+
+        def _publish_pipeline_frame(frame, frame_params):
+            _record_video_frame('processed', frame)
+            if frame is not None and video_mailbox and video_event.is_set():
+                video_mailbox.put(frame)
+
+        if stages:
+            handler_pipeline = HandlerPipeline(stages, tello, on_output=_publish_pipeline_frame,
+                                               stats=runner_stats).start()
+            runner_stats.add_counter_source('stage_dropped', lambda: {stage['stage']: stage['dropped']
+                                                                      for stage in handler_pipeline.get_stats()})
+            # a frame waiting in a stage queue, or being handled by a stage, refers to its
+            # pooled buffer, so the pool does not reuse it.  A frame a queue drops lets go
+            # of its buffer.  Room for every frame in flight, plus the mailbox and the display.
+            if frame_pool is not None:
+                frame_pool = FramePool(handler_pipeline.max_frames_in_flight + FRAME_POOL_SIZE)
+        last_pipeline_stats_time = time.monotonic()
+
         params = {}
         params['fly_flag'] = fly
         while not stop_event.isSet():
-            if display_tello_video:
-                frame = _get_video_frame(frame_read, tello_video_sim)
-            else:
-                frame = None
+            # sleeps until the next tick, if --handler-hz was set
+            handler_scheduler.wait()
             params['last_key_pressed'] = g_key_press_value
 
+            if handler_reloader is not None and handler_reloader.changed():
+                # between frames, so no handler call sees a mix of the old and the new version
+                reloaded = _reload_handler_module(handler_reloader, handler_pipeline is not None, params)
+                if reloaded is not None:
+                    handler_method, stages, stop_method = reloaded
+                    if handler_pipeline is not None:
+                        # frames still in the old stages are dropped
+                        handler_pipeline.stop()
+                        handler_pipeline = HandlerPipeline(stages, tello, on_output=_publish_pipeline_frame,
+                                                           stats=runner_stats).start()
+
+            if handler_pool is not None:
+                had_frame = _run_handler_pool_step(handler_pool, frame_stamper, params, video_mailbox, video_event,
+                                                   frame_policy)
+                if had_frame is False and not handler_hz:
+                    frameless_scheduler.wait()
+                continue
+
+            if handler_pipeline is not None:
+                handler_pipeline.check_error()
+                started = time.perf_counter()
+                raw_frame, stamp = frame_stamper.read() if frame_stamper is not None else (None, None)
+                if raw_frame is None:
+                    params['frame_capture_time'] = None
+                    handler_pipeline.submit(None, dict(params))
+                    if not handler_hz:
+                        frameless_scheduler.wait()
+                else:
+                    capture_time, is_new = frame_policy.acquire(raw_frame, stamp)
+                    if not is_new or not frame_policy.admit(capture_time, is_new):
+                        # the frame reader has not decoded a new frame yet, or --frame-policy skipped it
+                        stop_event.wait(NEW_FRAME_POLL_INTERVAL)
+                    else:
+                        resize_started = time.perf_counter()
+                        runner_stats.record('acquire', resize_started - started)
+                        _record_video_frame('original', raw_frame)
+                        frame = _resize_video_frame(raw_frame, frame_pool)
+                        runner_stats.record('resize', time.perf_counter() - resize_started)
+                        # every frame gets its own params, so stages can pass results on
+                        params['frame_capture_time'] = capture_time
+                        handler_pipeline.submit(frame, dict(params))
+
+                if time.monotonic() - last_pipeline_stats_time > PIPELINE_STATS_INTERVAL:
+                    last_pipeline_stats_time = time.monotonic()
+                    LOGGER.info(f"Handler stages: {handler_pipeline.summary()}")
+                continue
+
+            frame = None
+            if display_tello_video:
+                started = time.perf_counter()
+                raw_frame, stamp = frame_stamper.read()
+                if raw_frame is not None:
+                    resize_started = time.perf_counter()
+                    _record_video_frame('original', raw_frame)
+                    capture_time, is_new = frame_policy.acquire(raw_frame, stamp)
+                    if not frame_policy.admit(capture_time, is_new):
+                        # skipped by --frame-policy, wait for the next frame
+                        stop_event.wait(NEW_FRAME_POLL_INTERVAL)
+                        continue
+                    frame = _resize_video_frame(raw_frame, frame_pool)
+                    if frame is not None:
+                        runner_stats.record('acquire', resize_started - started)
+                        runner_stats.record('resize', time.perf_counter() - resize_started)
+                        params['frame_capture_time'] = capture_time
+
             # if we have no frame, just call handler_method and re-loop
             # no need to process video frames
             if frame is None:
                 # LOGGER.debug("Failed to read video frame")
                 if handler_method:
+                    params['frame_capture_time'] = None
+                    update_frame_lag(params)
+                    started = time.perf_counter()
                     handler_method(tello, frame, params)
+                    runner_stats.record('handler', time.perf_counter() - started)
+                # without a frame nothing slows this loop down
+                if not handler_hz:
+                    frameless_scheduler.wait()
                 continue
 
             # if you get here, then you had a video frame
-            # to process
-            original_frame = frame.copy()
+            # to process.
+            # The handler gets the resized frame from the pool and never sees
+            # raw_frame, so the original does not have to be copied.  The
+            # 'Raw Tello Video' window reads its own frames in the display loop.
+            original_frame = read_only_view(raw_frame)
 
             if handler_method:
+                # how old the frame is now, so the handler can refuse to act on a stale frame
+                update_frame_lag(params)
+                started = time.perf_counter()
                 rtn_frame = handler_method(tello, frame, params)
+                runner_stats.record('handler', time.perf_counter() - started)
                 if rtn_frame is not None:
                     frame = rtn_frame
 
-            # send frame to other processes
-            if video_queue and video_event.is_set():
-                try:
-                    if time.time() - last_show_video_queue_put_time > show_video_per_second:
-                        last_show_video_queue_put_time = time.time()
-                        video_queue.put_nowait([frame, original_frame])
-                except:
-                    pass
+            _record_video_frame('processed', frame)
+
+            # send frame to the display loop
+            # an unread frame is replaced, so the display always shows the newest frame
+            if video_mailbox and video_event.is_set():
+                started = time.perf_counter()
+                video_mailbox.put(frame, original_frame)
+                runner_stats.record('handoff', time.perf_counter() - started)
 
     except LandException:
         print(f"User script requested landing")
@@ -240,7 +598,29 @@ def process_tello_video_feed(handler_file, video_queue, stop_event, video_event,
         # then the user has requested that we land and we should not process this thread
         # any longer.
         # to be safe... stop all movement
-        if handler_method is not None:
+        if handler_pool is not None:
+            if fly:
+                tello.send_rc_control(0, 0, 0, 0)
+            # the workers call the stop method of the handler
+            handler_pool.stop()
+            LOGGER.info(f"Handler processes: {handler_pool.get_stats()}")
+
+        if handler_pipeline is not None:
+            handler_pipeline.stop()
+            LOGGER.info(f"Handler stages: {handler_pipeline.summary()}")
+
+        if handler_hz:
+            LOGGER.info(f"Handler ticks: {handler_scheduler.get_stats()}")
+
+        if handler_reloader is not None:
+            LOGGER.info(f"Handler reloads: {handler_reloader.get_stats()}")
+
+        if frame_stamper is not None:
+            frame_stamper.stop()
+
+        LOGGER.info(f"Frame policy: {frame_policy.get_stats()}")
+
+        if handler_method is not None or handler_pipeline is not None:
             if fly:
                 tello.send_rc_control(0, 0, 0, 0)
 
@@ -266,6 +646,7 @@ def main():
     global speed
     global tello
     global g_stop_event
+    global runner_stats
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
@@ -273,9 +654,33 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--test-install", action='store_true', help="Test the command can run, then exit and do nothing. ")
     ap.add_argument("--display-video", action='store_true', help="Display Drone video using OpenCV.")
+    ap.add_argument("--display-fps", required=False, default=DEFAULT_DISPLAY_FPS, type=float,
+                    help=f"Maximum number of processed frames per second to display, 0 for no limit.  Default: {DEFAULT_DISPLAY_FPS}")
 
     ap.add_argument("--handler", type=str, required=False, default="",
                     help="Name of the python file with an init and handler method.  Do not include the .py extension and it has to be in the same folder as this main driver")
+    ap.add_argument("--stats-interval", required=False, default=DEFAULT_STATS_INTERVAL, type=float,
+                    help=f"Seconds between log lines with the timing of every runner stage, shown with -i or -v.  0 to turn off.  Default: {DEFAULT_STATS_INTERVAL}")
+    ap.add_argument("--stats-overlay", action='store_true',
+                    help="Write the FPS and p95 time of every runner stage on the displayed video.  Default: False")
+    ap.add_argument("--handler-hz", required=False, default=0, type=float,
+                    help=f"Maximum number of handler calls per second, with or without video frames.  Default: 0, call the handler for every frame and {FRAMELESS_HANDLER_HZ} times per second without video")
+    ap.add_argument("--handler-processes", required=False, default=0, type=int,
+                    help="Run the handler in this many worker processes, for slow handlers that do not keep state between frames.  init and stop run in every worker, see params['worker_index'].  Default: 0, run the handler in the runner")
+    ap.add_argument("--frame-policy", required=False, default=NEWEST, choices=POLICIES,
+                    help=f"Frames the handler gets: {NEWEST} - the newest frame on every call, {MAX_LAG} - skip frames older than --max-frame-lag-ms, {EVERY_KTH} - every --every-kth-frame new frame.  The age of the frame is in params['frame_lag_ms'].  Default: {NEWEST}")
+    ap.add_argument("--max-frame-lag-ms", required=False, default=DEFAULT_MAX_FRAME_LAG_MS, type=float,
+                    help=f"Oldest frame handed to the handler with --frame-policy {MAX_LAG}.  Default: {DEFAULT_MAX_FRAME_LAG_MS}")
+    ap.add_argument("--every-kth-frame", required=False, default=DEFAULT_EVERY_KTH_FRAME, type=int,
+                    help=f"Hand every kth new frame to the handler with --frame-policy {EVERY_KTH}.  Default: {DEFAULT_EVERY_KTH_FRAME}")
+    ap.add_argument("--watch", action='store_true',
+                    help="Load the new version of the handler file when it is saved, without reconnecting to the Tello.  The init method of the new version is called, the stop method of the old version is not.  If the new version fails to import the running version is kept.  Default: False")
+    ap.add_argument("--record", type=str, required=False, default="",
+                    help="Record the video to this file, e.g. flight.mp4 or flight.avi, with the time of every frame in flight.mp4.timestamps.csv.  Frames are dropped instead of slowing the handler down when the encoder falls behind")
+    ap.add_argument("--record-frames", required=False, default='processed', choices=['processed', 'original', 'both'],
+                    help="Frames to record: returned by the handler, original from the Tello, or both to <name>_processed and <name>_original.  Default: processed")
+    ap.add_argument("--record-fps", required=False, default=0, type=float,
+                    help="Frame rate written in the recorded video file.  The real frame times are in the timestamps file.  Default: 30")
     output_group = ap.add_mutually_exclusive_group()
     output_group.add_argument('-v', '--verbose', action='store_true', help='Be loud')
     output_group.add_argument('-i', '--info', action='store_true', help='Show only important information')
@@ -290,8 +695,19 @@ def main():
                     help="Default: False. Start the Tello control web application at url:  http://localhost:8080")
     ap.add_argument("--web-port", required=False, default=8080, type=int,
                     help="Port to start web server on.  Default: 8080")
+    ap.add_argument("--tello-host", required=False, default=DEFAULT_TELLO_HOST, type=str,
+                    help=f"IP address of the Tello, or of a tello_simulator.  Default: {DEFAULT_TELLO_HOST}")
+    ap.add_argument("--tello-port", required=False, default=DEFAULT_TELLO_PORT, type=int,
+                    help=f"Command port of the Tello, or of a tello_simulator.  Default: {DEFAULT_TELLO_PORT}")
 
     args = vars(ap.parse_args())
+    if args['watch'] and args['handler_processes'] > 0:
+        ap.error("--watch can not be combined with --handler-processes")
+    try:
+        frame_policy = FramePolicy(args['frame_policy'], max_lag_ms=args['max_frame_lag_ms'],
+                                   every_kth=args['every_kth_frame'])
+    except ValueError as exc:
+        ap.error(str(exc))
     if args['test_install']:
         print("Install worked and the Tello Script Runner can be executed")
         import os
@@ -307,18 +723,33 @@ def main():
 
     LOGGER.debug(args.items())
 
+    from droneblocks.DroneBlocksTello import DroneBlocksTello
+    from droneblocks.runner_stats import RunnerStats
+
+    runner_stats = RunnerStats()
+
     web_port = args['web_port']
     start_tello_web = args['tello_web']
     show_original_frame = args['show_original_video']
     fly = args['fly']
     LOGGER.debug(f"Fly: {fly}")
     display_video = args['display_video']
+    display_fps = args['display_fps']
+    display_interval = 1.0 / display_fps if display_fps > 0 else 0
+    stats_interval = args['stats_interval']
+    stats_overlay = args['stats_overlay']
+    record_path = args['record']
     handler_file = args['handler']
+    handler_module = None
     if handler_file:
         handler_file = handler_file.replace(".py", "")
-        handler_module = importlib.import_module(handler_file)
-        if handler_module is None:
-            raise f"Could not locate handler file: {handler_file}"
+        if args['handler_processes'] > 0:
+            # the worker processes import the handler, only check that they will find it
+            if importlib.util.find_spec(handler_file) is None:
+                raise ModuleNotFoundError(f"Could not locate handler file: {handler_file}", name=handler_file)
+        else:
+            # imported once, here, and handed to the handler thread
+            handler_module = importlib.import_module(handler_file)
 
     tello_video_sim = args['tello_video_sim']
 
@@ -329,10 +760,16 @@ def main():
         display_video = True
         show_original_frame = False
 
-    # video queue to hold the frames from the Tello
-    video_queue = None
+    # the OpenCV windows, and the keyboard read through them, are only needed to show video
+    show_windows = display_video or show_original_frame
+    if show_windows:
+        import cv2
+
+    # mailbox holding the newest frame from the Tello
+    video_mailbox = None
     if display_video:
-        video_queue = queue.Queue(maxsize=MAX_VIDEO_Q_DEPTH)
+        video_mailbox = FrameMailbox()
+        runner_stats.add_counter_source('display_dropped', lambda: video_mailbox.dropped_count)
 
     try:
         TELLO_LOGGER = logging.getLogger('djitellopy')
@@ -357,7 +794,7 @@ def main():
             # cv2.moveWindow(KEYBOARD_CMD_WINDOW_NAME, 200 + IMAGE_WIDTH, 100)
 
         # -----------------------  Initialize the Tello ----------------------
-        tello = DroneBlocksTello()
+        tello = DroneBlocksTello(host=args['tello_host'], port=args['tello_port'])
         tello.connect()
         speed = tello.get_speed()
         time.sleep(0.5)
@@ -366,9 +803,12 @@ def main():
         # or the raw video from the Tello AND we are not simulating
         # the video with the webcam, then we can turn the video
         # streamon
-        if (display_video or show_original_frame) and not tello_video_sim:
+        if (display_video or show_original_frame or record_path) and not tello_video_sim:
             tello.streamon()
 
+        if record_path:
+            _start_video_recorders(record_path, args['record_frames'], args['record_fps'])
+
         # -----------------------  DONE Initialize the Tello ----------------------
 
         # ---------------------------- Initialize background processing thread and script runner --------
@@ -379,9 +819,10 @@ def main():
             ready_to_show_video_event = threading.Event()
             p1 = threading.Thread(target=process_tello_video_feed,
                                   args=(
-                                      handler_file, video_queue, stop_event, ready_to_show_video_event, fly,
+                                      handler_file, video_mailbox, stop_event, ready_to_show_video_event, fly,
                                       tello_video_sim,
-                                      display_video,))
+                                      display_video or bool(record_path), args['handler_processes'],
+                                      args['handler_hz'], handler_module, args['watch'], frame_policy,))
             p1.setDaemon(True)
             p1.start()
         # ---------------------------- DONE Initialize background processing thread and script runner --------
@@ -391,6 +832,7 @@ def main():
         # -----------------------------------------------------------
         if start_tello_web:
             print(f"Starting Tello Web from Tello Script Runner...")
+            from droneblocks.tello_web import web_main
 
             p2 = threading.Thread(target=web_main,
                                   args=(tello, stop_event, web_port, None
@@ -404,15 +846,29 @@ def main():
         # wait one second for the process thread to kick in
         time.sleep(1)
         frame_read = None
+        # resize buffers for the 'Raw Tello Video' window
+        original_frame_pool = None
+        if show_original_frame:
+            from droneblocks.frame_pool import FramePool
+            original_frame_pool = FramePool(2)
+        last_display_time = 0
+        last_frame_seq = 0
+        last_stats_time = time.monotonic()
         # -----------------------------------------------------------
         # ---------------------------- PROCESSING LOOP --------------
         # -----------------------------------------------------------
         while True:
-            # this can become a very tight loop
-            # there are use cases where you might not want to do anything
-            # but run the tello-web application.
-            # to provide some breathing room, sleep this loop for a short time
-            time.sleep(0.2)
+            # wait until the handler thread published a frame instead of polling.
+            # The timeout keeps the keyboard and the stop event responsive when no
+            # frames arrive, e.g. when only the tello-web application is running.
+            if video_mailbox is None:
+                stop_event.wait(DISPLAY_IDLE_TIMEOUT)
+            elif video_mailbox.wait(last_frame_seq, DISPLAY_IDLE_TIMEOUT, consume=False) is not None:
+                # do not show frames faster than the display fps
+                wait_time = last_display_time + display_interval - time.monotonic()
+                if wait_time > 0:
+                    stop_event.wait(wait_time)
+
             if frame_read is None and tello is not None and show_original_frame:
                 try:
                     frame_read = tello.get_frame_read()
@@ -444,28 +900,24 @@ def main():
                 break
 
             ready_to_show_video_event.set()
-            try:
-                # LOGGER.debug(f"Q size: {video_queue.qsize()}")
-                if video_queue is not None:
-                    # frames[0] - frame returned from the script handler
-                    # frames[1] - original frame read from tello/webcam
-                    frames = video_queue.get(block=False)
-                    frame = frames[0]
-                else:
-                    frame = None
-                    frames = []
-            except:
-                frame = None
-                frames = []
+            frame = None
+            if video_mailbox is not None:
+                # frame - frame returned from the script handler
+                # original frame read from tello/webcam is not used, see below
+                latest = video_mailbox.get_latest(last_frame_seq)
+                if latest is not None:
+                    last_frame_seq, frame, _ = latest
 
             if frame_read is not None and show_original_frame:
                 # then we have created a frame reader
                 # and the user wants to see the original video feed
                 # so try to read a frame from the tello and just show that
                 try:
-                    orig_frame = _get_video_frame(frame_read, tello_video_sim)
+                    started = time.perf_counter()
+                    orig_frame = _get_video_frame(frame_read, tello_video_sim, original_frame_pool)
                     cv2.imshow(ORIGINAL_VIDEO_WINDOW_NAME, orig_frame)
                     cv2.waitKey(1)
+                    runner_stats.record('raw_display', time.perf_counter() - started)
                 except:
                     pass
 
@@ -473,36 +925,53 @@ def main():
             if display_video and frame is not None:
                 try:
                     # display the frame to the screen
+                    last_display_time = time.monotonic()
+                    if stats_overlay:
+                        # on a copy, the handler may still refer to the frame it returned
+                        frame = runner_stats.draw_overlay(frame.copy())
+                    started = time.perf_counter()
                     cv2.imshow(TELLO_VIDEO_WINDOW_NAME, frame)
-                    # frames[1] was the frame before sending to user handler
+                    runner_stats.record('display', time.perf_counter() - started)
+                    # the original frame was the frame before sending to user handler
                     # but instead of showing this frame, I am going to show the
                     # realtime video feed from the tello above.
                     # the only time I can think this might matter is if the user scripts
                     # takes a really long time to run, and the frame that the user script
                     # updates is really different than the current frame.
                     # if show_original_frame:
-                    #     cv2.imshow(ORIGINAL_VIDEO_WINDOW_NAME, frames[1])
-                    cv2.waitKey(1)
+                    #     cv2.imshow(ORIGINAL_VIDEO_WINDOW_NAME, original_frame)
                 except Exception as exc:
                     LOGGER.error(f"Display Queue Error: {exc}")
 
+            if stats_interval and time.monotonic() - last_stats_time > stats_interval:
+                last_stats_time = time.monotonic()
+                LOGGER.info(f"Runner stats: {runner_stats.summary()}")
+
             # Give the user a chance to exit the script
             # if the user presses q or ESC set the stop_event and exit
-            key_value = cv2.waitKey(2) & 0xFF
-            if key_value == ord('q') or key_value == 27:
-                stop_event.set()
+            if show_windows:
+                key_value = cv2.waitKey(1) & 0xFF
+                if key_value == ord('q') or key_value == 27:
+                    stop_event.set()
 
 
 
     finally:
         LOGGER.debug("Complete...")
+        if video_mailbox is not None:
+            video_mailbox.close()
+            LOGGER.info(f"Video frames: {video_mailbox.get_stats()}")
+        LOGGER.info(f"Runner stats: {runner_stats.summary()}")
         if display_video:
             cv2.destroyWindow(TELLO_VIDEO_WINDOW_NAME)
         if show_original_frame:
             cv2.destroyWindow(ORIGINAL_VIDEO_WINDOW_NAME)
         # cv2.destroyWindow(KEYBOARD_CMD_WINDOW_NAME)
-        cv2.destroyAllWindows()
+        if show_windows:
+            cv2.destroyAllWindows()
         shutdown_gracefully()
+        # after the handler thread stopped, so the last frames are in the file
+        _stop_video_recorders()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,476 @@
+"""
+Local stand-in for a Tello / Robomaster TT.
+
+The simulator binds a UDP command port, answers SDK 2.0 and 3.0 commands
+( including the RMTT 'EXT' expansion commands and the keepalive quirk of
+'EXT tof?' ), sends state packets to every client that entered SDK mode and
+can optionally stream a video file to the client with ffmpeg.
+
+DroneBlocksTello binds the real Tello command port (8889) on this computer to
+receive the responses, so when the simulator runs on the same computer give
+it a different command port:
+
+    python -m droneblocks.tello_simulator --port 9889 --latency 20 --jitter 10 --loss 0.01
+
+    tello = DroneBlocksTello(host='127.0.0.1', port=9889)
+    telloscriptrunner --tello-host 127.0.0.1 --tello-port 9889 ...
+"""
+import argparse
+import heapq
+import itertools
+import random
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+TELLO_CONTROL_UDP_PORT = 8889
+TELLO_STATE_UDP_PORT = 8890
+TELLO_VIDEO_UDP_PORT = 11111
+
+# The Tello sends its state about 10 times a second
+DEFAULT_STATE_HZ = 10
+
+# commands that are acknowledged with 'ok' and need no other simulation
+_OK_COMMANDS = ('command', 'emergency', 'motoron', 'motoroff', 'throwfly', 'stop', 'keepalive', 'mdirection',
+                'wifi', 'ap', 'port', 'setbitrate', 'setresolution', 'setfps', 'downvision', 'multwifi')
+
+_MOVES = {
+    'up': (0, 0, 1),
+    'down': (0, 0, -1),
+    'left': (0, 1, 0),
+    'right': (0, -1, 0),
+    'forward': (1, 0, 0),
+    'back': (-1, 0, 0)
+}
+
+
+class SimulatedTelloState:
+    """
+    The little bit of flight state the simulator keeps to answer queries and fill state packets.
+    """
+
+    def __init__(self):
+        self.is_flying = False
+        self.mission_pads_enabled = False
+        self.speed = 100
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        self.yaw = 0
+        self.height = 0
+        self.battery = 100.0
+        self.flight_time = 0.0
+        self.tof = 100
+        self.templ = 60
+        self.temph = 62
+
+    def to_state_packet(self) -> bytes:
+        mid = -1 if self.mission_pads_enabled else -2
+        xyz = -100 if mid == -1 else -200
+        return (f"mid:{mid};x:{xyz};y:{xyz};z:{xyz};mpry:0,0,0;pitch:0;roll:0;yaw:{self.yaw};"
+                f"vgx:0;vgy:0;vgz:0;templ:{self.templ};temph:{self.temph};tof:{self.tof};h:{self.height};"
+                f"bat:{int(self.battery)};baro:{self.height / 100:.2f};time:{int(self.flight_time)};"
+                f"agx:0.00;agy:0.00;agz:-1000.00;\r\n").encode('utf-8')
+
+
+class TelloSimulator:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = TELLO_CONTROL_UDP_PORT,
+                 state_port: int = TELLO_STATE_UDP_PORT, sdk_version: int = 30, hardware: str = 'RMTT',
+                 latency: float = 0.0, jitter: float = 0.0, loss: float = 0.0, keepalive_quirk: float = 0.0,
+                 state_hz: float = DEFAULT_STATE_HZ, move_time_scale: float = 0.0, video_source: str = None,
+                 video_port: int = TELLO_VIDEO_UDP_PORT, seed: int = None):
+        """
+
+        :param host: address to bind the command port to
+        :param port: command port
+        :param state_port: port on the client the state packets are sent to
+        :param sdk_version: 20 for a Tello / Tello EDU, 30 for a Robomaster TT
+        :param hardware: answer to 'hardware?' ( SDK 3.0 ).  'RMTT' enables the EXT expansion commands
+        :param latency: seconds before a response is sent
+        :param jitter: up to this many seconds are randomly added to the latency
+        :param loss: probability, 0-1, that a response or state packet is dropped
+        :param keepalive_quirk: probability, 0-1, that 'EXT tof?' is also answered with 'unknown command: keepalive'
+        :param state_hz: state packets per second
+        :param move_time_scale: seconds per cm for moves, 0 answers moves right away
+        :param video_source: file or device for ffmpeg to stream to the client after 'streamon'
+        :param video_port: port on the client the video is streamed to
+        :param seed: random seed, for reproducible loss and jitter
+        """
+        self.address = (host, port)
+        self.state_port = state_port
+        self.sdk_version = sdk_version
+        self.hardware = hardware
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.keepalive_quirk = keepalive_quirk
+        self.state_hz = state_hz
+        self.move_time_scale = move_time_scale
+        self.video_source = video_source
+        self.video_port = video_port
+        self.random = random.Random(seed)
+
+        self.state = SimulatedTelloState()
+        self.clients = set()
+        self.socket = None
+        self.video_process = None
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        # heap of (due time, sequence, data, address) waiting to be sent
+        self._replies = []
+        self._reply_condition = threading.Condition()
+        self._reply_sequence = itertools.count()
+        self._last_reply_due = 0
+        self._last_state_time = time.monotonic()
+
+        self.received_count = 0
+        self.sent_count = 0
+        self.dropped_count = 0
+
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.socket.bind(self.address)
+        except OSError as exc:
+            raise OSError(f"Could not bind the simulator to {self.address}: {exc}.  If a DroneBlocksTello runs on "
+                          f"this computer, start the simulator on another port, e.g. --port 9889") from exc
+        self.socket.settimeout(0.5)
+
+        for target in (self._command_receiver, self._reply_sender, self._state_sender):
+            thread = threading.Thread(target=target, name=f"TelloSimulator{target.__name__}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        print(f"Tello simulator listening on {self.address[0]}:{self.address[1]}, SDK {self.sdk_version}")
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._reply_condition:
+            self._reply_condition.notify_all()
+        for thread in self._threads:
+            thread.join(2)
+        self._threads = []
+        self._stop_video()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # ----------------------------------------------------------------- transport
+    def _queue_reply(self, data, address, extra_delay: float = 0.0):
+        if self.loss and self.random.random() < self.loss:
+            self.dropped_count += 1
+            return
+
+        delay = self.latency + extra_delay
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+
+        with self._reply_condition:
+            # the Tello answers in order, so jitter never reorders responses
+            due = max(time.monotonic() + delay, self._last_reply_due)
+            self._last_reply_due = due
+            heapq.heappush(self._replies, (due, next(self._reply_sequence), data, address))
+            self._reply_condition.notify_all()
+
+    def _reply_sender(self):
+        while not self._stop_event.is_set():
+            with self._reply_condition:
+                if not self._replies:
+                    self._reply_condition.wait(0.5)
+                    continue
+                due, _, data, address = self._replies[0]
+                wait_time = due - time.monotonic()
+                if wait_time > 0:
+                    self._reply_condition.wait(wait_time)
+                    continue
+                heapq.heappop(self._replies)
+
+            try:
+                self.socket.sendto(data, address)
+                self.sent_count += 1
+            except OSError:
+                pass
+
+    def _command_receiver(self):
+        while not self._stop_event.is_set():
+            try:
+                data, address = self.socket.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            self.received_count += 1
+            try:
+                command = data.decode('utf-8').strip()
+            except UnicodeDecodeError:
+                self._queue_reply(b'error', address)
+                continue
+
+            for response, extra_delay in self.handle_command(command, address):
+                self._queue_reply(response.encode('utf-8'), address, extra_delay)
+
+    def _state_sender(self):
+        interval = 1.0 / self.state_hz
+        next_send = time.monotonic()
+        while not self._stop_event.is_set():
+            next_send += interval
+            wait_time = next_send - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            else:
+                next_send = time.monotonic()
+
+            with self._lock:
+                self._update_state()
+                packet = self.state.to_state_packet()
+                clients = list(self.clients)
+
+            for client_ip in clients:
+                if self.loss and self.random.random() < self.loss:
+                    continue
+                try:
+                    self.socket.sendto(packet, (client_ip, self.state_port))
+                except OSError:
+                    pass
+
+    def _update_state(self):
+        now = time.monotonic()
+        elapsed = now - self._last_state_time
+        self._last_state_time = now
+        if self.state.is_flying:
+            self.state.flight_time += elapsed
+            # about 12 minutes of flight on a full battery
+            self.state.battery = max(self.state.battery - elapsed * 100 / 720, 0)
+
+    # ----------------------------------------------------------------- commands
+    def handle_command(self, command: str, address) -> list:
+        """
+        :return: list of (response, extra delay in seconds) to send back for command
+        """
+        parts = command.split()
+        if not parts:
+            return [('error', 0)]
+
+        verb = parts[0]
+        with self._lock:
+            if verb == 'command':
+                self.clients.add(address[0])
+                return [('ok', 0)]
+
+            if verb == 'rc':
+                # rc does not get a response
+                return []
+
+            if verb == 'EXT':
+                return self._handle_expansion_command(parts[1:])
+
+            if verb.endswith('?'):
+                return [(self._handle_read_command(verb), 0)]
+
+            return [self._handle_control_command(verb, parts[1:])]
+
+    def _handle_control_command(self, verb: str, args: list):
+        state = self.state
+        try:
+            if verb == 'takeoff':
+                state.is_flying = True
+                state.height = 80
+                return 'ok', self.move_time_scale * 80
+            if verb == 'land':
+                state.is_flying = False
+                state.height = 0
+                return 'ok', self.move_time_scale * 80
+            if verb in _MOVES:
+                distance = int(args[0])
+                if not 20 <= distance <= 500:
+                    return 'out of range', 0
+                if not state.is_flying:
+                    return 'error Not flying', 0
+                dx, dy, dz = _MOVES[verb]
+                state.x += dx * distance
+                state.y += dy * distance
+                state.z += dz * distance
+                state.height = max(state.height + dz * distance, 0)
+                return 'ok', self.move_time_scale * distance
+            if verb in ('cw', 'ccw'):
+                angle = int(args[0])
+                state.yaw = (state.yaw + (angle if verb == 'cw' else -angle) + 180) % 360 - 180
+                return 'ok', self.move_time_scale * angle / 2
+            if verb in ('go', 'curve', 'jump'):
+                if not state.is_flying:
+                    return 'error Not flying', 0
+                x, y, z = int(args[0]), int(args[1]), int(args[2])
+                if verb == 'curve':
+                    x, y, z = int(args[3]), int(args[4]), int(args[5])
+                state.x += x
+                state.y += y
+                state.z += z
+                state.height = max(state.height + z, 0)
+                return 'ok', self.move_time_scale * (abs(x) + abs(y) + abs(z))
+            if verb == 'flip':
+                return ('ok', 0) if state.is_flying else ('error Not flying', 0)
+            if verb == 'speed':
+                state.speed = int(float(args[0]))
+                return 'ok', 0
+            if verb == 'mon':
+                state.mission_pads_enabled = True
+                return 'ok', 0
+            if verb == 'moff':
+                state.mission_pads_enabled = False
+                return 'ok', 0
+            if verb == 'streamon':
+                self._start_video()
+                return 'ok', 0
+            if verb == 'streamoff':
+                self._stop_video()
+                return 'ok', 0
+            if verb == 'reboot':
+                self.state = SimulatedTelloState()
+                return 'ok', 0
+            if verb in _OK_COMMANDS:
+                return 'ok', 0
+        except (IndexError, ValueError):
+            return 'error', 0
+
+        return f'unknown command: {verb}', 0
+
+    def _handle_read_command(self, verb: str) -> str:
+        state = self.state
+        if verb == 'speed?':
+            return f"{float(state.speed)}"
+        if verb == 'battery?':
+            return f"{int(state.battery)}"
+        if verb == 'time?':
+            return f"{int(state.flight_time)}s"
+        if verb == 'height?':
+            return f"{state.height // 10}dm"
+        if verb == 'temp?':
+            return f"{state.templ}~{state.temph}C"
+        if verb == 'attitude?':
+            return f"pitch:0;roll:0;yaw:{state.yaw};"
+        if verb == 'baro?':
+            return f"{state.height / 100:.2f}"
+        if verb == 'tof?':
+            return f"{state.tof * 10}mm"
+        if verb == 'acceleration?':
+            return "agx:0.00;agy:0.00;agz:-1000.00;"
+        if verb == 'wifi?':
+            return "90"
+        if verb == 'sdk?':
+            return f"{self.sdk_version}"
+        if verb == 'sn?':
+            return "0TQDGSIM000000"
+        if verb == 'active?':
+            return "ok"
+        if verb == 'hardware?' and self.sdk_version >= 30:
+            return self.hardware
+        return f"unknown command: {verb}"
+
+    def _handle_expansion_command(self, args: list) -> list:
+        if self.sdk_version < 30 or self.hardware != 'RMTT' or not args:
+            return [('error', 0)]
+
+        if args[0] == 'tof?':
+            responses = []
+            # the RMTT sometimes answers 'EXT tof?' with a keepalive error as well as the value
+            if self.keepalive_quirk and self.random.random() < self.keepalive_quirk:
+                responses.append(('unknown command: keepalive', 0))
+            responses.append((f"tof {self.state.tof * 10}", 0))
+            return responses
+        if args[0] == 'led':
+            return [('led ok', 0)]
+        if args[0] == 'mled':
+            return [('matrix ok', 0)]
+        return [('ok', 0)]
+
+    # ----------------------------------------------------------------- video
+    def _start_video(self):
+        if self.video_source is None or self.video_process is not None or not self.clients:
+            return
+
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            print("ffmpeg was not found, the simulator will not stream video")
+            return
+
+        client_ip = next(iter(self.clients))
+        self.video_process = subprocess.Popen(
+            [ffmpeg, '-loglevel', 'error', '-re', '-stream_loop', '-1', '-i', self.video_source,
+             '-an', '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-g', '30',
+             '-f', 'h264', f"udp://{client_ip}:{self.video_port}"],
+            stdin=subprocess.DEVNULL)
+
+    def _stop_video(self):
+        if self.video_process is not None:
+            self.video_process.terminate()
+            try:
+                self.video_process.wait(2)
+            except subprocess.TimeoutExpired:
+                self.video_process.kill()
+            self.video_process = None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local UDP stand-in for a Tello / Robomaster TT")
+    ap.add_argument("--host", default='127.0.0.1', help="Address to bind the command port to. Default: 127.0.0.1")
+    ap.add_argument("--port", type=int, default=TELLO_CONTROL_UDP_PORT,
+                    help=f"Command port. Default: {TELLO_CONTROL_UDP_PORT}.  Use another port, e.g. 9889, when the "
+                         f"client runs on the same computer")
+    ap.add_argument("--state-port", type=int, default=TELLO_STATE_UDP_PORT,
+                    help=f"Client port to send state packets to. Default: {TELLO_STATE_UDP_PORT}")
+    ap.add_argument("--state-hz", type=float, default=DEFAULT_STATE_HZ,
+                    help=f"State packets per second. Default: {DEFAULT_STATE_HZ}")
+    ap.add_argument("--sdk", type=int, default=30, choices=[20, 30],
+                    help="20 to simulate a Tello, 30 to simulate a Robomaster TT. Default: 30")
+    ap.add_argument("--hardware", default='RMTT', choices=['RMTT', 'TELLO'],
+                    help="Answer to 'hardware?'. TELLO simulates an RMTT without the expansion board. Default: RMTT")
+    ap.add_argument("--latency", type=float, default=0, help="Response latency in milliseconds. Default: 0")
+    ap.add_argument("--jitter", type=float, default=0,
+                    help="Up to this many milliseconds are randomly added to the latency. Default: 0")
+    ap.add_argument("--loss", type=float, default=0,
+                    help="Probability, 0-1, that a response or state packet is lost. Default: 0")
+    ap.add_argument("--keepalive-quirk", type=float, default=0.2,
+                    help="Probability, 0-1, that 'EXT tof?' is also answered with 'unknown command: keepalive'. "
+                         "Default: 0.2")
+    ap.add_argument("--move-time-scale", type=float, default=0,
+                    help="Seconds per cm moved before a move command is answered. Default: 0")
+    ap.add_argument("--video-source", default=None,
+                    help="Video file or device that ffmpeg streams to the client after 'streamon'")
+    ap.add_argument("--video-port", type=int, default=TELLO_VIDEO_UDP_PORT,
+                    help=f"Client port to stream video to. Default: {TELLO_VIDEO_UDP_PORT}")
+    ap.add_argument("--seed", type=int, default=None, help="Random seed for reproducible loss and jitter")
+
+    args = ap.parse_args()
+
+    simulator = TelloSimulator(host=args.host, port=args.port, state_port=args.state_port, sdk_version=args.sdk,
+                               hardware=args.hardware, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                               loss=args.loss, keepalive_quirk=args.keepalive_quirk, state_hz=args.state_hz,
+                               move_time_scale=args.move_time_scale, video_source=args.video_source,
+                               video_port=args.video_port, seed=args.seed)
+    simulator.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        print(f"Received {simulator.received_count} commands, sent {simulator.sent_count} responses, "
+              f"dropped {simulator.dropped_count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import time
+import numpy as np
+
+# Fields of a Tello state packet, in the order the Tello sends them:
+# mid:-1;x:0;y:0;z:0;mpry:0,0,0;pitch:0;roll:0;yaw:0;vgx:0;vgy:0;vgz:0;templ:60;temph:62;tof:10;h:0;bat:90;
+# baro:100.00;time:0;agx:0.00;agy:0.00;agz:-1000.00;
+# 'mpry' ( mission pad pitch, roll, yaw ) is stored as the three fields mp_pitch, mp_roll and mp_yaw.
+INT_STATE_FIELDS = ('mid', 'x', 'y', 'z', 'mp_pitch', 'mp_roll', 'mp_yaw', 'pitch', 'roll', 'yaw', 'vgx', 'vgy',
+                    'vgz', 'templ', 'temph', 'tof', 'h', 'bat', 'time')
+FLOAT_STATE_FIELDS = ('baro', 'agx', 'agy', 'agz')
+STATE_FIELDS = INT_STATE_FIELDS + FLOAT_STATE_FIELDS
+
+# NumPy structured dtype with one column per state field plus the time the packet was decoded,
+# for keeping state history in preallocated arrays, see TelloStateRecord.store
+STATE_DTYPE = np.dtype([('timestamp', np.float64)] +
+                       [(name, np.int32) for name in INT_STATE_FIELDS] +
+                       [(name, np.float32) for name in FLOAT_STATE_FIELDS])
+
+# values of fields that are missing from a packet, e.g. the mission pad
+# fields of SDK 1.3, match the defaults tello_web used for a missing key
+_FIELD_DEFAULTS = {'mid': -2, 'x': -1, 'y': -1, 'z': -1}
+
+
+class TelloStateRecord:
+    """
+    One decoded Tello state packet.  Fields are plain attributes with the same names as
+    the djitellopy state dict keys ( bat, templ, temph, h, tof, agx, ... ).
+
+    Records are meant to be reused: the decoder overwrites the attributes in place
+    instead of building a new dict for every packet, see TelloStateBuffer.
+    """
+    __slots__ = ('timestamp',) + STATE_FIELDS
+
+    def __init__(self):
+        self.timestamp = 0.0
+        for name in INT_STATE_FIELDS:
+            setattr(self, name, _FIELD_DEFAULTS.get(name, 0))
+        for name in FLOAT_STATE_FIELDS:
+            setattr(self, name, 0.0)
+
+    @property
+    def mpry(self) -> str:
+        return f"{self.mp_pitch},{self.mp_roll},{self.mp_yaw}"
+
+    @property
+    def temperature(self) -> float:
+        return (self.templ + self.temph) / 2
+
+    def as_tuple(self) -> tuple:
+        """
+        :return: values in STATE_DTYPE order
+        """
+        return tuple(getattr(self, name) for name in STATE_DTYPE.names)
+
+    def as_dict(self) -> dict:
+        """
+        :return: dict with the same keys as djitellopy get_current_state()
+        """
+        state = {name: getattr(self, name) for name in STATE_FIELDS if not name.startswith('mp_')}
+        state['mpry'] = self.mpry
+        return state
+
+    def store(self, array: np.ndarray, index: int):
+        """
+        Write this record into row index of a STATE_DTYPE array.
+        """
+        array[index] = self.as_tuple()
+
+    def load(self, row):
+        """
+        Set this record from a row of a STATE_DTYPE array.
+        """
+        for name in STATE_DTYPE.names:
+            setattr(self, name, row[name].item())
+        return self
+
+    def copy(self) -> 'TelloStateRecord':
+        record = TelloStateRecord()
+        for name in TelloStateRecord.__slots__:
+            setattr(record, name, getattr(self, name))
+        return record
+
+    def __repr__(self):
+        return f"TelloStateRecord({', '.join(f'{name}={getattr(self, name)}' for name in STATE_DTYPE.names)})"
+
+
+class TelloStateDecoder:
+    """
+    Decode raw 'mid:..;x:..;pitch:..;' state datagrams into a TelloStateRecord.
+
+    The field order of a Tello never changes, so the layout ( attribute and
+    converter for every position, and where the value starts ) is learned from
+    the first packet and every following packet is decoded by position without
+    looking up keys.  If a packet does not fit the layout it is learned again.
+    """
+
+    def __init__(self):
+        # tuple of (key bytes, value offset, attribute name, converter) per position
+        self._layout = None
+
+    @staticmethod
+    def _learn_layout(fields) -> tuple:
+        layout = []
+        for field in fields:
+            key, _, _ = field.partition(b':')
+            name = key.decode('ascii', 'replace')
+            if name == 'mpry':
+                layout.append((key, len(key) + 1, name, None))
+            elif name in INT_STATE_FIELDS:
+                layout.append((key, len(key) + 1, name, int))
+            elif name in FLOAT_STATE_FIELDS:
+                layout.append((key, len(key) + 1, name, float))
+            else:
+                # unknown field, skip it
+                layout.append((key, len(key) + 1, None, None))
+        return tuple(layout)
+
+    def decode(self, data: bytes, record: TelloStateRecord = None, timestamp: float = None) -> TelloStateRecord:
+        """
+        :param data: raw state datagram
+        :param record: record to overwrite.  A new record is created if None.
+        :param timestamp: time to store in the record, defaults to time.time()
+        :return: record, or None if data is not a state packet ( e.g. 'ok' )
+        """
+        fields = data.rstrip(b';\r\n').split(b';')
+        if len(fields) < 2:
+            return None
+
+        layout = self._layout
+        if layout is None or len(layout) != len(fields) or not fields[0].startswith(layout[0][0]):
+            layout = self._layout = self._learn_layout(fields)
+
+        if record is None:
+            record = TelloStateRecord()
+
+        try:
+            for field, (key, offset, name, converter) in zip(fields, layout):
+                if converter is not None:
+                    setattr(record, name, converter(field[offset:]))
+                elif name == 'mpry':
+                    mp_pitch, mp_roll, mp_yaw = field[offset:].split(b',')
+                    record.mp_pitch = int(mp_pitch)
+                    record.mp_roll = int(mp_roll)
+                    record.mp_yaw = int(mp_yaw)
+        except ValueError:
+            # a field moved, learn the layout again on the next packet
+            self._layout = None
+            return None
+
+        record.timestamp = time.time() if timestamp is None else timestamp
+        return record
+
+
+def update_record_from_state_dict(state: dict, record: TelloStateRecord, timestamp: float = None) -> TelloStateRecord:
+    """
+    Copy a djitellopy state dict ( Tello.get_current_state() ) into record.
+    """
+    for name in STATE_FIELDS:
+        value = state.get(name)
+        if value is not None:
+            setattr(record, name, value)
+
+    mpry = state.get('mpry')
+    if mpry:
+        try:
+            mp_pitch, mp_roll, mp_yaw = mpry.split(',')
+            record.mp_pitch = int(mp_pitch)
+            record.mp_roll = int(mp_roll)
+            record.mp_yaw = int(mp_yaw)
+        except ValueError:
+            pass
+
+    record.timestamp = time.time() if timestamp is None else timestamp
+    return record
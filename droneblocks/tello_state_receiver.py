@@ -0,0 +1,115 @@
+import socket
+import threading
+import time
+import djitellopy.tello
+from djitellopy import Tello
+from droneblocks.tello_state import TelloStateDecoder, TelloStateRecord
+
+# records one drone decodes state packets into, round robin.  The record
+# get_state_record returned stays unchanged for STATE_RING_SIZE - 1 more
+# packets, about 0.3 seconds at 10 packets per second.
+STATE_RING_SIZE = 4
+
+
+class TelloStateBuffer:
+    """
+    Latest decoded state of one drone.
+
+    The state receiver thread decodes every packet straight from the datagram
+    into the next of ring_size preallocated TelloStateRecords and only then
+    publishes it as record, so a reader never sees a record that is half
+    written and no dict or record is allocated per packet.
+    """
+
+    def __init__(self, ring_size: int = STATE_RING_SIZE):
+        """
+
+        :param ring_size: number of preallocated records, at least 2
+        """
+        if ring_size < 2:
+            raise ValueError("A state buffer needs at least 2 records")
+        self._records = [TelloStateRecord() for _ in range(ring_size)]
+        self._next = 0
+        self._decoder = TelloStateDecoder()
+        # the newest decoded record, None until the first state packet arrived
+        self.record = None
+
+        self.packet_count = 0
+        self.bad_packet_count = 0
+
+    def receive(self, data: bytes, timestamp: float = None) -> bool:
+        """
+        Decode one state datagram.  Called by the state receiver thread only.
+
+        :param timestamp: time.time() the datagram arrived
+        :return: False if data was not a state packet
+        """
+        record = self._records[self._next]
+        if self._decoder.decode(data, record, timestamp) is None:
+            self.bad_packet_count += 1
+            return False
+        self._next = (self._next + 1) % len(self._records)
+        self.record = record
+        self.packet_count += 1
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            'packets': self.packet_count,
+            'bad_packets': self.bad_packet_count
+        }
+
+
+_state_buffer_lock = threading.Lock()
+_state_buffers = {}
+
+
+def state_buffer_for(host: str) -> TelloStateBuffer:
+    """
+    :return: the TelloStateBuffer for the drone address, creating it on first use
+    """
+    with _state_buffer_lock:
+        state_buffer = _state_buffers.get(host)
+        if state_buffer is None:
+            state_buffer = _state_buffers[host] = TelloStateBuffer()
+        return state_buffer
+
+
+def udp_state_receiver():
+    """
+    Replaces Tello.udp_state_receiver, see install_state_receiver.  Decodes the
+    state of drones with a TelloStateBuffer in place and keeps filling the
+    djitellopy state dict of any other Tello in this process.
+    """
+    state_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    state_socket.bind(("", Tello.STATE_UDP_PORT))
+
+    while True:
+        try:
+            data, address = state_socket.recvfrom(1024)
+            arrival_time = time.time()
+            address = address[0]
+
+            state_buffer = _state_buffers.get(address)
+            if state_buffer is not None:
+                state_buffer.receive(data, arrival_time)
+            elif address in djitellopy.tello.drones:
+                djitellopy.tello.drones[address]['state'] = Tello.parse_state(data.decode('ASCII'))
+
+        except Exception as e:
+            Tello.LOGGER.error(e)
+            break
+
+
+def install_state_receiver() -> bool:
+    """
+    Make djitellopy start udp_state_receiver instead of its own state receiver.
+    djitellopy starts its receiver threads when the first Tello is created, so
+    this only works before that.
+
+    :return: True if state packets are decoded by udp_state_receiver
+    """
+    with _state_buffer_lock:
+        if not djitellopy.tello.threads_initialized:
+            Tello.udp_state_receiver = staticmethod(udp_state_receiver)
+        return Tello.udp_state_receiver is udp_state_receiver
@@ -0,0 +1,301 @@
+"""
+Record Tello state packets to a memory-mapped, columnar telemetry file and replay them.
+
+File layout:
+    HEADER_SIZE bytes   magic + JSON header ( version, capacity, count, fields, start time ), space padded
+    one column per STATE_DTYPE field, each `capacity` fixed-width values, in STATE_DTYPE order
+
+The recorder writes samples straight into the mapped columns from a background
+thread, so recording a sample is a handful of memory stores and no file system calls.
+
+    python -m droneblocks.tello_telemetry flight.tlm --csv flight.csv
+"""
+import argparse
+import csv
+import json
+import logging
+import threading
+import time
+import numpy as np
+from droneblocks.tello_state import STATE_DTYPE, TelloStateRecord
+
+LOGGER = logging.getLogger('djitellopy')
+
+TELEMETRY_MAGIC = b'DBTLM\x00\x01\x00'
+TELEMETRY_VERSION = 1
+HEADER_SIZE = 4096
+
+# two hours of state packets at 10 per second
+DEFAULT_CAPACITY = 2 * 60 * 60 * 10
+
+# write the sample count into the header every this many samples
+HEADER_UPDATE_INTERVAL = 50
+
+
+def _column_offsets(capacity: int) -> dict:
+    offsets = {}
+    offset = HEADER_SIZE
+    for name in STATE_DTYPE.names:
+        offsets[name] = offset
+        offset += STATE_DTYPE.fields[name][0].itemsize * capacity
+    return offsets
+
+
+def _file_size(capacity: int) -> int:
+    return HEADER_SIZE + STATE_DTYPE.itemsize * capacity
+
+
+def _map_columns(mm: np.memmap, capacity: int) -> dict:
+    offsets = _column_offsets(capacity)
+    return {name: np.ndarray((capacity,), dtype=STATE_DTYPE.fields[name][0], buffer=mm, offset=offsets[name])
+            for name in STATE_DTYPE.names}
+
+
+class TelemetryRecorder:
+    """
+    Samples tello.get_state_record() on a background thread and appends every new
+    state packet to a memory-mapped telemetry file.
+    """
+
+    def __init__(self, tello, path: str, capacity: int = DEFAULT_CAPACITY, sample_hz: float = 20):
+        """
+
+        :param tello: DroneBlocksTello, or anything with get_state_record()
+        :param path: telemetry file to create.  An existing file is overwritten.
+        :param capacity: maximum number of samples.  Recording stops when the file is full.
+        :param sample_hz: how often to check for a new state packet.  The Tello sends about 10 per second.
+        """
+        self.tello = tello
+        self.path = path
+        self.capacity = capacity
+        self.sample_hz = sample_hz
+        self.count = 0
+        self.dropped_count = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._mm = None
+        self._columns = None
+        self._start_time = None
+
+    def start(self):
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode='w+', shape=(_file_size(self.capacity),))
+        self._columns = _map_columns(self._mm, self.capacity)
+        self._start_time = time.time()
+        self.count = 0
+        self._write_header()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="TelemetryRecorder")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2)
+            self._thread = None
+
+        if self._mm is not None:
+            self._write_header()
+            self._mm.flush()
+            self._columns = None
+            self._mm = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _write_header(self):
+        header = json.dumps({
+            'version': TELEMETRY_VERSION,
+            'capacity': self.capacity,
+            'count': self.count,
+            'start_time': self._start_time,
+            'fields': [[name, STATE_DTYPE.fields[name][0].str] for name in STATE_DTYPE.names]
+        }).encode('utf-8')
+        header = TELEMETRY_MAGIC + header
+        if len(header) > HEADER_SIZE:
+            raise ValueError("Telemetry header does not fit in HEADER_SIZE")
+        self._mm[:HEADER_SIZE] = np.frombuffer(header.ljust(HEADER_SIZE, b' '), dtype=np.uint8)
+
+    def record(self, record: TelloStateRecord):
+        """
+        Append one sample.  Called from the recorder thread, but can also be used to record
+        state from another source.
+        """
+        if self.count >= self.capacity:
+            if self.dropped_count == 0:
+                LOGGER.warning(f"Telemetry file {self.path} is full, no more samples are recorded")
+            self.dropped_count += 1
+            return
+
+        index = self.count
+        columns = self._columns
+        for name in STATE_DTYPE.names:
+            columns[name][index] = getattr(record, name)
+        self.count = index + 1
+
+        if self.count % HEADER_UPDATE_INTERVAL == 0:
+            self._write_header()
+
+    def _run(self):
+        interval = 1.0 / self.sample_hz
+        last_timestamp = None
+        next_sample = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                record = self.tello.get_state_record()
+                if record is not None and record.timestamp != last_timestamp:
+                    last_timestamp = record.timestamp
+                    self.record(record)
+            except Exception as exc:
+                LOGGER.error(f"Telemetry recorder error: {exc}")
+
+            next_sample += interval
+            wait_time = next_sample - time.monotonic()
+            if wait_time > 0:
+                self._stop_event.wait(wait_time)
+            else:
+                next_sample = time.monotonic()
+
+
+class TelemetryReplay:
+    """
+    Read a telemetry file and play it back.
+
+    While playing, get_current_state() and get_state_record() return the sample that
+    matches the playback time, so a TelemetryReplay can stand in for the tello
+    argument of code that only reads state, e.g. tello_web status or handlers.
+    """
+    is_flying = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._mm[:len(TELEMETRY_MAGIC)]) != TELEMETRY_MAGIC:
+            raise ValueError(f"{path} is not a telemetry file")
+
+        self.header = json.loads(bytes(self._mm[len(TELEMETRY_MAGIC):HEADER_SIZE]).decode('utf-8').strip())
+        fields = [name for name, _ in self.header['fields']]
+        if fields != list(STATE_DTYPE.names):
+            raise ValueError(f"{path} was recorded with different state fields")
+
+        self.capacity = self.header['capacity']
+        self.count = self.header['count']
+        self.columns = {name: column[:self.count] for name, column in _map_columns(self._mm, self.capacity).items()}
+
+        self._index = -1
+        self._record = TelloStateRecord()
+        self._stop_event = threading.Event()
+        self._done_event = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return self.count
+
+    def as_array(self) -> np.ndarray:
+        """
+        :return: STATE_DTYPE structured array with every sample
+        """
+        array = np.empty(self.count, dtype=STATE_DTYPE)
+        for name, column in self.columns.items():
+            array[name] = column
+        return array
+
+    def record_at(self, index: int, record: TelloStateRecord = None) -> TelloStateRecord:
+        record = record if record is not None else TelloStateRecord()
+        for name, column in self.columns.items():
+            setattr(record, name, column[index].item())
+        return record
+
+    def __iter__(self):
+        record = TelloStateRecord()
+        for index in range(self.count):
+            yield self.record_at(index, record)
+
+    # ------------------------------------------------------------- playback
+    def start(self, realtime: bool = True, speed: float = 1.0, loop: bool = False):
+        """
+        Play the samples back on a background thread.
+
+        :param realtime: True - keep the recorded time between samples ( divided by speed ).
+                         False - advance as fast as possible.
+        :param speed: playback speed factor when realtime is True
+        :param loop: start over at the end
+        """
+        self.stop()
+        self._stop_event.clear()
+        self._done_event.clear()
+        self._thread = threading.Thread(target=self._play, args=(realtime, speed, loop), name="TelemetryReplay")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2)
+            self._thread = None
+
+    def wait_until_done(self, timeout: float = None) -> bool:
+        return self._done_event.wait(timeout)
+
+    def _play(self, realtime, speed, loop):
+        timestamps = self.columns['timestamp']
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            first_timestamp = timestamps[0] if self.count else 0
+            for index in range(self.count):
+                if self._stop_event.is_set():
+                    break
+                if realtime:
+                    wait_time = (timestamps[index] - first_timestamp) / speed - (time.monotonic() - start)
+                    if wait_time > 0 and self._stop_event.wait(wait_time):
+                        break
+                self._index = index
+
+            if not loop:
+                break
+        self._done_event.set()
+
+    def get_state_record(self) -> TelloStateRecord:
+        index = self._index
+        if index < 0:
+            return None
+        if self._record.timestamp != self.columns['timestamp'][index]:
+            self.record_at(index, self._record)
+        return self._record
+
+    def get_current_state(self) -> dict:
+        record = self.get_state_record()
+        return record.as_dict() if record is not None else {}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Show or export a Tello telemetry file")
+    ap.add_argument("path", help="telemetry file")
+    ap.add_argument("--csv", default=None, help="export every sample to this csv file")
+    args = ap.parse_args()
+
+    replay = TelemetryReplay(args.path)
+    print(f"{args.path}: {replay.count} samples")
+    if replay.count:
+        timestamps = replay.columns['timestamp']
+        print(f"duration: {timestamps[-1] - timestamps[0]:.1f}s")
+        for name in ('bat', 'h', 'tof', 'templ', 'temph'):
+            column = replay.columns[name]
+            print(f"{name:>6}: min {column.min()} max {column.max()}")
+
+    if args.csv:
+        with open(args.csv, "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(STATE_DTYPE.names)
+            for record in replay:
+                writer.writerow(record.as_tuple())
+
+
+if __name__ == '__main__':
+    main()
@@ -29,6 +29,10 @@ mission_pad_enabled = False
 
 # is the drone a Tello ( i.e. SDK 2.x ) or a Robomaster Tello ( i.e. SDK 3.x )
 is_rmtt_drone = None
+# if the sdk version query fails, wait this many seconds before asking again
+# instead of asking on every status poll
+sdk_version_retry_interval = 5
+last_sdk_version_query_time = 0
 
 # command history
 # keep a list of commands so we can make sure everything is being executed
@@ -196,6 +200,7 @@ def _execute_rc_command(request):
 
 def _refresh_tello_state():
     """
+    Fields of the DroneBlocksTello state record, the same as the state dict:
     {'mid': -2, 'x': -200, 'y': -200, 'z': -200, 'mpry': '0,0,0', 'pitch': 0,
     'roll': 0, 'yaw': 0, 'vgx': 0, 'vgy': 0, 'vgz': 0, 'templ': 66,
     'temph': 69, 'tof': 10, 'h': 0, 'bat': 12, 'baro': 256.7,
@@ -204,22 +209,25 @@ def _refresh_tello_state():
     :return:
     :rtype:
     """
-    global mission_pad_enabled, is_rmtt_drone, initial_brightness_set
+    global mission_pad_enabled, is_rmtt_drone, initial_brightness_set, last_sdk_version_query_time
     if tello_reference:
-        current_tello_state = tello_reference.get_current_state()
-        tello_state['battery_level'] = current_tello_state['bat']
-        tello_state['temp'] = int((current_tello_state['temph'] + current_tello_state['templ']) / 2)
-        tello_state['flight_time'] = current_tello_state['time']
-        tello_state['height'] = current_tello_state['h']
-        tello_state['current_x'] = current_tello_state['x'] if 'x' in current_tello_state else -1
-        tello_state['current_y'] = current_tello_state['y'] if 'y' in current_tello_state else -1
-        tello_state['current_z'] = current_tello_state['z'] if 'z' in current_tello_state else -1
-        tello_state['detected_mission_pad'] = current_tello_state['mid'] if 'mid' in current_tello_state else -2
+        current_tello_state = tello_reference.get_state_record()
+        if current_tello_state is None:
+            raise Exception("No Tello state received yet")
+        tello_state['battery_level'] = current_tello_state.bat
+        tello_state['temp'] = int(current_tello_state.temperature)
+        tello_state['flight_time'] = current_tello_state.time
+        tello_state['height'] = current_tello_state.h
+        tello_state['current_x'] = current_tello_state.x
+        tello_state['current_y'] = current_tello_state.y
+        tello_state['current_z'] = current_tello_state.z
+        tello_state['detected_mission_pad'] = current_tello_state.mid
         if tello_state['detected_mission_pad'] != -2:
             # thenç the mission pads must have been enabled outside the web api
             mission_pad_enabled = True
 
-        if is_rmtt_drone is None:
+        if is_rmtt_drone is None and time.time() - last_sdk_version_query_time > sdk_version_retry_interval:
+            last_sdk_version_query_time = time.time()
             try:
                 tt_version = int(tello_reference.query_sdk_version())
                 print(tt_version)
@@ -552,6 +560,10 @@ if __name__ == '__main__':
     ap.add_argument("--dry-run", action='store_true', help="Do not instantiate Tello reference")
     ap.add_argument("--web-port", required=False, default=8080, type=int,
                     help="Port to start web server on.  Default: 8080")
+    ap.add_argument("--tello-host", required=False, default=DroneBlocksTello.TELLO_IP, type=str,
+                    help=f"IP address of the Tello, or of a tello_simulator.  Default: {DroneBlocksTello.TELLO_IP}")
+    ap.add_argument("--tello-port", required=False, default=DroneBlocksTello.CONTROL_UDP_PORT, type=int,
+                    help=f"Command port of the Tello, or of a tello_simulator.  Default: {DroneBlocksTello.CONTROL_UDP_PORT}")
 
     args = vars(ap.parse_args())
 
@@ -561,7 +573,7 @@ if __name__ == '__main__':
         web_main(None, stop_event=None, port=port)
     else:
         try:
-            db_tello = DroneBlocksTello()
+            db_tello = DroneBlocksTello(host=args['tello_host'], port=args['tello_port'])
             db_tello.LOGGER.setLevel(logging.ERROR)
 
             db_tello.connect()
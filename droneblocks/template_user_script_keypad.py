@@ -39,7 +39,8 @@ def handler(tello, frame, fly_flag=False):
 
     :param tello: Reference to the DJITelloPy Tello object.
     :type tello: Tello
-    :param frame: image
+    :param frame: image.  The runner resizes into reused buffers, but never reuses a buffer the
+                  handler still refers to, so the frame can be kept, e.g. to compare it with the next one.
     :type frame:
     :param fly_flag: True - the fly flag was specified and the Tello will take off. False - the Tello will NOT
                         be instructed to take off
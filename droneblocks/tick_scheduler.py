@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+class TickScheduler:
+    """
+    Paces a loop at a fixed rate using time.monotonic() deadlines.
+
+    Every call to wait() sleeps until the next deadline, so the time the loop body
+    takes is subtracted from the sleep and the rate does not drift.  When the body
+    takes longer than a period the tick is counted as an overrun and the schedule
+    restarts from now, instead of running a burst of back to back ticks to catch up.
+    """
+
+    def __init__(self, rate_hz: float, stop_event: threading.Event = None):
+        """
+
+        :param rate_hz: ticks per second.  0 or None - wait() never sleeps.
+        :param stop_event: wait() returns early when this event is set
+        """
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz if rate_hz else 0.0
+        self.stop_event = stop_event
+        self._deadline = None
+
+        self.tick_count = 0
+        self.overrun_count = 0
+        self.skipped_tick_count = 0
+        self.max_lateness = 0.0
+        self.sleep_time = 0.0
+
+    def reset(self):
+        self._deadline = None
+
+    def wait(self) -> bool:
+        """
+        Sleep until the next tick.
+
+        :return: False if the stop event was set, True otherwise
+        """
+        self.tick_count += 1
+        if not self.period:
+            return not (self.stop_event is not None and self.stop_event.is_set())
+
+        now = time.monotonic()
+        if self._deadline is None:
+            # first tick starts the schedule
+            self._deadline = now + self.period
+            return not (self.stop_event is not None and self.stop_event.is_set())
+
+        remaining = self._deadline - now
+        if remaining > 0:
+            self.sleep_time += remaining
+            if self.stop_event is not None:
+                if self.stop_event.wait(remaining):
+                    return False
+            else:
+                time.sleep(remaining)
+            self._deadline += self.period
+        else:
+            lateness = -remaining
+            self.max_lateness = max(self.max_lateness, lateness)
+            if lateness > self.period:
+                # the loop body took more than a whole period
+                self.overrun_count += 1
+                self.skipped_tick_count += int(lateness / self.period)
+                self._deadline = now + self.period
+            else:
+                self._deadline += self.period
+
+        return not (self.stop_event is not None and self.stop_event.is_set())
+
+    def get_stats(self) -> dict:
+        return {
+            'rate_hz': self.rate_hz,
+            'ticks': self.tick_count,
+            'overruns': self.overrun_count,
+            'skipped_ticks': self.skipped_tick_count,
+            'max_lateness_ms': round(self.max_lateness * 1000, 2),
+            'sleep_time': round(self.sleep_time, 3)
+        }
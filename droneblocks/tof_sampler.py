@@ -0,0 +1,194 @@
+import collections
+import logging
+import statistics
+import threading
+import time
+
+LOGGER = logging.getLogger('djitellopy')
+
+TOF_COMMAND = 'EXT tof?'
+
+
+def parse_tof_response(response) -> int:
+    """
+    :param response: reply to 'EXT tof?', e.g. 'tof 345' ( millimeters )
+    :return: distance in cm, or None if response is not a ToF reading
+    """
+    if not isinstance(response, str) or not response.startswith('tof'):
+        return None
+    try:
+        # 10 mm = 1 cm
+        return int(int(response[3:].strip()) / 10)
+    except ValueError:
+        return None
+
+
+class TofSampler:
+    """
+    Polls the ToF sensor on top of the Robomaster TT controller from a background
+    thread and keeps the readings in a ring buffer of (timestamp, cm) tuples.
+
+    Handlers read the latest value without a round trip to the drone.  Replies
+    that are not a ToF reading ( e.g. the 'unknown command: keepalive' reply of the
+    RMTT ) and timeouts are counted instead of being stored as -1.
+
+    Every poll is a normal command, so it takes turns with the other commands sent to the
+    Tello.  Keep rate_hz low if the handler sends a lot of commands.  The Tello needs
+    Tello.TIME_BTW_COMMANDS between commands, which limits polling to about 10 per second
+    ( max_rate_hz ), even with no other commands.  A higher rate_hz is logged as a warning.
+    """
+
+    def __init__(self, tello, rate_hz: float = 10, buffer_size: int = 32, response_timeout: float = 1):
+        """
+
+        :param tello: DroneBlocksTello
+        :param rate_hz: polls per second, at most max_rate_hz are reached
+        :param buffer_size: number of readings to keep
+        :param response_timeout: seconds to wait for each reply
+        :raises ValueError: if rate_hz is not above 0
+        """
+        if not rate_hz > 0:
+            raise ValueError(f"rate_hz must be above 0 polls per second, got {rate_hz}")
+        self.tello = tello
+        self.rate_hz = rate_hz
+        # every command waits TIME_BTW_COMMANDS after the previous one
+        time_btw_commands = getattr(tello, 'TIME_BTW_COMMANDS', 0)
+        self.max_rate_hz = 1.0 / time_btw_commands if time_btw_commands else None
+        if self.max_rate_hz is not None and rate_hz > self.max_rate_hz:
+            LOGGER.warning(f"ToF sampler rate of {rate_hz} Hz can not be reached, commands are sent at most "
+                           f"{self.max_rate_hz:.0f} times per second")
+        self.response_timeout = response_timeout
+        self._readings = collections.deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.poll_count = 0
+        self.reading_count = 0
+        self.spurious_count = 0
+        self.timeout_count = 0
+        self.error_count = 0
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="TofSampler")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.response_timeout + 1)
+        self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def _run(self):
+        interval = 1.0 / self.rate_hz
+        next_poll = time.monotonic()
+        while not self._stop_event.is_set():
+            self.poll()
+
+            next_poll += interval
+            wait_time = next_poll - time.monotonic()
+            if wait_time > 0:
+                self._stop_event.wait(wait_time)
+            else:
+                # the round trip took longer than the interval, do not try to catch up
+                next_poll = time.monotonic()
+
+    def poll(self):
+        """
+        Send one 'EXT tof?' and store the reading.
+        """
+        self.poll_count += 1
+        try:
+            # not send_expansion_command: that one needs an 'ok' reply, and
+            # not get_controller_tof: the sampler should never see a cached value
+            response = self.tello.send_command_with_return(TOF_COMMAND, timeout=self.response_timeout)
+        except Exception as exc:
+            self.error_count += 1
+            LOGGER.error(f"ToF sampler error: {exc}")
+            return
+
+        cm_value = parse_tof_response(response)
+        if cm_value is not None:
+            with self._lock:
+                self._readings.append((time.monotonic(), cm_value))
+            self.reading_count += 1
+        elif isinstance(response, str) and response.startswith('Aborting command'):
+            self.timeout_count += 1
+        else:
+            # keepalive replies and anything else that is not 'tof N'
+            self.spurious_count += 1
+            LOGGER.debug(f"ToF sampler ignored reply: {response}")
+
+    def latest_tof(self, max_age: float = None) -> int:
+        """
+        :param max_age: seconds.  Readings older than this are not returned.
+        :return: latest distance in cm, or None if there is no ( recent enough ) reading
+        """
+        with self._lock:
+            if not self._readings:
+                return None
+            timestamp, cm_value = self._readings[-1]
+        if max_age is not None and time.monotonic() - timestamp > max_age:
+            return None
+        return cm_value
+
+    def median_tof(self, count: int = 5, max_age: float = None) -> int:
+        """
+        Median of the last count readings, which removes single outliers.
+
+        :param count: number of readings
+        :param max_age: seconds.  Only readings younger than this are used.
+        :return: distance in cm, or None if there are no readings
+        """
+        now = time.monotonic()
+        with self._lock:
+            readings = list(self._readings)[-count:]
+        values = [cm_value for timestamp, cm_value in readings if max_age is None or now - timestamp <= max_age]
+        if not values:
+            return None
+        return int(statistics.median(values))
+
+    def staleness(self) -> float:
+        """
+        :return: seconds since the latest reading, or None if there is no reading yet
+        """
+        with self._lock:
+            if not self._readings:
+                return None
+            timestamp = self._readings[-1][0]
+        return time.monotonic() - timestamp
+
+    def readings(self) -> list:
+        """
+        :return: list of (time.monotonic() timestamp, cm) tuples, oldest first
+        """
+        with self._lock:
+            return list(self._readings)
+
+    def get_stats(self) -> dict:
+        """
+        spurious_replies counts replies that reached the sampler but were not a reading.
+        keepalive_replies counts the 'unknown command: keepalive' replies the response
+        demultiplexer filtered out while an 'EXT tof?' was waiting, including those of get_controller_tof.
+        """
+        tof_metrics = self.tello.command_metrics.snapshot().get(TOF_COMMAND, {})
+        return {
+            'rate_hz': self.rate_hz,
+            'max_rate_hz': self.max_rate_hz,
+            'polls': self.poll_count,
+            'readings': self.reading_count,
+            'spurious_replies': self.spurious_count,
+            'keepalive_replies': tof_metrics.get('filtered_responses', 0),
+            'timeouts': self.timeout_count,
+            'errors': self.error_count,
+            'staleness': self.staleness()
+        }
@@ -0,0 +1,155 @@
+import numpy as np
+
+# The RMTT 8x8 matrix 'mled g' pattern is 64 characters, one per pixel, row by row.
+# Each pixel is stored as the ascii code of its character so converting to and
+# from the command string is a buffer copy, not a per character loop.
+OFF = '0'
+RED = 'r'
+BLUE = 'b'
+PURPLE = 'p'
+MATRIX_COLORS = (OFF, RED, BLUE, PURPLE)
+
+MATRIX_SIZE = 8
+
+_OFF_CODE = ord(OFF)
+_VALID_CODES = np.zeros(256, dtype=bool)
+_VALID_CODES[[ord(c) for c in MATRIX_COLORS]] = True
+
+
+class MatrixPattern:
+    """
+    8x8 RMTT matrix pattern stored as an 8x8 uint8 array.
+
+    All transforms are vectorized NumPy operations and return a new pattern,
+    so animation frames can be generated without Python loops over the pixels:
+
+        up = MatrixPattern(DroneBlocksTello.up_arrow_image)
+        frames = [up.shift(dy=-i, wrap=True) for i in range(8)]
+        tello.display_image(frames[3])
+    """
+    __slots__ = ('pixels',)
+
+    def __init__(self, pattern=None):
+        """
+
+        :param pattern: 64 character 'mled g' string, 8x8 array of pixel codes, another MatrixPattern
+                        or None for a blank pattern
+        """
+        if pattern is None:
+            self.pixels = np.full((MATRIX_SIZE, MATRIX_SIZE), _OFF_CODE, dtype=np.uint8)
+        elif isinstance(pattern, MatrixPattern):
+            self.pixels = pattern.pixels.copy()
+        elif isinstance(pattern, str):
+            if len(pattern) != MATRIX_SIZE * MATRIX_SIZE:
+                raise ValueError(f"Matrix pattern must be 64 characters, not {len(pattern)}")
+            self.pixels = np.frombuffer(pattern.encode('ascii'), dtype=np.uint8).reshape(MATRIX_SIZE,
+                                                                                       MATRIX_SIZE).copy()
+        else:
+            pixels = np.asarray(pattern, dtype=np.uint8)
+            if pixels.shape != (MATRIX_SIZE, MATRIX_SIZE):
+                raise ValueError(f"Matrix pattern must be 8x8, not {pixels.shape}")
+            self.pixels = pixels.copy()
+
+        if not _VALID_CODES[self.pixels].all():
+            raise ValueError(f"Matrix pattern may only contain the colors {MATRIX_COLORS}")
+
+    @classmethod
+    def _wrap(cls, pixels: np.ndarray) -> 'MatrixPattern':
+        # internal constructor for already validated pixels
+        pattern = cls.__new__(cls)
+        pattern.pixels = np.ascontiguousarray(pixels)
+        return pattern
+
+    @classmethod
+    def from_rows(cls, rows) -> 'MatrixPattern':
+        """
+        :param rows: 8 strings of 8 characters, top row first
+        """
+        return cls("".join(rows))
+
+    def to_string(self) -> str:
+        """
+        :return: the 64 character string used by the 'mled g' command
+        """
+        return self.pixels.tobytes().decode('ascii')
+
+    def __str__(self):
+        return self.to_string()
+
+    def __repr__(self):
+        return f"MatrixPattern('{self.to_string()}')"
+
+    def __eq__(self, other):
+        if isinstance(other, str):
+            return self.to_string() == other
+        if isinstance(other, MatrixPattern):
+            return np.array_equal(self.pixels, other.pixels)
+        return NotImplemented
+
+    def rotate(self, quarter_turns: int = 1) -> 'MatrixPattern':
+        """
+        Rotate counter clockwise by 90 degrees quarter_turns times.  Negative values rotate clockwise.
+        """
+        return MatrixPattern._wrap(np.rot90(self.pixels, quarter_turns))
+
+    def flip_horizontal(self) -> 'MatrixPattern':
+        """Mirror left to right"""
+        return MatrixPattern._wrap(np.fliplr(self.pixels))
+
+    def flip_vertical(self) -> 'MatrixPattern':
+        """Mirror top to bottom"""
+        return MatrixPattern._wrap(np.flipud(self.pixels))
+
+    def shift(self, dx: int = 0, dy: int = 0, wrap: bool = False) -> 'MatrixPattern':
+        """
+        Move the pattern dx pixels right and dy pixels down.
+
+        :param wrap: True - pixels that fall off one edge come back on the other.  False - the uncovered
+                     pixels are turned off.
+        """
+        pixels = np.roll(self.pixels, (dy, dx), axis=(0, 1))
+        if not wrap:
+            if dy > 0:
+                pixels[:dy, :] = _OFF_CODE
+            elif dy < 0:
+                pixels[dy:, :] = _OFF_CODE
+            if dx > 0:
+                pixels[:, :dx] = _OFF_CODE
+            elif dx < 0:
+                pixels[:, dx:] = _OFF_CODE
+        return MatrixPattern._wrap(pixels)
+
+    def invert(self, color: str = PURPLE) -> 'MatrixPattern':
+        """
+        Turn every lit pixel off and every off pixel to color.
+        """
+        on_code = np.uint8(ord(color))
+        return MatrixPattern(np.where(self.pixels == _OFF_CODE, on_code, np.uint8(_OFF_CODE)))
+
+    def remap(self, palette: dict) -> 'MatrixPattern':
+        """
+        Change colors, e.g. remap({'b': 'r', 'r': 'b'}) swaps blue and red.
+        """
+        lut = np.arange(256, dtype=np.uint8)
+        for from_color, to_color in palette.items():
+            lut[ord(from_color)] = ord(to_color)
+        return MatrixPattern(lut[self.pixels])
+
+    def recolor(self, color: str) -> 'MatrixPattern':
+        """
+        Set every lit pixel to color.
+        """
+        return MatrixPattern(np.where(self.pixels == _OFF_CODE, np.uint8(_OFF_CODE), np.uint8(ord(color))))
+
+    def overlay(self, other: 'MatrixPattern') -> 'MatrixPattern':
+        """
+        Draw the lit pixels of other on top of this pattern.
+        """
+        other_pixels = MatrixPattern(other).pixels if not isinstance(other, MatrixPattern) else other.pixels
+        return MatrixPattern._wrap(np.where(other_pixels == _OFF_CODE, self.pixels, other_pixels))
+
+    def lit_mask(self) -> np.ndarray:
+        """
+        :return: 8x8 bool array, True where the pixel is not off
+        """
+        return self.pixels != _OFF_CODE
@@ -0,0 +1,140 @@
+import logging
+import os
+import queue
+import threading
+import time
+import cv2
+from droneblocks.frame_pool import FramePool
+
+LOGGER = logging.getLogger()
+
+# frames waiting for the encoder before new frames are dropped
+DEFAULT_RECORD_QUEUE_SIZE = 30
+
+DEFAULT_RECORD_FPS = 30
+
+
+def fourcc_for_path(path: str) -> str:
+    """
+    :return: an OpenCV codec that works for the file extension, MJPG for .avi, mp4v otherwise
+    """
+    return 'MJPG' if os.path.splitext(path)[1].lower() == '.avi' else 'mp4v'
+
+
+class VideoRecorder:
+    """
+    Writes frames to a video file from a background encoder thread.
+
+    submit() copies the frame into a preallocated buffer and returns right away.
+    When the encoder falls behind and the queue is full, the frame is dropped
+    instead of blocking the caller.  The time every recorded frame was submitted
+    is written to <path>.timestamps.csv, because the video file itself only
+    knows a fixed frame rate.
+    """
+
+    def __init__(self, path: str, fps: float = DEFAULT_RECORD_FPS, fourcc: str = 'mp4v',
+                 queue_size: int = DEFAULT_RECORD_QUEUE_SIZE):
+        """
+
+        :param path: video file, e.g. flight.mp4
+        :param fps: frame rate stored in the video file
+        :param fourcc: OpenCV codec, e.g. 'mp4v' for .mp4 or 'MJPG' for .avi
+        :param queue_size: frames waiting for the encoder before new frames are dropped
+        """
+        self.path = path
+        self.timestamps_path = f"{path}.timestamps.csv"
+        self.fps = fps
+        self.fourcc = fourcc
+        self._queue = queue.Queue(maxsize=queue_size)
+        # one buffer for every queued frame, one for the encoder and one being filled
+        self._frame_pool = FramePool(queue_size + 2)
+        self._thread = None
+        self._writer = None
+        self._frame_size = None
+        # set when the encoder thread stopped because of an error
+        self.failed = False
+
+        self.submitted_count = 0
+        self.recorded_count = 0
+        self.dropped_count = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="VideoRecorder")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10):
+        """
+        Write the frames that are still queued and close the file.
+        """
+        if self._thread is None:
+            return
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                LOGGER.error(f"Video recorder for {self.path} did not take the stop request in {timeout} seconds")
+            self._thread.join(timeout)
+        self._thread = None
+        LOGGER.info(f"Recorded {self.recorded_count} frames to {self.path}, dropped {self.dropped_count}")
+
+    def submit(self, frame, timestamp: float = None) -> bool:
+        """
+        Queue a frame for the encoder.  Never blocks.
+
+        :param timestamp: time.time() the frame was captured, defaults to now
+        :return: False if the frame was dropped, also every frame after the encoder failed
+        """
+        self.submitted_count += 1
+        # only this thread puts frames, so the queue can not fill up between the check and the put
+        if frame is None or self.failed or self._queue.full():
+            self.dropped_count += 1
+            return False
+        self._queue.put_nowait((self._frame_pool.copy(frame), time.time() if timestamp is None else timestamp))
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'submitted': self.submitted_count,
+            'recorded': self.recorded_count,
+            'dropped': self.dropped_count,
+            'queued': self._queue.qsize(),
+            'failed': self.failed
+        }
+
+    def _open_writer(self, frame):
+        height, width = frame.shape[:2]
+        self._frame_size = (width, height)
+        self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                       self._frame_size, len(frame.shape) == 3)
+        if not self._writer.isOpened():
+            raise IOError(f"Could not open {self.path} for recording with codec {self.fourcc}")
+
+    def _run(self):
+        try:
+            with open(self.timestamps_path, "w") as timestamps_file:
+                timestamps_file.write("frame,timestamp\n")
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        break
+                    frame, timestamp = item
+
+                    if self._writer is None:
+                        self._open_writer(frame)
+                    if (frame.shape[1], frame.shape[0]) != self._frame_size:
+                        # a video file has one frame size
+                        frame = cv2.resize(frame, self._frame_size)
+
+                    self._writer.write(frame)
+                    timestamps_file.write(f"{self.recorded_count},{timestamp:.6f}\n")
+                    self.recorded_count += 1
+        except Exception as exc:
+            self.failed = True
+            LOGGER.error(f"Video recorder stopped: {exc}")
+        finally:
+            if self._writer is not None:
+                self._writer.release()
+                self._writer = None
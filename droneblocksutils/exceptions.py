@@ -5,4 +5,32 @@ class LandException(Exception):
     Custom exception to instruct the tello_script_runner that a user script
     would like to land.
     """
-    pass
\ No newline at end of file
+    pass
+
+class SwarmCommandError(Exception):
+    """
+    Raised by DroneBlocksSwarm when a command failed on one or more drones.
+    errors is a dict of drone host to the exception that drone raised and
+    results holds the results of the drones that succeeded.
+    """
+    def __init__(self, message, errors=None, results=None):
+        super().__init__(message)
+        self.errors = errors or {}
+        self.results = results or {}
+
+class MovePlanError(Exception):
+    """
+    Raised by DroneBlocksTello.execute_move_plan when the recorded moves can not
+    be sent within the Tello SDK limits.  Nothing was sent to the drone.
+    errors is a list of messages, one per invalid command.
+    """
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+class ExpansionCommandQueueStopped(Exception):
+    """
+    Raised by ExpansionCommandQueue.submit when the queue is not running, so the
+    command would never be sent.
+    """
+    pass
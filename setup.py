@@ -31,7 +31,9 @@ setup(
     entry_points={
         'console_scripts':[
             'telloscriptrunner=droneblocks.tello_script_runner:main',
-            'tt-matrix-generator=droneblocks.tt_matrix_generator:main'
+            'tt-matrix-generator=droneblocks.tt_matrix_generator:main',
+            'tello-simulator=droneblocks.tello_simulator:main',
+            'tello-handler-benchmark=droneblocks.handler_benchmark:main'
         ]
     }
 )
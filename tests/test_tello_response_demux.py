@@ -0,0 +1,86 @@
+import time
+from droneblocks.tello_response_demux import (ACK_REPLY, TOF_REPLY, VALUE_REPLY, TelloResponseDemux,
+                                              reply_matches)
+
+
+def test_unknown_command_answers_any_command():
+    for shape in (ACK_REPLY, VALUE_REPLY, TOF_REPLY):
+        assert reply_matches(shape, b'unknown command: mled')
+        assert reply_matches(shape, b'error')
+        assert reply_matches(shape, b'out of range')
+
+
+def test_reply_shapes():
+    assert reply_matches(ACK_REPLY, b'ok')
+    assert reply_matches(ACK_REPLY, b'led ok')
+    assert not reply_matches(ACK_REPLY, b'100.0')
+    assert not reply_matches(ACK_REPLY, b'pitch:0;roll:0;yaw:0;')
+    assert reply_matches(VALUE_REPLY, b'100.0')
+    assert not reply_matches(VALUE_REPLY, b'ok')
+    assert reply_matches(TOF_REPLY, b'tof 345')
+    assert not reply_matches(TOF_REPLY, b'ok')
+
+
+def test_unknown_command_reply_is_returned_to_the_waiting_command():
+    demux = TelloResponseDemux()
+    pending = demux.register('EXT mled g 000')
+    demux.append(b'unknown command: mled\r\n')
+    assert demux.wait(pending, timeout=0.1) == b'unknown command: mled'
+    assert demux.mismatched_count == 0
+
+
+def test_reply_that_arrived_before_the_command_is_discarded():
+    demux = TelloResponseDemux()
+    # nobody was waiting for this one, e.g. the late reply of a command that gave up
+    demux.append(b'100.0\r\n')
+    pending = demux.register('speed?')
+    demux.append(b'90.0\r\n')
+    assert demux.wait(pending, timeout=0.1) == b'90.0'
+    assert demux.stale_count == 1
+
+
+def test_late_reply_of_a_timed_out_command_does_not_answer_the_next_command():
+    demux = TelloResponseDemux()
+    timed_out = demux.register('speed?')
+    assert demux.wait(timed_out, timeout=0.01) is None
+
+    pending = demux.register('battery?')
+    demux.append(b'100.0\r\n')
+    demux.append(b'87\r\n')
+    assert demux.wait(pending, timeout=0.1) == b'87'
+    assert demux.stale_count == 1
+
+
+def test_retry_of_a_timed_out_command_takes_either_reply():
+    demux = TelloResponseDemux()
+    timed_out = demux.register('takeoff')
+    assert demux.wait(timed_out, timeout=0.01) is None
+
+    retry = demux.register('takeoff')
+    demux.append(b'ok\r\n')
+    assert demux.wait(retry, timeout=0.1) == b'ok'
+    assert demux.stale_count == 0
+
+
+def test_reply_that_can_not_be_the_late_reply_goes_to_the_next_command():
+    demux = TelloResponseDemux()
+    timed_out = demux.register('speed?')
+    assert demux.wait(timed_out, timeout=0.01) is None
+
+    # 'ok' does not answer 'speed?', so its late reply is taken as lost
+    pending = demux.register('land')
+    demux.append(b'ok\r\n')
+    assert demux.wait(pending, timeout=0.1) == b'ok'
+    assert demux.get_stats()['outstanding'] == 0
+
+
+def test_timed_out_command_leaves_the_line_after_the_grace_period():
+    demux = TelloResponseDemux(stale_reply_grace=0.01)
+    timed_out = demux.register('speed?')
+    assert demux.wait(timed_out, timeout=0.01) is None
+    time.sleep(0.05)
+
+    pending = demux.register('battery?')
+    demux.append(b'87\r\n')
+    assert demux.wait(pending, timeout=0.1) == b'87'
+    assert demux.stale_count == 0
@@ -0,0 +1,40 @@
+from droneblocks.tello_state import TelloStateDecoder
+from droneblocks.tello_state_receiver import TelloStateBuffer
+
+PACKET = (b'mid:-1;x:0;y:0;z:0;mpry:1,2,3;pitch:4;roll:-5;yaw:6;vgx:0;vgy:0;vgz:0;templ:60;temph:62;tof:10;'
+          b'h:30;bat:90;baro:100.25;time:7;agx:0.00;agy:1.50;agz:-1000.00;\r\n')
+
+
+def test_decode_state_packet():
+    record = TelloStateDecoder().decode(PACKET, timestamp=12.5)
+    assert (record.mid, record.pitch, record.roll, record.yaw) == (-1, 4, -5, 6)
+    assert (record.mp_pitch, record.mp_roll, record.mp_yaw) == (1, 2, 3)
+    assert (record.bat, record.h, record.tof, record.time) == (90, 30, 10, 7)
+    assert record.baro == 100.25 and record.agy == 1.5 and record.agz == -1000.0
+    assert record.temperature == 61
+    assert record.timestamp == 12.5
+
+
+def test_decode_rejects_non_state_packet():
+    assert TelloStateDecoder().decode(b'ok') is None
+
+
+def test_state_buffer_publishes_preallocated_records():
+    state_buffer = TelloStateBuffer(ring_size=2)
+    assert state_buffer.record is None
+
+    assert state_buffer.receive(PACKET, timestamp=1.0)
+    first = state_buffer.record
+    assert state_buffer.receive(PACKET.replace(b'bat:90', b'bat:89'), timestamp=2.0)
+    second = state_buffer.record
+    # a new packet never overwrites the record that was just handed out
+    assert second is not first and (first.bat, first.timestamp) == (90, 1.0)
+    assert (second.bat, second.timestamp) == (89, 2.0)
+
+    # the ring wraps around to the first record
+    assert state_buffer.receive(PACKET, timestamp=3.0)
+    assert state_buffer.record is first
+
+    assert not state_buffer.receive(b'ok')
+    assert state_buffer.record is first
+    assert state_buffer.get_stats() == {'packets': 3, 'bad_packets': 1}
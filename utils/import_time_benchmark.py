@@ -0,0 +1,82 @@
+"""
+Cold start budget of telloscriptrunner.
+
+Imports droneblocks.tello_script_runner and runs telloscriptrunner --test-install in fresh
+interpreters, and fails when the median time is over the budget or when a heavy module
+( cv2, numpy, imutils, djitellopy, bottle ) is imported before a run needs it.
+
+    python utils/import_time_benchmark.py
+    python utils/import_time_benchmark.py --runs 10 --budget-ms 50
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# modules tello_script_runner only imports once the selected mode needs them
+HEAVY_MODULES = ['cv2', 'numpy', 'imutils', 'djitellopy', 'bottle']
+
+DEFAULT_BUDGET_MS = 100
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+started = time.perf_counter()
+import droneblocks.tello_script_runner
+elapsed = time.perf_counter() - started
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+TEST_INSTALL_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+sys.argv = ['telloscriptrunner', '--test-install']
+from droneblocks import tello_script_runner
+try:
+    tello_script_runner.main()
+except SystemExit:
+    pass
+print(json.dumps({'ms': (time.perf_counter() - started) * 1000}))
+"""
+
+
+def _run(script):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    # the last line is the measurement, --test-install prints before it
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check the cold start time of telloscriptrunner")
+    ap.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement.  Default: 5")
+    ap.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                    help=f"Maximum median milliseconds.  Default: {DEFAULT_BUDGET_MS}")
+    args = ap.parse_args()
+
+    failed = False
+    import_runs = [_run(IMPORT_SCRIPT) for _ in range(args.runs)]
+    heavy = sorted({module for run in import_runs for module in run['heavy']})
+    if heavy:
+        print(f"FAIL importing tello_script_runner imported {', '.join(heavy)}")
+        failed = True
+
+    for name, runs in (('import tello_script_runner', import_runs),
+                       ('telloscriptrunner --test-install', [_run(TEST_INSTALL_SCRIPT) for _ in range(args.runs)])):
+        times = [run['ms'] for run in runs]
+        median = statistics.median(times)
+        status = "ok  " if median <= args.budget_ms else "FAIL"
+        print(f"{status} {name}: median {median:.1f}ms min {min(times):.1f}ms max {max(times):.1f}ms "
+              f"budget {args.budget_ms:.0f}ms")
+        failed = failed or median > args.budget_ms
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()